@@ -1,19 +1,35 @@
-from ftx_rest import FtxRestClient
-from ftx_ws import FtxWebsocketClient
-
+from queue_position import QueuePositionEstimator
+from models import Instrument, Order, Position, Settings, StrategyParams
+from snapshot import StateStore, reconcile, correct_position
+from reconciler import Reconciler, OrderAdopted, OrderClosed, PositionCorrected
+from startup import PhaseTimer, load_market_info
+from conflation import Conflator, DIRTY_ORDERBOOK
+from profiler import Profiler
+from dashboard import Dashboard
+from venue import BookEvent, FtxVenue
+from execution import ExecutionEngine
+from watchdog import FeedWatchdog
+
+from concurrent.futures import ThreadPoolExecutor
+from threading import Thread
 from collections import defaultdict
-from statistics import fmean
 from datetime import datetime
 from pathlib import Path
-from time import sleep
-import numpy as np
-import subprocess
-import keyboard
+from typing import TYPE_CHECKING, List, NamedTuple, Tuple, Union, get_args, get_origin
+import argparse
 import logging
 import json
+import time
 import sys
 import os
 
+# Exchange clients pull in requests, gevent, websocket and numpy, and the metrics endpoint http.server. They are
+# imported when run() starts, so tools importing this module for its settings and helpers start quickly.
+if TYPE_CHECKING:
+    from ftx_ws import FtxWebsocketClient
+    from risk import RiskAction
+    from sessions import SubaccountSession
+
 
 SUBACCOUNT = "SpotPerpAlgo"                 # Subaccount name
 MARKET = ("GST/USD", "GST-PERP", 0.1)     # (spot ticker, perp ticker, min size increment) Spot must be first and perp second
@@ -26,608 +42,876 @@ BASIS_FLOOR = 0.005                         # If basis reaches or goes lower tha
 BAD_ENTRY_CUTOFF = 2                        # % distance past profitable at which an attempted entry is considered failed.
 APR_EXIT_THRESHOLD = 50                     # Exit a position if funding exceeds this value in the wrong direction
 
+MAX_CHILD_ORDERS = 3                        # Child limit orders worked at once per leg
+CHILD_DEPTH_FRACTION = 0.5                  # A child order is sized to this fraction of the visible size at its price
+
 QUOTE_INDEX = 1                             # Bid/ask index used for limit order pricing. 0 means 1st level, 1 means 2nd level and so on.
-MOVE_ORDER_THRESHOLD = 2                    # Move a limit order to follow price if it moves this many OB levels away from last price
+MOVE_ORDER_THRESHOLD = 2                    # Consider moving a limit order to follow price once the quote price is this many price ticks away from it
+REPRICE_MIN_GAIN_S = 20                     # Only move a limit order if it is expected to fill at least this many seconds sooner at the new price
+
+ORDERBOOK_DEPTH = 20                        # Orderbook levels kept per side in fixed size arrays, the checksum depth is kept internally. None keeps every level
+WS_CONNECTIONS = 1                          # Independent websocket connections to feed data from. Above 1, each update is taken from whichever connection delivers it first
+
+MARKET_CACHE_PATH = "cache/markets.json"    # Market metadata cache, refreshed from REST when older than MARKET_CACHE_MAX_AGE_S
+MARKET_CACHE_MAX_AGE_S = 3600
+WS_READY_TIMEOUT_S = 10                     # Seconds to wait at startup for the first orderbook and ticker of both markets
+
+LOG_PATH = "logs"                           # Directory for one log file per run
+STATE_PATH = "state"                        # Directory for crash-safe strategy snapshots and the order event journal
+LEDGER_PATH = "state/ledger.db"             # Local ledger of fills and funding payments, synced when a trade completes. See ledger.py
+RECONCILE_INTERVAL_S = 5                    # Positions, open orders and recent fills are checked against REST this often in the background
+
+FEED_STALE_S = (3.0, 2.0)                   # Seconds without a spot, perp book update after which that market's orders are cancelled and trading frozen
+FEED_RESUME_AFTER_S = 2                     # A frozen market resumes once its book has updated within FEED_STALE_S for this long
+FEED_CHECK_INTERVAL_S = 0.05                # Book update times are checked this often, on a thread of their own
+
+PROFILE_PATH = "profiles"                   # Flame graph stacks and section timings. Profile a live process with SIGUSR1 or by creating PROFILE_PATH/trigger
+PROFILE_SAMPLE_INTERVAL_S = 0.005           # Stack sampling interval while profiling
+PROFILE_DEFAULT_S = 60                      # Profiling duration for --profile without a value, SIGUSR1 and the trigger file
+
+MIN_EVALUATION_INTERVAL_S = 0.25            # Strategy evaluates at most this often, feed updates in between are conflated into the next evaluation
+MAX_EVALUATION_INTERVAL_S = 4               # Strategy evaluates at least this often even if no updates arrive
+
+METRICS_PORT = 9108                         # Local HTTP port serving /metrics in the Prometheus text format. None disables the endpoint
+METRICS_RATE_WINDOW_S = 10                  # Window over which message rates are reported
+
+DASHBOARD_FPS = 4                           # Dashboard redraws per second, drawn from its own thread
+MANUAL_EXIT_KEY = 'ctrl+enter'              # Key that starts unwinding positions. None disables it
 
 DEBUG_OUTPUT = True                         # If True program actions print to console
 
+STRATEGY_PARAMS = StrategyParams(DEFAULT_BASIS_THRESHOLD, MARGIN_FOR_ENTRY, BAD_ENTRY_CUTOFF, APR_EXIT_THRESHOLD,
+                                 QUOTE_INDEX, MOVE_ORDER_THRESHOLD, ORDERS_PER_SIDE)   # Tuning constants read by run(), see sweep.py
+
+SETTINGS = Settings(SUBACCOUNT, MARKET, ACCOUNT_SIZE, MAX_CHILD_ORDERS, CHILD_DEPTH_FRACTION, REPRICE_MIN_GAIN_S,
+                    ORDERBOOK_DEPTH, WS_CONNECTIONS, WS_READY_TIMEOUT_S, MARKET_CACHE_PATH, MARKET_CACHE_MAX_AGE_S,
+                    LOG_PATH, STATE_PATH, LEDGER_PATH, RECONCILE_INTERVAL_S, FEED_STALE_S, FEED_RESUME_AFTER_S,
+                    FEED_CHECK_INTERVAL_S, PROFILE_PATH, PROFILE_SAMPLE_INTERVAL_S, PROFILE_DEFAULT_S,
+                    MIN_EVALUATION_INTERVAL_S, MAX_EVALUATION_INTERVAL_S, METRICS_PORT, METRICS_RATE_WINDOW_S,
+                    DASHBOARD_FPS, MANUAL_EXIT_KEY, DEBUG_OUTPUT)   # Operational settings read by run(), overridden by --config and --set
+
+
+# Return a websocket client fed by settings.ws_connections connections
+def create_ws_client(settings: Settings, api_key: str, api_secret: str) -> 'FtxWebsocketClient':
+    from ftx_ws import FtxWebsocketClient
+    from ftx_ws_redundant import RedundantFtxWebsocketClient
+    if settings.ws_connections > 1:
+        return RedundantFtxWebsocketClient(api_key, api_secret, settings.subaccount, settings.ws_connections, settings.orderbook_depth)
+    return FtxWebsocketClient(api_key, api_secret, settings.subaccount, settings.orderbook_depth)
+
+
+# Log to a new file under log_path. Strategies sharing a process share the file, it is only added once.
+def setup_logging(log_path: str) -> None:
+    logger = logging.getLogger()
+    logger.setLevel(logging.INFO)
+    if any(isinstance(h, logging.FileHandler) for h in logger.handlers):
+        return
+    Path(log_path).mkdir(parents=True, exist_ok=True)
+    file_handler = logging.FileHandler(log_path + "/" + str(int(datetime.now().timestamp())) + ".log")
+    file_handler.setLevel(logging.DEBUG)
+    file_handler.setFormatter(logging.Formatter('%(asctime)s | %(message)s'))
+    logger.addHandler(file_handler)
+
 
 # Return total size of all positions
 def get_total_open_size(positions: dict) -> float:
     size = 0
     if positions:
         for p in positions.values():
-            size += p['size'] * p['avgEntryPrice']
+            size += p.size * p.avg_entry_price
     return size
 
 
-# Return ticker and direction needing a size increase to zero out net exposure
-def has_exposure(positions: dict) -> [str, str, str]:
-    p_list = list(positions.values())
-    p_count = len(p_list)
-    if p_list:
-        if p_count % 2 == 0:
-            must_hedge = [None, None, None]
-            if p_list[0]['fillCount'] > p_list[1]['fillCount'] or p_list[0]['fillCount'] < p_list[1]['fillCount']:
-                must_hedge[0] = p_list[1]['ticker'] if p_list[0]['fillCount'] > p_list[1]['fillCount'] else p_list[0]['ticker']
-                must_hedge[1] = p_list[1]['side'] if p_list[0]['fillCount'] > p_list[1]['fillCount'] else p_list[0]['side']
-                must_hedge[2] = "perp" if p_list[0]['fillCount'] > p_list[1]['fillCount'] else "spot"
-            else:
-                must_hedge = None
-        elif p_count == 1:
-            must_hedge = [None, None, None]
-            must_hedge[0] = MARKET[1] if p_list[0]['ticker'] == MARKET[0] else MARKET[0]
-            must_hedge[1] = 'buy' if p_list[0]['side'] == 'sell' else 'sell'
-            must_hedge[2] = 'spot' if p_list[0]['type'] == 'perp' else 'perp'
-        elif p_count == 0:
-            must_hedge = None
-    else:
-        must_hedge = None
-    return must_hedge
+# Return ids of order updates newer than the last actioned update for the same order
+def pending_order_updates(order_updates: dict, last_update_time: dict) -> list:
+    return [oId for oId, update in order_updates.items() if update.msg_time > last_update_time[oId]]
 
 
-# Return total fills of all positions
-def get_total_fills(positions: dict) -> float:
-    fills = 0
-    if positions:
-        for p in positions.values():
-            fills += p['fillCount']
-    return fills
+# Return percentage basis between the two books and whether the perpetual is above spot
+def compute_basis(spot_bid: float, spot_ask: float, perp_bid: float, perp_ask: float,
+                  last_price_spot: float, last_price_perp: float) -> [float, bool]:
+    if last_price_perp > last_price_spot:
+        return round(((perp_ask - spot_bid) / ((perp_ask + spot_bid) / 2)) * 100, 5), True
+    return round(((spot_ask - perp_bid) / ((spot_ask + perp_bid) / 2)) * 100, 5), False
+
 
+# Return equal and opposite targets in steps for a full position on both legs, on the sides of any position or order held
+class StateView(NamedTuple):
+    positions: Tuple[Position, ...]         # Copies, never mutated once published
+    orders: Tuple[Order, ...]
+    closed_pnl: float
 
-def run():
+
+# Return copies of positions and orders for threads that read strategy state while the strategy loop changes it
+def state_view(positions: dict, orders: dict, closed_pnl: float) -> StateView:
+    return StateView(tuple(Position.from_dict(p.to_dict()) for p in positions.values()),
+                     tuple(Order.from_dict(o.to_dict()) for o in orders.values()), closed_pnl)
+
+
+def entry_targets(settings: Settings, positions: dict, orders: dict, perp_above_spot: bool, last_price_spot: float) -> dict:
+    steps = round(settings.account_size / 2 / last_price_spot / settings.market[2])
+    spot_direction = 1 if perp_above_spot else -1
+    held = [(p.ticker, p.direction) for p in positions.values()] + [(o.market, 1 if o.side == 'buy' else -1) for o in orders.values()]
+    for market, direction in held:
+        if market in settings.market[:2]:
+            spot_direction = direction if market == settings.market[0] else -direction
+            break
+    return {settings.market[0]: steps * spot_direction, settings.market[1]: -steps * spot_direction}
+
+
+# With session set, market data, orders and REST calls go through a SessionManager shared with other subaccounts,
+# and the dashboard prints plain lines labelled with the subaccount instead of drawing. See run_subaccounts().
+# With dry_run set, run() returns once every startup check has passed, before any order is placed.
+def run(profile_s: float = None, params: StrategyParams = STRATEGY_PARAMS, session: 'SubaccountSession' = None,
+        settings: Settings = SETTINGS, dry_run: bool = False):
+    from ftx_rest import FtxRestClient
+    from ftx_scheduler import FtxRequestScheduler
+    from metrics import MetricsServer, RateTracker, Sample
+    from risk import RiskEngine
 
     # -----------------------------------------------------------------
     # 1. Validate inputs and verify connection
     # -----------------------------------------------------------------
 
     # Set up logging
-    log_path = "logs"
-    Path(log_path).mkdir(parents=True, exist_ok=True)
+    setup_logging(settings.log_path)
     logger = logging.getLogger()
-    logger.setLevel(logging.INFO)
-    formatter = logging.Formatter('%(asctime)s | %(message)s')
-    file_handler = logging.FileHandler(log_path + "/" + str(int(datetime.now().timestamp())) + ".log")
-    file_handler.setLevel(logging.DEBUG)
-    file_handler.setFormatter(formatter)
-    logger.addHandler(file_handler)
 
     # Load keys
-    api_key = os.environ['BASIS_API_KEY_FTX']
-    api_secret = os.environ['BASIS_API_SECRET_FTX']
+    api_key = os.environ.get('BASIS_API_KEY_FTX')
+    api_secret = os.environ.get('BASIS_API_SECRET_FTX')
     if api_key is None or api_secret is None:
         err_msg = 'API keys not found.'
         logger.info(err_msg)
         raise ValueError(err_msg)
 
     # Init connection clients
-    ws = FtxWebsocketClient(api_key, api_secret, SUBACCOUNT)
-    rest = FtxRestClient(api_key, api_secret, SUBACCOUNT)
+    if session:
+        subaccount, ws, rest = session.subaccount, session.ws, session.rest
+    else:
+        subaccount = settings.subaccount
+        ws = create_ws_client(settings, api_key, api_secret)
+        rest = FtxRequestScheduler(FtxRestClient(api_key, api_secret, settings.subaccount))
     if not ws or not rest:
         err_msg = 'Websocket or REST client failed to init.'
         logger.info(err_msg)
         raise ModuleNotFoundError(err_msg)
+    venue = FtxVenue(ws, rest)
+
+    # REST validation, snapshot loading and rate downloads run concurrently with websocket connection and warm-up
+    timer = PhaseTimer()
+    store = StateStore(settings.state_path, subaccount)
+
+    def timed(name: str, f):
+        def timed_f():
+            with timer.phase(name):
+                return f()
+        return timed_f
+
+    # These one-off calls go to the raw client, the scheduler's info lane would run them two at a time
+    client = rest.client
+    with ThreadPoolExecutor(max_workers=5) as startup_pool:
+        markets_task = startup_pool.submit(timed('markets', lambda: load_market_info(client.get_markets, settings.market_cache_path, settings.market_cache_max_age_s)))
+        account_task = startup_pool.submit(timed('account', lambda: (client.get_positions(), client.get_open_orders())))
+        borrow_task = startup_pool.submit(timed('borrow', client.get_borrow_rates))
+        funding_task = startup_pool.submit(timed('funding', lambda: client.get_funding_rates(settings.market[1])))
+        state_task = startup_pool.submit(timed('snapshot', store.load))
+
+        # Verify websocket is subscribed and receiving data
+        with timer.phase('websocket'):
+            ws_data_ready = venue.wait_until_ready([settings.market[0], settings.market[1]], settings.ws_ready_timeout_s)
 
     # Validate instrument symbols
-    valid_tickers = [m['name'] for m in rest.get_markets()]
-    if MARKET[0] not in valid_tickers or MARKET[1] not in valid_tickers:
+    market_info = markets_task.result()
+    if settings.market[0] not in market_info or settings.market[1] not in market_info:
         err_msg = 'Target market ticker invalid. Check ticker codes and restart program.'
         logger.info(err_msg)
         raise ValueError(err_msg)
 
-    # Validate account starting state
-    positions, orders = rest.get_positions(), rest.get_open_orders()
-    if positions or orders:
-        print(json.dumps(positions, indent=2))
-        print(json.dumps(orders, indent=2))
+    # Prices and sizes are integer ticks and lots of each market's increments from here on. Both legs are sized
+    # in whole steps of settings.market[2], so it has to be a multiple of both size increments.
+    instruments = {m: Instrument.from_market(market_info[m]) for m in settings.market[:2]}
+    step_lots = {m: instruments[m].lots(settings.market[2]) for m in settings.market[:2]}
+    if any(not step_lots[m] or instruments[m].size(step_lots[m]) != settings.market[2] for m in settings.market[:2]):
+        err_msg = f"Size increment {settings.market[2]} is not a multiple of {instruments[settings.market[0]]} and {instruments[settings.market[1]]}."
+        logger.info(err_msg)
+        raise ValueError(err_msg)
+    venue.set_instruments(instruments)
+    execution = ExecutionEngine(venue, settings.market[:2], step_lots, settings.max_child_orders, settings.child_depth_fraction)
+
+    # Validate account starting state. Existing positions and orders are only accepted when resuming from a saved snapshot.
+    saved_state = state_task.result()
+    rest_positions, rest_orders = account_task.result()
+    if saved_state is None and (rest_positions or rest_orders):
+        print(json.dumps(rest_positions, indent=2))
+        print(json.dumps(rest_orders, indent=2))
         err_msg = "Existing positions or orders detected. Close all positions, orders and margin borrows, then restart program." \
                     " Ensure margin collateral is denominated in an asset you will not be trading e.g hold Tether if trading BTC spot and BTC perpetual, dont hold BTC or USD."
         logger.info(err_msg)
         raise Exception(err_msg)
+    positions, orders = {}, {}
 
-    # Verify websocket is subscribed and receiving data
-    ws_data_ready, wait_time = False, 0
-    while(not ws_data_ready):
-        order_updates = ws.get_orders()
-        ob_spot, ob_perp = ws.get_orderbook(MARKET[0]), ws.get_orderbook(MARKET[1])
-        last_price_spot, last_price_perp = ws.get_ticker(MARKET[0]), ws.get_ticker(MARKET[1])
-        if ob_spot and ob_perp and last_price_spot and last_price_perp:
-            ws_data_ready = True
-        else:
-            sleep(1)
-            wait_time += 1
-        if wait_time > 10:
-            err_msg = "Unable to subscribe to exchange websocket channels."
-            logger.info(err_msg)
-            raise Exception(err_msg)
+    if not ws_data_ready:
+        err_msg = "Unable to subscribe to exchange websocket channels."
+        logger.info(err_msg)
+        raise Exception(err_msg)
 
     try:
-        borrow = round(float([b['estimate'] for b in rest.get_borrow_rates() if b['coin'] == MARKET[0].split('/')[0]][0] * 100), 4)
+        borrow = round(float([b['estimate'] for b in borrow_task.result() if b['coin'] == settings.market[0].split('/')[0]][0] * 100), 4)
     except IndexError:
         borrow = 0
 
-    funding = round(float(rest.get_funding_rates(MARKET[1])[0]['rate']) * 100, 4)
+    funding = round(float(funding_task.result()[0]['rate']) * 100, 4)
+
+    for line in timer.summary():
+        logger.info("Startup " + line)
+        if settings.debug_output:
+            print("Startup " + line)
+
+    # Everything a live start depends on has been checked, report what would be traded and stop
+    if dry_run:
+        last_price_spot = venue.ticker(settings.market[0]).last
+        targets = entry_targets(settings, {}, {}, True, last_price_spot)
+        lines = [f"{m}: {instruments[m]}, full position {instruments[m].size(abs(targets[m]) * step_lots[m])}" for m in settings.market[:2]]
+        lines += [f"Spot margin borrow APR: {round(borrow * 8760, 5)}", f"Perpetual funding APR: {round(funding * 8760, 5)}",
+                  f"Snapshot: {'resuming from ' + str(datetime.fromtimestamp(saved_state['saved_at'])) if saved_state else 'none, starting flat'}",
+                  "Dry run passed, no orders placed."]
+        for line in lines:
+            logger.info("Dry run " + line)
+            print(line)
+        return
+
+    # Rates, positions and orders for the dashboard, sampled on its own thread from the published view
+    def render_dashboard() -> list:
+        open_positions, open_orders, closed_pnl = view
+        lines = [
+            f"-----------------  {settings.market[0]}  :  {settings.market[1]}  -----------------",
+            f"Spot margin borrow APR:                    {round(borrow * 8760, 5)}",
+            f"Perpetual funding APR:                     {round(funding * 8760, 5)}",
+            f"Spot/perp basis %:                         {round(basis, 5) if basis is not None else '-'}",
+            "Perpetual is above Spot" if perp_above_spot else "Spot is above Perpetual",
+            "",
+            f"Active positions: {len(open_positions)}    Total PnL: {round(closed_pnl + sum(p.total_pnl for p in open_positions), 4)}",
+            "Ticker ---- Direction ---- Avg. entry ---- Size ----  Fill count ---- Unrealized ---- Realized ---- Funding ----",
+        ]
+        for p in open_positions:
+            lines.append(f"{p.ticker}     {p.side}             {round(p.avg_entry_price, 6)}       {p.size}     {p.fill_count}     {round(p.unrealized_pnl, 4)}     {round(p.realized_pnl, 4)}     {round(p.funding_pnl, 4)}")
+        lines += ["", f"Open orders:  {len(open_orders)}", "Ticker ---- Direction ----- Price ---- Size ---- Status ----"]
+        for o in open_orders:
+            lines.append(f"{o.market}     {o.side}           {o.price}     {o.size}    {o.status}")
+        return lines
+
+    dashboard = Dashboard(render_dashboard, settings.dashboard_fps, settings.manual_exit_key,
+                          interactive=False if session else None, label=subaccount if session else None)
+
+    queue = QueuePositionEstimator()
+
+    # Stops and exposure limits are checked on every book update, actions go straight to the protective REST lanes
+    def execute_risk_action(action: 'RiskAction') -> None:
+        if action.kind == 'cancel':
+            venue.cancel_order(action.order_id)
+        elif action.kind == 'flatten':
+            if settings.debug_output:
+                dashboard.event("cutoff reached. closing exposed portion of trade and cancelling open orders")
+            venue.place_order(action.market, action.side, None, instruments[action.market].lots(action.size), 'market', lane='hedge')
+
+    # Unhedged notional above which orders adding to the imbalance are cancelled, execution keeps within half of it
+    max_net_notional = settings.account_size / params.orders_per_side
+    max_leg_lead = max_net_notional / 2
+    underlying = settings.market[0].split('/')[0]
+    risk = RiskEngine({settings.market[0]: underlying, settings.market[1]: underlying}, params.bad_entry_cutoff, max_net_notional, settings.market[2], execute_risk_action)
+    venue.add_book_listener(risk.on_orderbook)
+
+    # Mark positions on every book update so PnL is current per tick
+    def mark_positions(book: BookEvent) -> None:
+        position = positions.get(book.market)
+        mid = book.mid_price()
+        if position and mid is not None:
+            position.mark(mid)
+
+    venue.add_book_listener(mark_positions)
+
+    # Stalled books cancel their market's orders from the watchdog thread and freeze trading in it until they resync
+    watchdog = FeedWatchdog(venue, {settings.market[0]: settings.feed_stale_s[0], settings.market[1]: settings.feed_stale_s[1]}, settings.feed_resume_after_s, settings.feed_check_interval_s)
+    venue.add_book_listener(watchdog.on_orderbook)
+
+    # Wake the strategy once per batch of book, ticker and order updates instead of on a fixed sleep
+    conflator = Conflator(settings.min_evaluation_interval_s, {settings.market[0]: 1, settings.market[1]: 1})
+    venue.add_book_listener(conflator.on_orderbook)
+    venue.add_ticker_listener(conflator.on_ticker)
+    venue.add_order_listener(conflator.on_order)
+    changed_books = list(settings.market[:2])   # Markets whose book changed since the last iteration, by priority
 
     last_update_time = defaultdict(int)
-    should_run, should_update = True, False
-    basis, start_basis = None, None
-    fill_count, waiting_for_fill = 0, False
+    should_run = True
+    basis, start_basis, perp_above_spot = None, None, False
+    fill_count = 0
+    closed_pnl, funding_hour = 0.0, int(datetime.now().timestamp()) // 3600
+    rates_updated_at = datetime.now().timestamp()
     at_max_size = False
-    exposure = False
+    exposure = (0.0, 0.0)
     should_add_to_positions, should_unwind_positions = False, False
-    should_increase_spot, should_increase_perp = False, False
-    should_reduce_spot, should_reduce_perp = False, False
+    entry_status = None
+
+    # Resume from the last snapshot, reconciled against exchange state
+    if saved_state:
+        spot_balance = sum(b['total'] for b in rest.get_balances() if b['coin'] == underlying)
+        prices = {settings.market[0]: venue.ticker(settings.market[0]).last, settings.market[1]: venue.ticker(settings.market[1]).last}
+        positions, orders, differences = reconcile(saved_state, settings.market[:2], settings.market[2], rest_positions, rest_orders, spot_balance, prices)
+        for difference in differences:
+            logger.info("Reconcile: " + difference)
+        for oId in orders:
+            queue.track(orders[oId], venue.book(orders[oId].market))
+        start_basis, fill_count = saved_state['start_basis'], saved_state['fill_count']
+        last_update_time.update(saved_state['last_update_time'])
+        if positions or orders:
+            execution.set_targets(entry_targets(settings, positions, orders, perp_above_spot, venue.ticker(settings.market[0]).last))
+        msg = f"Resumed from snapshot saved at {datetime.fromtimestamp(saved_state['saved_at'])}: {len(positions)} positions, {len(orders)} orders"
+        logger.info(msg)
+        print(msg)
+        store.save(positions, orders, start_basis, fill_count, last_update_time)
+
+    reconciler = Reconciler(rest, settings.market[:2], settings.market[2], settings.reconcile_interval_s)
+    reconciler.update_local(positions, orders)
+    view = state_view(positions, orders, closed_pnl)
+
+    # Feed health, loop timing, REST latency, orders and positions for supervision. Collected only when scraped.
+    loop_stats = {'iterations': 0, 'last_s': 0.0, 'max_s': 0.0}
+    message_rates = RateTracker(settings.metrics_rate_window_s)
+
+    def collect_metrics() -> list:
+        now = time.time()
+        feed = ws.get_feed_stats()
+        samples = []
+        for (channel, market), count in feed['messages'].items():
+            samples.append(Sample('arb_ws_messages_total', count, (('channel', channel), ('market', market or ''))))
+        for (channel, market), rate in message_rates.rates(feed['messages']).items():
+            samples.append(Sample('arb_ws_messages_per_second', rate, (('channel', channel), ('market', market or ''))))
+        for market in settings.market[:2]:
+            labels = (('market', market),)
+            samples.append(Sample('arb_orderbook_age_seconds', now - ws.get_orderbook_timestamp(market), labels))
+            samples.append(Sample('arb_orderbook_stale', ws.is_orderbook_stale(market), labels))
+            samples.append(Sample('arb_orderbook_checksum_failures_total', feed['checksum_failures'].get(market, 0), labels))
+        reconnects = ws.get_reconnect_stats()
+        samples.append(Sample('arb_ws_reconnects_total', reconnects['reconnects']))
+        samples.append(Sample('arb_ws_disconnected_seconds', reconnects['disconnected_for_s']))
+
+        samples.append(Sample('arb_loop_iterations_total', loop_stats['iterations']))
+        samples.append(Sample('arb_loop_iteration_seconds', loop_stats['last_s']))
+        samples.append(Sample('arb_loop_iteration_seconds_max', loop_stats['max_s']))
+        loop_stats['max_s'] = 0.0
+
+        rest_metrics = rest.metrics()
+        for method, endpoint in rest_metrics['endpoints'].items():
+            labels = (('method', method),)
+            samples.append(Sample('arb_rest_requests_total', endpoint['requests'], labels))
+            samples.append(Sample('arb_rest_latency_seconds_avg', endpoint['avg_latency_s'], labels))
+            samples.append(Sample('arb_rest_latency_seconds_max', endpoint['max_latency_s'], labels))
+            samples.append(Sample('arb_rest_latency_seconds_last', endpoint['last_latency_s'], labels))
+        for lane, stats in rest_metrics['lanes'].items():
+            labels = (('lane', lane),)
+            samples.append(Sample('arb_rest_queue_depth', stats['depth'], labels))
+            samples.append(Sample('arb_rest_failed_total', stats['failed'], labels))
+
+        samples.append(Sample('arb_reconcile_passes_total', reconciler.stats['passes']))
+        samples.append(Sample('arb_reconcile_failures_total', reconciler.stats['failures']))
+        samples.append(Sample('arb_reconcile_corrections_total', reconciler.stats['corrections']))
+        samples.append(Sample('arb_reconcile_seconds', reconciler.stats['last_s']))
+        frozen = watchdog.frozen()
+        for market in settings.market[:2]:
+            labels = (('market', market),)
+            samples.append(Sample('arb_feed_frozen', market in frozen, labels))
+            samples.append(Sample('arb_feed_book_received_age_seconds', watchdog.age(market) or 0.0, labels))
+        samples.append(Sample('arb_feed_connection_received_age_seconds', venue.last_received_age() or 0.0))
+        samples.append(Sample('arb_feed_stalls_total', watchdog.stats['stalls']))
+        samples.append(Sample('arb_feed_cancel_failures_total', watchdog.stats['cancel_failures']))
+        samples.append(Sample('arb_feed_reaction_seconds', watchdog.stats['last_reaction_s']))
+        open_positions, open_orders, closed_pnl = view
+        samples.append(Sample('arb_open_orders', len(open_orders)))
+        for p in open_positions:
+            labels = (('market', p.ticker), ('side', p.side))
+            samples.append(Sample('arb_position_size', p.size, labels))
+            samples.append(Sample('arb_position_unrealized_pnl', p.unrealized_pnl, labels))
+        samples.append(Sample('arb_total_pnl', closed_pnl + sum(p.total_pnl for p in open_positions)))
+        return samples
+
+    metrics_server = MetricsServer(settings.metrics_port, collect_metrics) if settings.metrics_port else None
+    if metrics_server:
+        metrics_server.start()
+
+    profiler = Profiler(settings.profile_path, settings.profile_sample_interval_s, settings.profile_default_s)
+    profiler.install_signal_handler()
+    if profile_s:
+        profiler.trigger(profile_s)
+    dashboard.start()
+    reconciler.start()
+    watchdog.start()
 
     while(should_run):
         if ws and rest:
+            profiler.start_iteration()
+            iteration_started = time.perf_counter()
+            manual_exit = dashboard.pop_exit_request()
+            for alert in watchdog.pop_alerts():
+                dashboard.event(f"FEED {'STALLED, ORDERS CANCELLED' if alert.stale else 'RESYNCED'}: {alert.market}")
+            frozen = watchdog.frozen()
 
             # -----------------------------------------------------------------
-            # 2. Update order and position state with ws.get_orders() messages
+            # 2. Update order and position state with venue order updates
             # -----------------------------------------------------------------
 
-            order_updates = ws.get_orders()
-            if len(order_updates) > 0:
-                for oId in list(order_updates.keys()):
-
-                    # Dont action updates older than last_actioned timestamp for a given order id
+            order_updates = venue.orders()
+            state_changed = False
+            for oId in pending_order_updates(order_updates, last_update_time):
+
+                # Placement
+                update = order_updates[oId]
+                if update.status == 'new' and update.filled_size == 0.0:
+                    logger.info("Created a new order")
+                    orders[oId] = update
+                    queue.track(update, venue.book(update.market))
+                    last_update_time[oId] = update.msg_time
+                    store.journal('placed', oId, last_update_time[oId], order=orders[oId])
+                    state_changed = True
+
+                # Cancellation
+                elif update.status == 'closed' and update.filled_size == 0.0:
+                    queue.untrack(oId)
+                    try:
+                        del orders[oId]
+                        logger.info("Cancelled an existing order")
+                    except KeyError:
+                        last_update_time[oId] = update.msg_time
+                        err_msg = "Warning: Unexpected cancellation detected. Small order rate limits may have been exceeded. Manually verify positions, orders and exposure are safe. Close all positions and orders and restart program. If unexpected limit order cancellation persists wait 1 hour before retrying."
+                        logger.info(err_msg)
+                        raise Exception(err_msg)
+                    last_update_time[oId] = update.msg_time
+                    store.journal('cancelled', oId, last_update_time[oId])
+                    state_changed = True
+
+                # Complete fill, or a partial fill of an order cancelled before it completed
+                elif update.status == 'closed':
+
+                    # Save initial basis, this will be referenced when determine exit conditions.
+                    if not start_basis:
+                        start_basis = basis
+
+                    # Balance against existing position
+                    ticker = update.market
+                    fill_count += 1
+                    instrument_type = 'spot' if ticker == settings.market[0] else "perp"
+                    if ticker in positions.keys():
+                        logger.info("Increasing existing position" if update.side == positions[ticker].side else "Decreasing existing postion")
+
+                    # Create new position record if none exists
+                    else:
+                        msg = "creating new " + instrument_type + " position"
+                        logger.info(msg)
+                        positions[ticker] = Position(ticker, instrument_type, update.side)
+
+                    positions[ticker].apply_fill(update.side, update.filled_size, update.avg_fill_price)
+                    if positions[ticker].size == 0.0:
+                        closed_pnl += positions[ticker].total_pnl
+                        del positions[ticker]
+                    queue.untrack(oId)
                     try:
-                        should_update = True if order_updates[oId]['msg_time'] > last_update_time[oId] else False
+                        del orders[oId]
+                        del last_update_time[oId]
                     except KeyError:
-                        orders[oId] = order_updates[oId]
-                        last_update_time[oId] = order_updates[oId]['msg_time']
-                        should_update = True
-
-                    # Match order updates to action case
-                    if should_update:
-
-                        # Placement
-                        if order_updates[oId]['status'] == 'new' and order_updates[oId]['filledSize'] == 0.0:
-                            logger.info("Created a new order")
-                            orders[oId] = order_updates[oId]
-                            last_update_time[oId] = order_updates[oId]['msg_time']
-                            waiting_for_fill = True
-
-                        # Cancellation
-                        elif order_updates[oId]['status'] == 'closed' and order_updates[oId]['filledSize'] == 0.0:
-                            try:
-                                del orders[oId]
-                                logger.info("Cancelled an existing order")
-                            except KeyError:
-                                last_update_time[oId] = order_updates[oId]['msg_time']
-                                err_msg = "Warning: Unexpected cancellation detected. Small order rate limits may have been exceeded. Manually verify positions, orders and exposure are safe. Close all positions and orders and restart program. If unexpected limit order cancellation persists wait 1 hour before retrying."
-                                logger.info(err_msg)
-                                raise Exception(err_msg)
-                            last_update_time[oId] = order_updates[oId]['msg_time']
-                            waiting_for_fill = False
-
-                        # Complete fill
-                        elif order_updates[oId]['status'] == 'closed' and order_updates[oId]['size'] == order_updates[oId]['filledSize']:
-
-                            # Save initial basis, this will be referenced when determine exit conditions.
-                            if not start_basis:
-                                start_basis = basis
-
-                            # Balance against existing position
-                            ticker = order_updates[oId]['market']
-                            fill_count += 1
-                            instrument_type = 'spot' if ticker == MARKET[0] else "perp"
-                            if ticker in positions.keys():
-
-                                if order_updates[oId]['side'] == positions[ticker]['side']:
-                                    logger.info("Increasing existing position")
-                                    positions[ticker]['size'] = round(positions[ticker]['size'] + order_updates[oId]['size'], 4)
-                                    positions[ticker]['fillCount'] += 1
-                                    w_pos = (positions[ticker]['fillCount'] - 1) / positions[ticker]['fillCount']
-                                    w_new = 1 / positions[ticker]['fillCount']
-                                    avg_entry = positions[ticker]['avgEntryPrice'] * w_pos + order_updates[oId]['avgFillPrice'] * w_new
-                                    positions[ticker]['avgEntryPrice'] = round(avg_entry, 2)
-
-                                else:
-                                    logger.info("Decreasing existing postion")
-                                    positions[ticker]['size'] = round(positions[ticker]['size'] - order_updates[oId]['size'], 4)
-                                    positions[ticker]['fillCount'] -= 1
-                                    if positions[ticker]['size'] == 0.0:
-                                        del positions[ticker]
-
-                            # Create new position record if none exists
-                            else:
-                                msg = "creating new " + instrument_type + " position"
-                                logger.info(msg)
-                                positions[ticker] = {'ticker': ticker, 'type': instrument_type, 'size': order_updates[oId]['filledSize'], 'side': order_updates[oId]['side'], 'avgEntryPrice': order_updates[oId]['avgFillPrice'], 'fillCount': 1}
-                            try:
-                                del orders[oId]
-                                del last_update_time[oId]
-                            except KeyError:
-                                pass
-
-                            last_update_time[oId] = order_updates[oId]['msg_time']
-                            waiting_for_fill = False
-                            exposure = has_exposure(positions)
-
-                    should_update = False
+                        pass
+
+                    last_update_time[oId] = update.msg_time
+                    store.journal('filled', oId, last_update_time[oId], order=update,
+                                  instrument_type=instrument_type, fill_count=fill_count, start_basis=start_basis)
+                    state_changed = True
+
+            # Repair drift found by the background reconciler. Orders it closes are marked so a late
+            # websocket update for them is not acted on a second time, and a correction for an order
+            # the websocket already closed is dropped, its fills have been applied.
+            for correction in reconciler.pop_corrections():
+                if isinstance(correction, OrderClosed) and correction.order_id not in orders:
+                    logger.info("Reconcile: dropped, order already closed locally: " + str(correction))
+                    continue
+                logger.info("Reconcile: " + str(correction))
+                if isinstance(correction, OrderClosed):
+                    oId = correction.order_id
+                    del orders[oId]
+                    queue.untrack(oId)
+                    last_update_time[oId] = sys.maxsize
+                    if correction.filled_size:
+                        ticker = correction.market
+                        instrument_type = 'spot' if ticker == settings.market[0] else "perp"
+                        if ticker not in positions:
+                            positions[ticker] = Position(ticker, instrument_type, correction.side)
+                        positions[ticker].apply_fill(correction.side, correction.filled_size, correction.avg_fill_price)
+                        if positions[ticker].size == 0.0:
+                            closed_pnl += positions[ticker].total_pnl
+                            del positions[ticker]
+                        fill_count += 1
+                        closed = Order(oId, ticker, correction.side, 'limit', None, correction.size, correction.filled_size,
+                                       correction.avg_fill_price, 'closed', sys.maxsize)
+                        store.journal('filled', oId, sys.maxsize, order=closed, instrument_type=instrument_type,
+                                      fill_count=fill_count, start_basis=start_basis)
+                    else:
+                        store.journal('cancelled', oId, sys.maxsize)
+                elif isinstance(correction, OrderAdopted):
+                    update = correction.order
+                    orders[update.id] = update
+                    queue.track(update, venue.book(update.market))
+                    last_update_time[update.id] = update.msg_time
+                    store.journal('placed', update.id, update.msg_time, order=update)
+                elif isinstance(correction, PositionCorrected):
+                    instrument_type = 'spot' if correction.market == settings.market[0] else "perp"
+                    correct_position(positions, correction.market, instrument_type, correction.exchange_size, settings.market[2],
+                                     correction.entry_price or venue.ticker(correction.market).last)
+                state_changed = True
+
+            if state_changed:
+                store.save(positions, orders, start_basis, fill_count, last_update_time)
+
+            risk.update_positions(positions)
+            risk.update_orders(orders)
+            reconciler.update_local(positions, orders)
+            view = state_view(positions, orders, closed_pnl)
+            profiler.sections.lap('orders')
 
             # -----------------------------------------------------------------
             # 3. Monitor price and funding changes for entry and exit conditions
             # -----------------------------------------------------------------
 
             # Refresh funding rates every 5 min
-            if int(datetime.now().timestamp()) % 300 == 0:
+            if datetime.now().timestamp() - rates_updated_at >= 300:
+                rates_updated_at = datetime.now().timestamp()
                 logger.info("Updating funding rates")
                 try:
-                    borrow = round(float([b['estimate'] for b in rest.get_borrow_rates() if b['coin'] == MARKET[0].split('/')[0]][0] * 100), 4)
+                    borrow = round(float([b['estimate'] for b in rest.get_borrow_rates() if b['coin'] == settings.market[0].split('/')[0]][0] * 100), 4)
                 except IndexError:
                     borrow = 0
-                funding = round(float(rest.get_funding_rates(MARKET[1])[0]['rate']) * 100, 4)
-
-            # Update prices and calculate basis
-            ob_spot, ob_perp = ws.get_orderbook(MARKET[0]), ws.get_orderbook(MARKET[1])
-            spot_ask, spot_bid = ob_spot['asks'][0], ob_spot['bids'][0]
-            perp_ask, perp_bid = ob_perp['asks'][0], ob_perp['bids'][0]
-            last_price_spot, last_price_perp = ws.get_ticker(MARKET[0])['last'], ws.get_ticker(MARKET[1])['last']
-            if last_price_perp > last_price_spot:
-                basis = round(((perp_ask[0] - spot_bid[0]) / ((perp_ask[0] + spot_bid[0]) / 2)) * 100, 5)
-                perp_above_spot = True
-                above_below_message = "Perpetual is above Spot"
-            else:
-                basis = round(((spot_ask[0] - perp_bid[0]) / ((spot_ask[0] + perp_bid[0]) / 2)) * 100, 5)
-                perp_above_spot = False
-                above_below_message = "Spot is above Perpetual"
+                funding = round(float(rest.get_funding_rates(settings.market[1])[0]['rate']) * 100, 4)
+
+            # Accrue hourly funding on the perp position
+            if int(datetime.now().timestamp()) // 3600 != funding_hour:
+                funding_hour = int(datetime.now().timestamp()) // 3600
+                if settings.market[1] in positions:
+                    positions[settings.market[1]].accrue_funding(funding / 100)
+
+            # Update prices and calculate basis. Books being resynced or too thin to quote from are treated as
+            # frozen, no entries, child orders or reprices for them, and basis keeps its last value.
+            books = {m: venue.book(m) for m in settings.market[:2]}
+            frozen = sorted(set(frozen) | {m for m, b in books.items()
+                                           if venue.is_book_stale(m) or min(len(b.bids), len(b.asks)) <= params.quote_index})
+            last_price_spot, last_price_perp = venue.ticker(settings.market[0]).last, venue.ticker(settings.market[1]).last
+            for market in changed_books:
+                queue.on_trades(market, venue.trades(market))
+                queue.on_book(books[market])
+            if not frozen:
+                ob_spot, ob_perp = books[settings.market[0]], books[settings.market[1]]
+                spot_ask, spot_bid = ob_spot.instrument.price(ob_spot.asks[0][0]), ob_spot.instrument.price(ob_spot.bids[0][0])
+                perp_ask, perp_bid = ob_perp.instrument.price(ob_perp.asks[0][0]), ob_perp.instrument.price(ob_perp.bids[0][0])
+                basis, perp_above_spot = compute_basis(spot_bid, spot_ask, perp_bid, perp_ask, last_price_spot, last_price_perp)
 
             total_open_size = get_total_open_size(positions)
-            position_count, order_count = len(positions), len(orders)
-            total_fills = get_total_fills(positions)
+            position_count = len(positions)
 
-            basis_threshold = DEFAULT_BASIS_THRESHOLD if position_count == 0 else DEFAULT_BASIS_THRESHOLD * MARGIN_FOR_ENTRY
+            basis_threshold = params.basis_threshold if position_count == 0 else params.basis_threshold * params.margin_for_entry
 
-            if total_open_size >= ACCOUNT_SIZE or total_fills == ORDERS_PER_SIDE * 2:
-                at_max_size = True
-            else:
-                at_max_size = False
-
-            if at_max_size:
-                should_add_to_positions = False
-                should_increase_spot = False
-                should_increase_perp = False
-                waiting_for_fill = False
+            at_max_size = total_open_size >= settings.account_size or (any(execution.targets.values()) and execution.at_target(positions))
 
             if position_count == 2:
 
                 # Exit criteria 1: positioned, basis converges.
-                if (positions[MARKET[1]]['side'] == 'buy' and funding > 0) or (positions[MARKET[1]]['side'] == 'sell' and funding < 0):
-                    print("-------------------------------------------------------")
-                    print("START EXITING POSITIONS")
-                    print("Basis convergence")
-                    print("-------------------------------------------------------")
+                if (positions[settings.market[1]].side == 'buy' and funding > 0) or (positions[settings.market[1]].side == 'sell' and funding < 0):
+                    dashboard.event("START EXITING POSITIONS: Basis convergence")
                     logger.info("Basis convergence exit condition detected")
                     should_unwind_positions = True
                     should_add_to_positions = False
-                    waiting_for_fill = False
 
                 # Exit criteria 2: positioned, basis valid, but funding APR worse than acceptable.
-                if (positions[MARKET[1]]['side'] == 'buy' and funding > 0 and abs(funding) >= APR_EXIT_THRESHOLD) or (positions[MARKET[1]]['side'] == 'sell' and funding < 0 and abs(funding) >= APR_EXIT_THRESHOLD):
-                    print("-------------------------------------------------------")
-                    print("START EXITING POSITIONS")
-                    print("Unfavourable funding APR")
-                    print("-------------------------------------------------------")
+                if (positions[settings.market[1]].side == 'buy' and funding > 0 and abs(funding) >= params.apr_exit_threshold) or (positions[settings.market[1]].side == 'sell' and funding < 0 and abs(funding) >= params.apr_exit_threshold):
+                    dashboard.event("START EXITING POSITIONS: Unfavourable funding APR")
                     logger.info("Unfavourable funding APR exit condition detected")
                     should_unwind_positions = True
                     should_add_to_positions = False
-                    waiting_for_fill = False
 
                 # Exit criteria 3: arbitrary manual exit
-                if keyboard.is_pressed('ctrl+enter'):
-                    print("-------------------------------------------------------")
-                    print("START EXITING POSITIONS")
-                    print("Manual exit signal")
-                    print("-------------------------------------------------------")
+                if manual_exit:
+                    dashboard.event("START EXITING POSITIONS: Manual exit signal")
                     logger.info("Manual exit signal detected")
                     should_unwind_positions = True
                     should_add_to_positions = False
-                    waiting_for_fill = False
 
                 # For debug only - triggers position unwind as soon as max size is reached.
-                # if fill_count == ORDERS_PER_SIDE * 2 and not waiting_for_fill and order_count == 0 and not should_unwind_positions:
-                #     print("-------------------------------------------------------")
-                #     print("START EXITING POSITIONS")
-                #     print("-------------------------------------------------------")
+                # if at_max_size and not orders and not should_unwind_positions:
+                #     dashboard.event("START EXITING POSITIONS")
                 #     should_unwind_positions = True
                 #     should_add_to_positions = False
-                #     waiting_for_fill = False
 
-            logger.info(str("waiting_for_fill: " + str(waiting_for_fill)))
             logger.info(str("should_add_to_positions: " + str(should_add_to_positions)))
             logger.info(str("should_unwind_positions: " + str(should_unwind_positions)))
             logger.info(str("total open size: " + str(total_open_size)))
-            logger.info(str("account size: " + str(ACCOUNT_SIZE)))
+            logger.info(str("account size: " + str(settings.account_size)))
             logger.info(str("at_max_size: " + str(at_max_size)))
-            logger.info(str("exposure: " + str(exposure)))
-
-            # Add to positions
-            if not should_unwind_positions and not at_max_size:
-                if not waiting_for_fill:
-                    if abs(basis) >= basis_threshold:
-                        if (perp_above_spot and funding > 0) or (not perp_above_spot and funding < 0):
-                            should_add_to_positions = True
-                        else:
-                            should_add_to_positions = False
-                            logger.info("No entry conditions detected.")
-                            print("No entry conditions detected.")
-                    else:
-                        should_add_to_positions = False
-                        logger.info("Basis too small.")
-                        print("Basis too small.")
-
-                    if should_add_to_positions and not at_max_size:
-
-                        # Place limit orders on both sides such that exposure is balanced by the next fill
-                        try:
-                            if order_count == 0:
-                                if position_count == 0 or positions[MARKET[0]]["fillCount"] == positions[MARKET[1]]["fillCount"]:
-                                    should_increase_spot = True
-                                    should_increase_perp = True
-                                elif positions[MARKET[0]]["fillCount"] > positions[MARKET[1]]["fillCount"]:
-                                    should_increase_spot = False
-                                    should_increase_perp = True
-                                elif positions[MARKET[0]]["fillCount"] < positions[MARKET[1]]["fillCount"]:
-                                    should_increase_spot = True
-                                    should_increase_perp = False
-
-                            elif order_count == 1:
-                                try:
-                                    if positions[MARKET[0]]["fillCount"] > positions[MARKET[1]]["fillCount"]:
-                                        should_increase_spot = False
-                                        should_increase_perp = True
-                                    elif positions[MARKET[0]]["fillCount"] < positions[MARKET[1]]["fillCount"]:
-                                        should_increase_spot = True
-                                        should_increase_perp = False
-                                    elif positions[MARKET[0]]["fillCount"] == positions[MARKET[1]]["fillCount"]:
-                                        if list(orders.values())[0]['market'] == MARKET[0]:
-                                            should_increase_perp = True
-                                        else:
-                                            should_increase_spot = True
-
-                                # Place order on side of missing position, if any.
-                                except KeyError as missing_ticker:
-                                    if MARKET[0] == missing_ticker:
-                                        should_increase_perp = False
-                                        should_increase_spot = True
-                                    else:
-                                        should_increase_perp = True
-                                        should_increase_spot = False
-
-                            # Do nothing if orders open for both positions, wait for fills on either side
-                            elif order_count == 2:
-                                waiting_for_fill = True
-
-                        # Place order on side of missing position, if any.
-                        except KeyError as missing_ticker:
-                            if position_count == 0:
-                                should_increase_perp = True
-                                should_increase_spot = True
-                            elif MARKET[0] == missing_ticker:
-                                should_increase_perp = False
-                                should_increase_spot = True
-                            elif MARKET[1] == missing_ticker:
-                                should_increase_perp = True
-                                should_increase_spot = False
-
-                        logger.info(str("should increase spot: " + str(should_increase_spot)))
-                        logger.info(str("should increase perp: " + str(should_increase_perp)))
-
-                        if should_increase_spot and MARKET[0] not in [o['market'] for o in orders.values()]:
-                            logger.info("increase spot position")
-                            base_size = ACCOUNT_SIZE / ORDERS_PER_SIDE / 2 / last_price_spot
-                            size = round(MARKET[2] * round(float(base_size) / MARKET[2]), 4)
-                            try:
-                                side = 'sell' if positions[MARKET[0]]['side'] == 'sell' else 'buy'
-                            except KeyError:
-                                side = 'sell' if not perp_above_spot else 'buy'
-                            price = ws.get_orderbook(MARKET[0])['bids'][QUOTE_INDEX][0] if side == 'buy' else ws.get_orderbook(MARKET[0])['asks'][QUOTE_INDEX][0]
-                            logger.info("L420: Placing spot entry order:")
-                            if DEBUG_OUTPUT:
-                                print("Placing spot entry order:", size, side, price)
-                                quotes = ws.get_orderbook(MARKET[0])['bids'][0:5] if side == 'buy' else ws.get_orderbook(MARKET[0])['asks'][0:5]
-                                print("Spot quotes 0-5", quotes)
-                            rest.place_order(MARKET[0], side, price, size, "limit", False, False, False, None, None)
-                            should_increase_spot = False
-
-                        if should_increase_perp and MARKET[1] not in [o['market'] for o in orders.values()]:
-                            logger.info("increase perp position")
-                            base_size = ACCOUNT_SIZE / ORDERS_PER_SIDE / 2 / last_price_perp
-                            size = round(MARKET[2] * round(float(base_size) / MARKET[2]), 4)
-                            try:
-                                side = 'sell' if positions[MARKET[1]]['side'] == 'sell' else 'buy'
-                            except KeyError:
-                                side = 'sell' if perp_above_spot else 'buy'
-                            price = ws.get_orderbook(MARKET[1])['bids'][QUOTE_INDEX][0] if side == 'buy' else ws.get_orderbook(MARKET[1])['asks'][QUOTE_INDEX][0]
-                            logger.info("L437: Placing perp entry order:")
-                            if DEBUG_OUTPUT:
-                                print("Placing perp entry order:", size, side, price)
-                                quotes = ws.get_orderbook(MARKET[1])['bids'][0:5] if side == 'buy' else ws.get_orderbook(MARKET[1])['asks'][0:5]
-                                print("Perp quotes 0-5", quotes)
-                            rest.place_order(MARKET[1], side, price, size, "limit", False, False, False, None, None)
-                            should_increase_perp = False
-
-            # Unwind open positions
-            elif should_unwind_positions:
-                if not waiting_for_fill:
-                    if position_count > 0:
-
-                        # Place exit orders on both sides if exposure is balanced
-                        try:
-                            if order_count == 0 and positions[MARKET[0]]["fillCount"] == positions[MARKET[1]]["fillCount"]:
-                                should_reduce_spot = True
-                                should_reduce_perp = True
-
-                            # Place one order on the side with greater exposure
-                            elif order_count == 1:
-                                try:
-                                    # If spot position larger than perp
-                                    if positions[MARKET[0]]["fillCount"] > positions[MARKET[1]]["fillCount"]:
-                                        should_reduce_spot = True
-                                        should_reduce_perp = False
-
-                                    # If perp position larger than spot
-                                    elif positions[MARKET[0]]["fillCount"] < positions[MARKET[1]]["fillCount"]:
-                                        should_reduce_spot = False
-                                        should_reduce_perp = True
-
-                                except KeyError as missing_ticker:
-                                    if MARKET[0] == missing_ticker:
-                                        should_reduce_perp = True
-                                        should_reduce_spot = False
-                                    else:
-                                        should_reduce_perp = False
-                                        should_reduce_spot = True
-
-                            # Do nothing if orders open for both positions, wait for fills on either side
-                            elif order_count == 2:
-                                waiting_for_fill = True
-
-                            logger.info(str("should increase spot: " + str(should_increase_spot)))
-                            logger.info(str("should increase perp: " + str(should_increase_perp)))
-
-                        # Place order on side of missing position, if any.
-                        except KeyError as missing_ticker:
-                            if MARKET[0] == missing_ticker:
-                                should_reduce_perp = True
-                                should_reduce_spot = False
-                            else:
-                                should_reduce_perp = False
-                                should_reduce_spot = True
-
-                        if should_reduce_spot and MARKET[0] not in [o['market'] for o in orders.values()]:
-                            try:
-                                logger.info("reduce spot position")
-                                size = positions[MARKET[0]]['size'] / positions[MARKET[0]]['fillCount']
-                                side = 'buy' if positions[MARKET[0]]['side'] == 'sell' else 'sell'
-                                price = ws.get_orderbook(MARKET[0])['bids'][QUOTE_INDEX][0] if side == 'buy' else ws.get_orderbook(MARKET[0])['asks'][QUOTE_INDEX][0]
-                                logger.info("L498 Placing spot exit order")
-                                if DEBUG_OUTPUT:
-                                    print("Placing spot exit order:", size, side, price)
-                                    print("Spot last price:", last_price_spot)
-                                    quotes = ws.get_orderbook(MARKET[0])['bids'][0:5] if side == 'buy' else ws.get_orderbook(MARKET[0])['asks'][0:5]
-                                    print("Spot quotes 0-5", quotes)
-                                rest.place_order(MARKET[0], side, price, size, "limit", False, False, False, None, None)
-                                waiting_for_fill = True
-                                should_reduce_spot = False
-                            except KeyError as already_closed:
-                                if DEBUG_OUTPUT:
-                                    print("Position for", already_closed, "already_closed")
-
-                        if should_reduce_perp and MARKET[1] not in [o['market'] for o in orders.values()]:
-                            try:
-                                logger.info("reduce perp position")
-                                size = positions[MARKET[1]]['size'] / positions[MARKET[1]]['fillCount']
-                                side = 'sell' if positions[MARKET[1]]['side'] == 'buy' else 'buy'
-                                price = ws.get_orderbook(MARKET[1])['bids'][QUOTE_INDEX][0] if side == 'buy' else ws.get_orderbook(MARKET[1])['asks'][QUOTE_INDEX][0]
-                                logger.info("L517 placing perp exit order")
-                                if DEBUG_OUTPUT:
-                                    print("Placing perp exit order:", size, side, price)
-                                    print("Perp last price:", last_price_perp)
-                                    quotes = ws.get_orderbook(MARKET[1])['bids'][0:5] if side == 'buy' else ws.get_orderbook(MARKET[1])['asks'][0:5]
-                                    print("Perp quotes 0-5", quotes)
-                                rest.place_order(MARKET[1], side, price, size, "limit", False, False, False, None, None)
-                                waiting_for_fill = True
-                                should_reduce_perp = False
-                            except KeyError as already_closed:
-                                if DEBUG_OUTPUT:
-                                    print("Position for", already_closed, "already_closed")
-                    else:
-                        print("\nTrade complete. Terminating.")
-                        subprocess.run(["taskkill", "/IM", "python.exe", "/F"])
+            logger.info(str("net delta (units, notional): " + str(exposure)))
+
+            # Set per-leg targets on entry and flatten them on exit, then work both legs towards them
+            if not should_unwind_positions:
+                status = None
+                if at_max_size:
+                    should_add_to_positions = False
+                elif frozen:
+                    should_add_to_positions = False
+                    status = "Feed stale, entries frozen: " + str(frozen)
+                elif abs(basis) < basis_threshold:
+                    should_add_to_positions = False
+                    status = "Basis too small."
+                elif (perp_above_spot and funding > 0) or (not perp_above_spot and funding < 0):
+                    should_add_to_positions = True
+                else:
+                    should_add_to_positions = False
+                    status = "No entry conditions detected."
+
+                # These hold for many iterations in a row, they are reported when they change
+                if status != entry_status:
+                    if status:
+                        logger.info(status)
+                        dashboard.event(status)
+                    entry_status = status
+
+                if should_add_to_positions and not any(execution.targets.values()):
+                    execution.set_targets(entry_targets(settings, positions, orders, perp_above_spot, last_price_spot))
+                    logger.info("Entry targets (steps): " + str(execution.targets))
+
+            elif positions or orders:
+                if any(execution.targets.values()):
+                    execution.set_targets({settings.market[0]: 0, settings.market[1]: 0})
+                    logger.info("Exit targets (steps): " + str(execution.targets))
+
+            else:
+                dashboard.stop()
+                reconciler.stop()
+                watchdog.stop()
+                print("\nTrade complete. Terminating.")
+                try:
+                    from ledger import Ledger
+                    ledger = Ledger(settings.ledger_path)
+                    ledger.sync(rest)
+                    for line in ledger.summary():
+                        logger.info("Ledger " + str(dict(line)))
+                    ledger.close()
+                except Exception as e:
+                    logger.info(f"Ledger sync failed: {e}")
+                store.clear()
+                if metrics_server:
+                    metrics_server.stop()
+                if not session:
+                    rest.close()
+                return
+
+            # Nothing is placed while either book is stale, the prices of both legs come from them
+            max_lead = max(int(max_leg_lead / last_price_spot / settings.market[2]), 1)
+            children = [] if frozen else execution.step(positions, orders, last_update_time, params,
+                                                        should_add_to_positions or should_unwind_positions, max_lead)
+            for child in children:
+                instrument = instruments[child.market]
+                logger.info(f"Placing {child.market} child order: {child.side} {instrument.size(child.size)} @ {instrument.price(child.price)}")
+                if settings.debug_output:
+                    dashboard.event(f"Placing {child.market} order:", instrument.size(child.size), child.side, instrument.price(child.price))
+
+            profiler.sections.lap('entry_exit')
 
             # -----------------------------------------------------------------
             # 4. Check stop-loss conditions and move open orders to follow price
             # -----------------------------------------------------------------
 
-            exposure = has_exposure(positions)
-            for o in orders.values():
-                within_risk_limit = True
-                last_price = last_price_perp if o['market'] == MARKET[1] else last_price_spot
-                ob = ws.get_orderbook(o['market'])['asks'] if side == 'sell' else ws.get_orderbook(o['market'])['bids']
-                ob_step = abs(fmean(np.diff([quote[0] for quote in ob[0:5]])))
-                new_price = ob[QUOTE_INDEX][0]
-
-                # Calculate stop distance from avg entry of opposing exposed position
-                if exposure:
-                    market = MARKET[0] if exposure[0] == MARKET[1] else MARKET[1]
-                    side = 'sell' if exposure[1] == 'buy' else 'buy'
-                    entry = positions[market]['avgEntryPrice']
-
-                    # In future suggest using the size of the basis as the stop distance. Fixed distance is disproportionate in most cases.
-                    # Using a very small basis threshold is good for testing but will mean stopping out of an entry often.
-                    stop_price = entry - (entry / 100 * BAD_ENTRY_CUTOFF) if side == 'buy' else entry + (entry / 100 * BAD_ENTRY_CUTOFF)
-
-                    logger.info(str("cutoff price for open order: " + str(stop_price)))
-
-                    if side == 'buy' and o['price'] <= stop_price:
-                        within_risk_limit = False
-                    elif side == 'sell' and o['price'] >= stop_price:
-                        within_risk_limit = False
-
-                    # Close exposed portion of trade and cancel open order
-                    if not within_risk_limit:
-                        if DEBUG_OUTPUT:
-                            print("cutoff reached. closing exposed portion of trade and cancelling open order")
-                        size = positions[market]['size'] / positions[market]['fillCount']
-                        rest.cancel_order(o['id'])
-                        logger.info("L568 placing market order to close exposure")
-                        rest.place_order(market, exposure[1], None, size, "market", False, False, False, None, None)
-                        should_add_to_positions = False
-                        waiting_for_fill = False
-
-                # Move open limit orders closer to price if order price is more than MOVE_ORDER_THRESHOLD levels from last price.
-                if within_risk_limit and abs(o['price'] - last_price) > ob_step * MOVE_ORDER_THRESHOLD and new_price != o['price']:
-                    logger.info("moving existing limit order")
-                    rest.modify_order(o['id'], None, new_price, None, None)
-
-            msg_l1 = f"\n-----------------  {MARKET[0]}  :  {MARKET[1]}  -----------------"
-            msg_l2 = f"Spot margin borrow APR:                    {round(borrow * 8760, 5)}"
-            msg_l3 = f"Perpetual funding APR:                     {round(funding * 8760, 5)}"
-            msg_l4 = f"Spot/perp basis %:                         {round(basis, 5)}"
-            print(msg_l1)
-            print(msg_l2)
-            print(msg_l3)
-            print(msg_l4)
-            print(above_below_message)
-            logger.info(msg_l2)
-            logger.info(msg_l3)
-            logger.info(msg_l4)
-            logger.info(above_below_message)
-
-            msg_p1 = f"\nActive positions: {len(positions)}"
-            msg_p2 = f"Ticker ---- Direction ---- Avg. entry ---- Size ----  Fill count ---- "
-            msg_p3 = ""
-            for p in positions.values():
-                msg_p3 += f"{p['ticker']}     {p['side']}             {p['avgEntryPrice']}       {p['size']}     {p['fillCount']}\n"
-            print(msg_p1)
-            print(msg_p2)
-            print(msg_p3)
-            logger.info(msg_p1)
-            logger.info(msg_p2)
-            logger.info(msg_p3)
-
-            msg_o1 = f"\nOpen orders:  {len(orders)}"
-            msg_o2 = f"Ticker ---- Direction ----- Price ---- Size ---- Status ----"
-            msg_o3 = ""
-            for o in orders.values():
-                msg_o3 += f"{o['market']}     {o['side']}           {o['price']}     {o['size']}    {o['status']}\n"
-            print(msg_o1)
-            print(msg_o2)
-            print(msg_o3)
-            logger.info(msg_o1)
-            logger.info(msg_o2)
-            logger.info(msg_o3)
+            # Stops are also evaluated on every book update by the risk engine, this catches positions
+            # and orders that changed since the last one.
+            risk.evaluate()
+            if risk.pop_stop_events():
+                should_add_to_positions = False
+            exposure = risk.net_delta()[underlying]
+            stopped_orders = risk.cancelled_order_ids()
 
-            print("\n\n")
-            sleep(4)
+            # Quote prices only move with the book, orders in markets whose book is unchanged keep their decision
+            for o in orders.values():
+                if o.market in frozen or o.market not in changed_books:
+                    continue
+                book = venue.book(o.market)
+                new_price = (book.asks if o.side == 'sell' else book.bids)[params.quote_index][0]
+
+                # Move open limit orders to the quote price if they are more than MOVE_ORDER_THRESHOLD ticks from it
+                # and the estimated queue position says the move will get them filled meaningfully sooner.
+                if o.id not in stopped_orders and queue.should_reprice(o.id, new_price, params.move_order_threshold, book, settings.reprice_min_gain_s):
+                    logger.info("moving existing limit order, expected time to fill: " + str(queue.expected_time_to_fill(o.id)))
+                    queue.on_reprice(o.id, venue.modify_order(o.id, new_price))
+
+            profiler.sections.lap('stops_follow')
+            loop_stats['last_s'] = time.perf_counter() - iteration_started
+            loop_stats['max_s'] = max(loop_stats['max_s'], loop_stats['last_s'])
+            loop_stats['iterations'] += 1
+            batch = conflator.wait(settings.max_evaluation_interval_s)
+            changed_books = [u.market for u in batch if u.dirty & DIRTY_ORDERBOOK]
+            profiler.sections.lap('wait')
 
         else:
             if not ws:
-                ws = FtxWebsocketClient(api_key, api_secret, SUBACCOUNT)
+                ws = create_ws_client(settings, api_key, api_secret)
             if not rest:
-                rest = FtxRestClient(api_key, api_secret, SUBACCOUNT)
-
-
-run()
+                rest = FtxRequestScheduler(FtxRestClient(api_key, api_secret, settings.subaccount))
+
+
+# Run one strategy per subaccount in this process, each on its own thread, sharing one market data connection.
+# Each gets its own metrics port counting up from settings.metrics_port, ledger and profile directory.
+# Return the subaccounts whose strategy raised.
+def run_subaccounts(subaccounts: List[str], profile_s: float = None, params: StrategyParams = STRATEGY_PARAMS,
+                    settings: Settings = SETTINGS, dry_run: bool = False) -> List[str]:
+    from sessions import SessionManager
+    setup_logging(settings.log_path)
+    manager = SessionManager(os.environ.get('BASIS_API_KEY_FTX'), os.environ.get('BASIS_API_SECRET_FTX'),
+                             settings.orderbook_depth, settings.ws_connections)
+    failed = []
+
+    def run_session(subaccount_settings: Settings) -> None:
+        try:
+            run(profile_s, params, manager.session(subaccount_settings.subaccount), subaccount_settings, dry_run)
+        except Exception as e:
+            logging.getLogger().exception(f"{subaccount_settings.subaccount}: strategy stopped: {e!r}")
+            print(f"{subaccount_settings.subaccount} | Strategy stopped: {e!r}")
+            failed.append(subaccount_settings.subaccount)
+
+    ledger_path = Path(settings.ledger_path)
+    threads = []
+    for i, subaccount in enumerate(subaccounts):
+        subaccount_settings = settings._replace(
+            subaccount=subaccount,
+            metrics_port=settings.metrics_port + i if settings.metrics_port else None,
+            ledger_path=str(ledger_path.with_name(f"{ledger_path.stem}-{subaccount}{ledger_path.suffix}")),
+            profile_path=str(Path(settings.profile_path) / subaccount))
+        threads.append(Thread(target=run_session, args=(subaccount_settings,), name=subaccount))
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    manager.close()
+    return failed
+
+
+# Return settings and params with overrides applied. Keys are field names of either, values as loaded from JSON.
+def apply_config(settings: Settings, params: StrategyParams, overrides: dict) -> [Settings, StrategyParams]:
+    unknown = [k for k in overrides if k not in Settings._fields and k not in StrategyParams._fields]
+    if unknown:
+        raise Exception(f"Unknown config keys {unknown}. Valid keys are {list(Settings._fields) + list(StrategyParams._fields)}")
+
+    # JSON has no tuples, lists replace tuple fields
+    overrides = {k: tuple(v) if isinstance(v, list) else v for k, v in overrides.items()}
+    settings = settings._replace(**{k: v for k, v in overrides.items() if k in Settings._fields})
+    params = params._replace(**{k: v for k, v in overrides.items() if k in StrategyParams._fields})
+    return settings, params
+
+
+# Return True if value is of the annotated type. Ints pass as floats, bools pass only as bools.
+def matches_annotation(value, annotation) -> bool:
+    origin, args = get_origin(annotation), get_args(annotation)
+    if origin is Union:
+        return any(matches_annotation(value, a) for a in args)
+    if origin is tuple:
+        return isinstance(value, tuple) and len(value) == len(args) and all(matches_annotation(v, a) for v, a in zip(value, args))
+    if annotation is type(None):
+        return value is None
+    if annotation is float:
+        return isinstance(value, (int, float)) and not isinstance(value, bool)
+    if annotation is int:
+        return isinstance(value, int) and not isinstance(value, bool)
+    return isinstance(value, annotation)
+
+
+# Return every problem found in settings and params without contacting the exchange, empty if there are none
+def validate_config(settings: Settings, params: StrategyParams) -> List[str]:
+    problems = []
+    for config in (settings, params):
+        for field, annotation in config.__annotations__.items():
+            value = getattr(config, field)
+            if not matches_annotation(value, annotation):
+                expected = annotation.__name__ if isinstance(annotation, type) else str(annotation).replace('typing.', '')
+                problems.append(f"{field} must be {expected}, not {value!r}")
+
+    # The checks below compare values, they need the types to be right
+    if problems:
+        return problems
+    if len(settings.market) != 3 or '/' not in str(settings.market[0]) or not str(settings.market[1]).endswith('-PERP') \
+            or not isinstance(settings.market[2], (int, float)) or settings.market[2] <= 0:
+        problems.append(f"market {settings.market} must be (spot ticker, perp ticker, size step), e.g. ('GST/USD', 'GST-PERP', 0.1)")
+    if settings.account_size <= 0:
+        problems.append("account_size must be positive")
+    if params.orders_per_side < 1 or settings.max_child_orders < 1:
+        problems.append("orders_per_side and max_child_orders must be at least 1")
+    if not 0 < settings.child_depth_fraction <= 1:
+        problems.append("child_depth_fraction must be in (0, 1]")
+    if params.quote_index < 0 or (settings.orderbook_depth is not None and params.quote_index >= settings.orderbook_depth):
+        problems.append(f"quote_index {params.quote_index} must be a level within orderbook_depth {settings.orderbook_depth}")
+    if settings.ws_connections < 1:
+        problems.append("ws_connections must be at least 1")
+    if len(settings.feed_stale_s) != 2 or min(settings.feed_stale_s) <= settings.feed_check_interval_s:
+        problems.append("feed_stale_s must be (spot, perp) thresholds longer than feed_check_interval_s")
+    if not 0 < settings.min_evaluation_interval_s <= settings.max_evaluation_interval_s:
+        problems.append("min_evaluation_interval_s must be positive and at most max_evaluation_interval_s")
+    if settings.metrics_port is not None and not 0 < settings.metrics_port < 65536:
+        problems.append("metrics_port must be a TCP port or None")
+    if settings.dashboard_fps <= 0:
+        problems.append("dashboard_fps must be positive")
+    return problems
+
+
+def main(argv: List[str] = None) -> int:
+    parser = argparse.ArgumentParser(description="Spot/perpetual basis arbitrage on FTX")
+    parser.add_argument('--config', metavar='FILE', help='JSON object overriding fields of SETTINGS and STRATEGY_PARAMS by name')
+    parser.add_argument('--set', metavar='KEY=VALUE', action='append', default=[],
+                        help='Override one field after --config, VALUE is parsed as JSON where it can be, e.g. --set account_size=200')
+    parser.add_argument('--params', metavar='FILE', help='JSON object overriding fields of STRATEGY_PARAMS by name, e.g. one row of sweep.py results')
+    parser.add_argument('--profile', type=float, nargs='?', const=PROFILE_DEFAULT_S, default=os.environ.get('ARB_PROFILE'),
+                        metavar='SECONDS', help='Time loop sections and sample stacks for SECONDS after startup (default from ARB_PROFILE)')
+    parser.add_argument('--subaccounts', metavar='NAMES', help='Comma separated subaccounts to run in this process over one '
+                        'market data connection, in place of the configured subaccount')
+    mode = parser.add_mutually_exclusive_group()
+    mode.add_argument('--validate', action='store_true', help='Check the configuration offline, print it and exit')
+    mode.add_argument('--dry-run', action='store_true', help='Run every startup check against the exchange, then exit without trading')
+    args = parser.parse_args(argv)
+
+    settings, params = SETTINGS, STRATEGY_PARAMS
+    try:
+        if args.config:
+            with open(args.config) as f:
+                settings, params = apply_config(settings, params, json.load(f))
+        if args.params:
+            with open(args.params) as f:
+                params = params._replace(**json.load(f))
+        for assignment in args.set:
+            key, _, value = assignment.partition('=')
+            try:
+                value = json.loads(value)
+            except ValueError:
+                pass
+            settings, params = apply_config(settings, params, {key: value})
+    except Exception as e:
+        print(f"Invalid configuration: {e}")
+        return 2
+
+    problems = validate_config(settings, params)
+    if not args.validate and (not os.environ.get('BASIS_API_KEY_FTX') or not os.environ.get('BASIS_API_SECRET_FTX')):
+        problems.append("BASIS_API_KEY_FTX and BASIS_API_SECRET_FTX must be set in the environment")
+    if args.validate:
+        print(json.dumps({**settings._asdict(), **params._asdict()}, indent=2))
+    for problem in problems:
+        print("Invalid configuration: " + problem)
+    if problems or args.validate:
+        return 1 if problems else 0
+
+    profile_s = float(args.profile) if args.profile else None
+    if args.subaccounts:
+        return 1 if run_subaccounts([s.strip() for s in args.subaccounts.split(',') if s.strip()], profile_s, params,
+                                    settings, args.dry_run) else 0
+    run(profile_s, params, settings=settings, dry_run=args.dry_run)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
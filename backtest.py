@@ -0,0 +1,371 @@
+import json
+import heapq
+from typing import Callable, Dict, Iterator, List, NamedTuple, Optional, Tuple
+
+import numpy as np
+from ciso8601 import parse_datetime
+
+from models import Position, StrategyParams
+
+
+BOOK_LEVELS = 5                             # Levels kept per book side in a snapshot, quote_index must stay below this
+
+# Snapshot columns. Book columns hold BOOK_LEVELS prices each, best first, NaN where the book is shallower.
+TIME, FUNDING, SPOT_LAST, PERP_LAST = range(4)
+SPOT_BIDS, SPOT_ASKS, PERP_BIDS, PERP_ASKS = (4 + k * BOOK_LEVELS for k in range(4))
+BASIS = 4 + 4 * BOOK_LEVELS                 # Derived by derive(), as compute_basis() in arb.py
+PERP_ABOVE = BASIS + 1
+RAW_COLUMNS = BASIS
+COLUMNS = PERP_ABOVE + 1
+
+MAKER_FEE = 0.0002
+TAKER_FEE = 0.0007
+
+
+class Dataset(NamedTuple):
+    data: np.ndarray                        # One row per snapshot, COLUMNS wide
+    spot: str
+    perp: str
+    spot_tick: float
+    perp_tick: float
+
+
+# -----------------------------------------------------------------
+# Market data
+# -----------------------------------------------------------------
+
+# Return (times, rates) of funding payments from an FTX funding rates payload, oldest first
+def load_funding(path: str) -> Tuple[np.ndarray, np.ndarray]:
+    with open(path) as f:
+        payments = sorted((parse_datetime(p['time']).timestamp(), float(p['rate'])) for p in json.load(f))
+    if not payments:
+        raise Exception(f"No funding payments in {path}")
+    times, rates = zip(*payments)
+    return np.array(times), np.array(rates)
+
+
+# Return snapshot rows of spot and perp books and last prices, sampled every interval_s of feed time from
+# recorded websocket frames. Snapshots start once both books and both last prices have been seen.
+def decode_frames(frames: Iterator[Tuple[float, str]], spot: str, perp: str, interval_s: float = 1.0) -> np.ndarray:
+    books = {spot: ({}, {}), perp: ({}, {})}
+    last = {}
+    rows = []
+    next_time = None
+
+    def snapshot(t: float) -> None:
+        row = np.full(RAW_COLUMNS, np.nan)
+        row[TIME], row[SPOT_LAST], row[PERP_LAST] = t, last[spot], last[perp]
+        for market, bids_column, asks_column in ((spot, SPOT_BIDS, SPOT_ASKS), (perp, PERP_BIDS, PERP_ASKS)):
+            bids, asks = books[market]
+            best_bids, best_asks = heapq.nlargest(BOOK_LEVELS, bids), heapq.nsmallest(BOOK_LEVELS, asks)
+            row[bids_column:bids_column + len(best_bids)] = best_bids
+            row[asks_column:asks_column + len(best_asks)] = best_asks
+        rows.append(row)
+
+    for t, frame in frames:
+        if next_time is not None and t >= next_time:
+            # Gaps in the recording produce one snapshot, not one per missed interval
+            boundary = next_time + (t - next_time) // interval_s * interval_s
+            snapshot(boundary)
+            next_time = boundary + interval_s
+
+        message = json.loads(frame)
+        market = message.get('market')
+        if market not in books or message.get('type') not in ('partial', 'update'):
+            continue
+        data = message['data']
+        if message['channel'] == 'orderbook':
+            bids, asks = books[market]
+            if data['action'] == 'partial':
+                bids.clear()
+                asks.clear()
+            for side, levels in ((bids, data['bids']), (asks, data['asks'])):
+                for price, size in levels:
+                    if size:
+                        side[price] = size
+                    else:
+                        side.pop(price, None)
+        elif message['channel'] == 'ticker' and data.get('last') is not None:
+            last[market] = data['last']
+
+        if next_time is None and len(last) == 2 and all(bids and asks for bids, asks in books.values()):
+            next_time = t
+    return np.array(rows).reshape(-1, RAW_COLUMNS)
+
+
+# Return snapshot rows with the FUNDING column set to the latest funding payment rate in percent, as run() reads it
+def apply_funding(rows: np.ndarray, times: np.ndarray, rates: np.ndarray) -> np.ndarray:
+    index = np.searchsorted(times, rows[:, TIME], side='right') - 1
+    rows[:, FUNDING] = np.round(rates[np.maximum(index, 0)] * 100, 4)
+    return rows
+
+
+# Return full width rows with basis and direction derived from raw snapshot rows
+def derive(rows: np.ndarray) -> np.ndarray:
+    data = np.empty((len(rows), COLUMNS))
+    data[:, :RAW_COLUMNS] = rows[:, :RAW_COLUMNS]
+    spot_bid, spot_ask = data[:, SPOT_BIDS], data[:, SPOT_ASKS]
+    perp_bid, perp_ask = data[:, PERP_BIDS], data[:, PERP_ASKS]
+    perp_above = data[:, PERP_LAST] > data[:, SPOT_LAST]
+    data[:, BASIS] = np.round(np.where(perp_above, (perp_ask - spot_bid) / ((perp_ask + spot_bid) / 2),
+                                       (spot_ask - perp_bid) / ((spot_ask + perp_bid) / 2)) * 100, 5)
+    data[:, PERP_ABOVE] = perp_above
+    return data
+
+
+# Return the smallest price step between adjacent book levels, sampled from up to the first 10000 rows
+def infer_tick(rows: np.ndarray, bids_column: int, asks_column: int) -> float:
+    sample = rows[:10000]
+    steps = np.concatenate([np.diff(-sample[:, bids_column:bids_column + BOOK_LEVELS]).ravel(),
+                            np.diff(sample[:, asks_column:asks_column + BOOK_LEVELS]).ravel()])
+    steps = steps[steps > 0]
+    if not len(steps):
+        raise Exception("Unable to infer price tick, books have a single level")
+    return float(np.round(steps.min(), 12))
+
+
+def build_dataset(rows: np.ndarray, spot: str, perp: str) -> Dataset:
+    if not len(rows):
+        raise Exception(f"No snapshots with both {spot} and {perp} books and last prices")
+    return Dataset(derive(rows), spot, perp, infer_tick(rows, SPOT_BIDS, SPOT_ASKS), infer_tick(rows, PERP_BIDS, PERP_ASKS))
+
+
+# Historical data from other sources can be converted to this layout: an array named rows with RAW_COLUMNS
+# columns and the market names and ticks as scalars
+def save_dataset(dataset: Dataset, path: str) -> None:
+    np.savez(path, rows=dataset.data[:, :RAW_COLUMNS], spot=dataset.spot, perp=dataset.perp,
+             spot_tick=dataset.spot_tick, perp_tick=dataset.perp_tick)
+
+
+def load_dataset(path: str) -> Dataset:
+    with np.load(path) as f:
+        rows = f['rows']
+        if rows.shape[1] != RAW_COLUMNS:
+            raise Exception(f"{path} has {rows.shape[1]} columns, expected {RAW_COLUMNS}")
+        return Dataset(derive(rows), str(f['spot']), str(f['perp']), float(f['spot_tick']), float(f['perp_tick']))
+
+
+# Return row indices where a new clock hour starts, the rows funding is accrued on
+def hour_rows(data: np.ndarray) -> np.ndarray:
+    return np.flatnonzero(np.diff(data[:, TIME] // 3600)) + 1
+
+
+# -----------------------------------------------------------------
+# Simulation
+# -----------------------------------------------------------------
+
+# Return the first row in [start, end) where predicate(lo, hi) is true, or end. Rows are tested in
+# chunks that grow while nothing is found, so near events cost little and far ones stay vectorized.
+def _scan(start: int, end: int, predicate: Callable[[int, int], np.ndarray]) -> int:
+    size = 64
+    while start < end:
+        stop = min(start + size, end)
+        hits = predicate(start, stop)
+        k = int(hits.argmax())
+        if hits[k]:
+            return start + k
+        start, size = stop, min(size * 4, 1 << 16)
+    return end
+
+
+class _Leg:
+    __slots__ = ('market', 'type', 'bids', 'asks', 'last', 'tick', 'position', 'order')
+
+    def __init__(self, market: str, type: str, bids_column: int, asks_column: int, last_column: int, tick: float) -> None:
+        self.market = market
+        self.type = type
+        self.bids = bids_column
+        self.asks = asks_column
+        self.last = last_column
+        self.tick = tick
+        self.position: Optional[Position] = None
+        self.order: Optional[List] = None           # [side, price, size]
+
+    @property
+    def fill_count(self) -> int:
+        return self.position.fill_count if self.position else 0
+
+
+def simulate(dataset: Dataset, params: StrategyParams, account_size: float, size_increment: float,
+             maker_fee: float = MAKER_FEE, taker_fee: float = TAKER_FEE, hours: Optional[np.ndarray] = None) -> Dict:
+    """
+    Replays the entry, exit, stop and order following decisions of run() over snapshot rows.
+    The state only changes on events, so instead of stepping every row the next event is found by
+    vectorized scans: a working order filling or drifting move_order_threshold ticks from the
+    quote price, the entry or exit condition turning true, an unhedged leg reaching its stop, or
+    an hourly funding payment. Limit orders fill at their price once the opposite side of the
+    book trades through it, stops flatten at the touch paying taker_fee. A completed trade
+    restarts the strategy, as relaunching run() would.
+    Not modelled: queue position, the REPRICE_MIN_GAIN_S gain check, the net notional limit and
+    request latency.
+    """
+    if not 0 <= params.quote_index < BOOK_LEVELS:
+        raise Exception(f"quote_index must be in [0, {BOOK_LEVELS}), got {params.quote_index}")
+    data = dataset.data
+    n = len(data)
+    time, funding, basis, perp_above = data[:, TIME], data[:, FUNDING], data[:, BASIS], data[:, PERP_ABOVE] > 0
+    hours = hour_rows(data) if hours is None else hours
+    spot = _Leg(dataset.spot, 'spot', SPOT_BIDS, SPOT_ASKS, SPOT_LAST, dataset.spot_tick)
+    perp = _Leg(dataset.perp, 'perp', PERP_BIDS, PERP_ASKS, PERP_LAST, dataset.perp_tick)
+    legs = (spot, perp)
+    q, max_fills = params.quote_index, params.orders_per_side * 2
+
+    closed_pnl, fees, funding_pnl = 0.0, 0.0, 0.0
+    trades, fills, stops = 0, 0, 0
+    peak, max_drawdown, exposed_s = 0.0, 0.0, 0.0
+    unwinding = False
+
+    def mid(leg: _Leg, row: int) -> float:
+        return (data[row, leg.bids] + data[row, leg.asks]) / 2
+
+    def quote(leg: _Leg, side: str, row: int) -> float:
+        return data[row, (leg.bids if side == 'buy' else leg.asks) + q]
+
+    def entry_condition(threshold: float) -> Callable[[int, int], np.ndarray]:
+        def test(lo: int, hi: int) -> np.ndarray:
+            return (np.abs(basis[lo:hi]) >= threshold) & np.where(perp_above[lo:hi], funding[lo:hi] > 0, funding[lo:hi] < 0)
+        return test
+
+    def order_event(leg: _Leg) -> Callable[[int, int], np.ndarray]:
+        side, price, _ = leg.order
+        away = leg.tick * params.move_order_threshold
+        column = (leg.bids if side == 'buy' else leg.asks) + q
+        if side == 'buy':
+            return lambda lo, hi: (data[lo:hi, leg.bids] < price) | (np.abs(data[lo:hi, column] - price) >= away)
+        return lambda lo, hi: (data[lo:hi, leg.asks] > price) | (np.abs(data[lo:hi, column] - price) >= away)
+
+    def fill(leg: _Leg, side: str, size: float, price: float, fee_rate: float) -> None:
+        nonlocal closed_pnl, fees, funding_pnl, fills
+        if leg.position is None:
+            leg.position = Position(leg.market, leg.type, side)
+        leg.position.apply_fill(side, size, price)
+        fees += fee_rate * size * price
+        fills += 1
+        if leg.position.size == 0.0:
+            closed_pnl += leg.position.total_pnl
+            funding_pnl += leg.position.funding_pnl
+            leg.position = None
+
+    # Return net delta in units, the leg on its side and that leg's stop price, which is bad_entry_cutoff % past its entry
+    def unhedged() -> Tuple[float, Optional[_Leg], float]:
+        net = sum(leg.position.size * leg.position.direction for leg in legs if leg.position)
+        if abs(net) < size_increment:
+            return net, None, 0.0
+        leg = next(leg for leg in legs if leg.position and leg.position.direction * net > 0)
+        return net, leg, leg.position.avg_entry_price * (1 - leg.position.direction * params.bad_entry_cutoff / 100)
+
+    i = 0
+    while True:
+        for leg in legs:
+            if leg.position:
+                leg.position.mark(mid(leg, i))
+
+        # Decisions at row i, in the order run() takes them
+        position_count = (spot.position is not None) + (perp.position is not None)
+        open_size = sum(leg.position.size * leg.position.avg_entry_price for leg in legs if leg.position)
+        at_max_size = open_size >= account_size or spot.fill_count + perp.fill_count == max_fills
+        if position_count == 2 and not unwinding:
+            unwinding = (perp.position.side == 'buy' and funding[i] > 0) or (perp.position.side == 'sell' and funding[i] < 0)
+        if unwinding and position_count == 0:
+            trades += 1
+            unwinding = False
+
+        threshold = params.basis_threshold if position_count == 0 else params.basis_threshold * params.margin_for_entry
+        waiting_for_entry = False
+        if not unwinding and not at_max_size:
+            for leg, other in ((spot, perp), (perp, spot)):
+                if leg.order or leg.fill_count > other.fill_count:
+                    continue
+                if not entry_condition(threshold)(i, i + 1)[0]:
+                    waiting_for_entry = True
+                    continue
+                if leg.position:
+                    side = leg.position.side
+                else:
+                    side = ('buy' if perp_above[i] else 'sell') if leg is spot else ('sell' if perp_above[i] else 'buy')
+                size = round(size_increment * round(account_size / params.orders_per_side / 2 / data[i, leg.last] / size_increment), 4)
+                price = quote(leg, side, i)
+                if size > 0 and not np.isnan(price):
+                    leg.order = [side, price, size]
+        elif unwinding:
+            for leg, other in ((spot, perp), (perp, spot)):
+                if leg.position and not leg.order and leg.fill_count >= other.fill_count:
+                    side = 'buy' if leg.position.side == 'sell' else 'sell'
+                    price = quote(leg, side, i)
+                    if not np.isnan(price):
+                        leg.order = [side, price, leg.position.size / leg.position.fill_count]
+
+        equity = closed_pnl - fees + sum(leg.position.total_pnl for leg in legs if leg.position)
+        peak = max(peak, equity)
+        max_drawdown = max(max_drawdown, peak - equity)
+
+        # Next event row, each scan stops at the earliest event found so far
+        start = i + 1
+        j = n
+        k = int(np.searchsorted(hours, start))
+        if perp.position and k < len(hours):
+            j = int(hours[k])
+        for leg in legs:
+            if leg.order:
+                j = _scan(start, j, order_event(leg))
+        if waiting_for_entry:
+            j = _scan(start, j, entry_condition(threshold))
+        if position_count == 2 and not unwinding:
+            if perp.position.side == 'buy':
+                j = _scan(start, j, lambda lo, hi: funding[lo:hi] > 0)
+            else:
+                j = _scan(start, j, lambda lo, hi: funding[lo:hi] < 0)
+
+        net, overweight, stop = unhedged()
+        if overweight:
+            sign, bids, asks = overweight.position.direction, data[:, overweight.bids], data[:, overweight.asks]
+            j = _scan(start, j, lambda lo, hi: sign * ((bids[lo:hi] + asks[lo:hi]) / 2 - stop) <= 0)
+
+        if position_count:
+            exposed_s += time[min(j, n - 1)] - time[i]
+        if j >= n:
+            break
+        i = j
+
+        # Events at row i
+        if perp.position and k < len(hours) and hours[k] == i:
+            perp.position.mark(mid(perp, i))
+            perp.position.accrue_funding(funding[i] / 100)
+        for leg in legs:
+            if not leg.order:
+                continue
+            side, price, size = leg.order
+            if (data[i, leg.bids] < price) if side == 'buy' else (data[i, leg.asks] > price):
+                leg.order = None
+                fill(leg, side, size, price, maker_fee)
+            else:
+                new_price = quote(leg, side, i)
+                if abs(new_price - price) >= leg.tick * params.move_order_threshold:
+                    leg.order[1] = new_price
+        net, overweight, stop = unhedged()
+        if overweight:
+            sign = overweight.position.direction
+            if sign * (mid(overweight, i) - stop) <= 0:
+                spot.order = perp.order = None
+                side = 'sell' if sign > 0 else 'buy'
+                size = min(abs(net), overweight.position.size)
+                size = round(round(size / size_increment) * size_increment, 8)
+                fill(overweight, side, size, data[i, overweight.bids if side == 'sell' else overweight.asks], taker_fee)
+                stops += 1
+
+    for leg in legs:
+        if leg.position:
+            leg.position.mark(mid(leg, n - 1))
+            funding_pnl += leg.position.funding_pnl
+    open_pnl = sum(leg.position.total_pnl for leg in legs if leg.position)
+    return {
+        'pnl': closed_pnl + open_pnl - fees,
+        'funding': funding_pnl,
+        'fees': fees,
+        'max_drawdown': max_drawdown,
+        'trades': trades,
+        'fills': fills,
+        'stops': stops,
+        'exposure': exposed_s / max(time[-1] - time[0], 1e-9),
+        'open_positions': sum(leg.position is not None for leg in legs),
+    }
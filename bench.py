@@ -0,0 +1,256 @@
+"""
+Benchmarks for the websocket, orderbook and strategy hot paths.
+
+    python bench.py                                 # run everything, print JSON
+    python bench.py --output bench.json             # save results
+    python bench.py --compare bench.json            # run and report changes against saved results
+    python bench.py --filter ws.                    # only cases whose name starts with ws.
+
+Inputs come from the synthetic feed in feedgen.py with a fixed seed, so runs are comparable.
+"""
+import gc
+import sys
+import json
+import time
+import argparse
+import platform
+import statistics
+from collections import defaultdict
+from typing import Callable, Dict, List, Tuple
+
+from ftx_ws import FtxWebsocketClient
+from feedgen import FeedGenerator, MarketSpec, prepare_client
+from orderbook import CHECKSUM_DEPTH
+from queue_position import QueuePositionEstimator
+from risk import RiskEngine
+from models import Instrument, Order, Position
+from venue import FtxVenue, TradeEvent
+from arb import pending_order_updates, compute_basis
+
+
+SEED = 7
+SPOT, PERP = 'GST/USD', 'GST-PERP'
+INSTRUMENTS = {SPOT: Instrument(SPOT, 0.0001, 0.1), PERP: Instrument(PERP, 0.0001, 0.1)}   # Increments of the feedgen.py defaults
+REGRESSION_THRESHOLD = 0.10                 # Relative slowdown in median time per op reported as a regression
+
+
+# -----------------------------------------------------------------
+# Synthetic inputs
+# -----------------------------------------------------------------
+
+# Return a partial and updates for one market at exchange depth, plus ticker and trades frames
+def market_frames(market: str, mid: float, updates: int, count: int) -> Tuple[str, List[str], List[str], List[str]]:
+    generator = FeedGenerator([MarketSpec(market, mid, depth=CHECKSUM_DEPTH)], seed=SEED)
+    partial = generator.orderbook_partial(market)
+    return (partial, [generator.orderbook_update(market) for _ in range(updates)],
+            [generator.ticker(market) for _ in range(count)], [generator.trades(market) for _ in range(count)])
+
+
+def order_update(order_id: int, market: str, status: str, msg_time: int) -> Dict:
+    return {'id': order_id, 'clientId': None, 'market': market, 'type': 'limit', 'side': 'buy', 'price': 1.0,
+            'size': 10.0, 'status': status, 'filledSize': 10.0 if status == 'closed' else 0.0,
+            'remainingSize': 0.0, 'reduceOnly': False, 'liquidation': False, 'avgFillPrice': 1.0,
+            'postOnly': False, 'ioc': False, 'createdAt': '2022-05-01T00:00:00+00:00', 'msg_time': msg_time}
+
+
+# Return a websocket client subscribed to markets without a connection, ready for messages to be fed in directly
+def offline_client(markets: List[str], book_depth=None) -> FtxWebsocketClient:
+    ws = FtxWebsocketClient(book_depth=book_depth)
+    prepare_client(ws, markets)
+    return ws
+
+
+# -----------------------------------------------------------------
+# Harness
+# -----------------------------------------------------------------
+
+# Run fn(i) for i in range(ops) in each of rounds timed rounds, return timing per op
+def measure(fn: Callable[[int], None], ops: int, rounds: int, setup: Callable[[], None] = None) -> Dict[str, float]:
+    per_op = []
+    for r in range(rounds + 1):
+        if setup:
+            setup()
+        gc.collect()
+        gc.disable()
+        try:
+            started = time.perf_counter_ns()
+            for i in range(ops):
+                fn(i)
+            elapsed = time.perf_counter_ns() - started
+        finally:
+            gc.enable()
+        if r:
+            per_op.append(elapsed / ops / 1000)
+    median = statistics.median(per_op)
+    return {
+        'ops': ops,
+        'rounds': rounds,
+        'median_us': round(median, 4),
+        'min_us': round(min(per_op), 4),
+        'max_us': round(max(per_op), 4),
+        'ops_per_s': round(1e6 / median, 1) if median else None,
+    }
+
+
+# Return True if the --filter prefix selects the case name, or some case under a group name ending in '.'
+def selected(prefix: str, name: str) -> bool:
+    return name.startswith(prefix) or (name.endswith('.') and prefix.startswith(name))
+
+
+# Cases are skipped, setup included, unless wanted(name) is True
+def bench_ws(results: Dict, rounds: int, wanted: Callable[[str], bool]) -> None:
+    if not (wanted('ws.') or wanted('venue.')):
+        return
+    partial, updates, tickers, trades = market_frames(SPOT, 1.5, 5000, 5000)
+
+    for label, depth in (('unbounded', None), ('bounded', 20)):
+        if not any(wanted(f'{case}.{label}') for case in ('ws.on_message.orderbook', 'ws.handle_orderbook_message', 'ws.get_orderbook')):
+            continue
+        ws = offline_client([SPOT], depth)
+
+        def reset():
+            ws._on_message(None, partial)
+        if wanted(f'ws.on_message.orderbook.{label}'):
+            results[f'ws.on_message.orderbook.{label}'] = measure(
+                lambda i: ws._on_message(None, updates[i]), len(updates), rounds, reset)
+
+        if wanted(f'ws.handle_orderbook_message.{label}'):
+            decoded = [json.loads(m) for m in updates]
+            results[f'ws.handle_orderbook_message.{label}'] = measure(
+                lambda i: ws._handle_orderbook_message(decoded[i]), len(decoded), rounds, reset)
+
+        if wanted(f'ws.get_orderbook.{label}'):
+            reset()
+            results[f'ws.get_orderbook.{label}'] = measure(lambda i: ws.get_orderbook(SPOT), 2000, rounds)
+
+    # Book events as the strategy runs them, over a bounded book
+    if wanted('venue.'):
+        ws = offline_client([SPOT], 20)
+        venue = FtxVenue(ws, None)
+        venue.set_instruments(INSTRUMENTS)
+
+        def reset():
+            ws._on_message(None, partial)
+        if wanted('venue.on_message.orderbook'):
+            results['venue.on_message.orderbook'] = measure(lambda i: ws._on_message(None, updates[i]), len(updates), rounds, reset)
+        if wanted('venue.book'):
+            reset()
+            results['venue.book'] = measure(lambda i: venue.book(SPOT), 2000, rounds)
+
+    ws = offline_client([SPOT])
+    if wanted('ws.on_message.ticker'):
+        results['ws.on_message.ticker'] = measure(lambda i: ws._on_message(None, tickers[i]), len(tickers), rounds)
+    if wanted('ws.on_message.trades'):
+        results['ws.on_message.trades'] = measure(lambda i: ws._on_message(None, trades[i]), len(trades), rounds)
+
+
+def bench_strategy(results: Dict, rounds: int, wanted: Callable[[str], bool]) -> None:
+
+    # Order update scan over a history of already actioned orders, with one fresh update per iteration
+    for history in (10, 1000, 100000):
+        if not wanted(f'strategy.order_updates.{history}'):
+            continue
+        venue = FtxVenue(offline_client([SPOT, PERP]), None)
+        last_update_time = defaultdict(int)
+        for i in range(history):
+            venue._on_order(order_update(i, SPOT if i % 2 else PERP, 'closed', i + 1))
+            last_update_time[i] = i + 1
+        venue.orders()
+
+        def step(i):
+            venue._on_order(order_update(history, SPOT, 'new', time.time_ns()))
+            order_updates = venue.orders()
+            for oId in pending_order_updates(order_updates, last_update_time):
+                last_update_time[oId] = order_updates[oId].msg_time
+        results[f'strategy.order_updates.{history}'] = measure(step, 200 if history > 10000 else 2000, rounds)
+
+    if not any(wanted(name) for name in ('strategy.basis', 'strategy.order_follow', 'risk.')):
+        return
+    ws = offline_client([SPOT, PERP])
+    venue = FtxVenue(ws, None)
+    venue.set_instruments(INSTRUMENTS)
+    for market, mid in ((SPOT, 1.5), (PERP, 1.503)):
+        ws._on_message(None, market_frames(market, mid, 0, 0)[0])
+
+    def basis(i):
+        ob_spot, ob_perp = venue.book(SPOT), venue.book(PERP)
+        spot, perp = ob_spot.instrument, ob_perp.instrument
+        compute_basis(spot.price(ob_spot.bids[0][0]), spot.price(ob_spot.asks[0][0]), perp.price(ob_perp.bids[0][0]),
+                      perp.price(ob_perp.asks[0][0]), 1.5, 1.503)
+    if wanted('strategy.basis'):
+        results['strategy.basis'] = measure(basis, 2000, rounds)
+
+    # Queue position tracking and the reprice decision for one working order per market
+    queue = QueuePositionEstimator()
+    for oId, market in enumerate((SPOT, PERP)):
+        level = venue.book(market).bids[3]
+        queue.track(Order(oId, market, 'buy', 'limit', INSTRUMENTS[market].price(level[0]), 10.0), venue.book(market))
+    trades = [TradeEvent(i, SPOT, 15000, 10, 'sell', 0.0) for i in range(1, 10001)]
+
+    def order_follow(i):
+        for oId, market in enumerate((SPOT, PERP)):
+            book = venue.book(market)
+            queue.on_trades(market, trades[max(i - 5, 0):i + 1])
+            queue.on_book(book)
+            queue.should_reprice(oId, book.bids[1][0], 2, book, 20)
+    if wanted('strategy.order_follow'):
+        results['strategy.order_follow'] = measure(order_follow, 2000, rounds)
+
+    # Vectorized stop and exposure evaluation per tick
+    if not wanted('risk.on_orderbook'):
+        return
+    risk = RiskEngine({SPOT: 'GST', PERP: 'GST'}, 2, 50, 0.1, lambda action: None)
+    position = Position(SPOT, 'spot', 'buy')
+    position.apply_fill('buy', 10.0, 1.5)
+    risk.update_positions({SPOT: position})
+    book = venue.book(SPOT)
+    results['risk.on_orderbook'] = measure(lambda i: risk.on_orderbook(book), 5000, rounds)
+
+
+def compare(current: Dict, baseline: Dict) -> List[str]:
+    lines = []
+    for name, result in current['results'].items():
+        old = baseline['results'].get(name)
+        if not old:
+            lines.append(f"{name:<45} new")
+            continue
+        change = result['median_us'] / old['median_us'] - 1
+        flag = 'REGRESSION' if change > REGRESSION_THRESHOLD else ''
+        lines.append(f"{name:<45} {old['median_us']:>10.3f} -> {result['median_us']:>10.3f} us  {change:+7.1%}  {flag}")
+    return lines
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='Benchmark websocket, orderbook and strategy hot paths.')
+    parser.add_argument('--output', help='Write results JSON to this file')
+    parser.add_argument('--compare', help='Compare against results JSON from an earlier run')
+    parser.add_argument('--filter', default='', help='Only run cases whose name starts with this prefix')
+    parser.add_argument('--rounds', type=int, default=5, help='Timed rounds per case')
+    args = parser.parse_args()
+
+    results = {}
+    for group in (bench_ws, bench_strategy):
+        group(results, args.rounds, lambda name: selected(args.filter, name))
+    output = {
+        'meta': {
+            'python': sys.version.split()[0],
+            'implementation': platform.python_implementation(),
+            'platform': platform.platform(),
+            'seed': SEED,
+            'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        },
+        'results': results,
+    }
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(output, f, indent=2)
+    if args.compare:
+        with open(args.compare) as f:
+            print('\n'.join(compare(output, json.load(f))))
+    else:
+        print(json.dumps(output, indent=2))
+
+
+if __name__ == '__main__':
+    main()
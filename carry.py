@@ -0,0 +1,233 @@
+"""
+Hourly funding and borrow history for every perpetual, kept as perps-by-hours matrices and ranked by carry.
+
+    python carry.py --sync                  # fetch hours newer than the store, then print the ranking
+    python carry.py --window 168 --top 10   # rank on the last week of stored hours without fetching
+"""
+import os
+import time
+import logging
+import argparse
+import warnings
+import tempfile
+from pathlib import Path
+from typing import Callable, Dict, List, NamedTuple, Optional
+
+import numpy as np
+from ciso8601 import parse_datetime
+
+
+HOURS_PER_YEAR = 8760
+BACKFILL_H = 720                            # Hours fetched for a perp or coin seen for the first time
+MAX_HISTORY_H = 24 * 365                    # Oldest hours are dropped beyond this
+PAGE_SIZE = 500                             # Records returned by one funding or borrow history request
+
+
+class CarryRank(NamedTuple):
+    market: str
+    coin: str
+    hours: int                              # Hours with a funding rate in the window
+    mean_rate: float                        # Mean hourly funding, percent
+    volatility: float                       # Standard deviation of hourly funding, percent
+    persistence: float                      # Share of hours funding had the sign of mean_rate
+    funding_apr: float                      # |mean_rate| annualized, percent
+    borrow_apr: float                       # Mean borrow rate annualized, percent. Only paid when funding is negative, the spot leg is then short
+    net_apr: float                          # funding_apr less borrow_apr where borrow is paid
+
+
+def _hour(timestamp: str) -> int:
+    return int(parse_datetime(timestamp).timestamp()) // 3600
+
+
+# Return every record of a time ranged history endpoint between start and end, paging backwards from end
+# while full pages come back
+def fetch_pages(fetch: Callable[[float, float], List[dict]], start: float, end: float) -> List[dict]:
+    records = []
+    while start <= end:
+        page = fetch(start, end)
+        records.extend(page)
+        if len(page) < PAGE_SIZE:
+            break
+        end = min(parse_datetime(r['time']).timestamp() for r in page) - 1
+    return records
+
+
+class CarryStore:
+    """
+    Funding (perp by hour) and borrow (coin by hour) rates in percent, NaN where no rate is known,
+    with column k holding hour start_hour + k. Synced incrementally: the latest funding for all perps
+    comes from one get_all_funding_rates call, and only gaps between it and the last stored hour
+    of a perp are fetched per market. Borrow rates come from get_borrow_history, which only covers
+    hours the account borrowed, so the ranking falls back to current estimates from get_borrow_rates.
+    Rankings are computed for every perp at once over the trailing window and cached until the
+    next sync.
+    """
+
+    def __init__(self, path: str, max_history_h: int = MAX_HISTORY_H) -> None:
+        self._path = Path(path)
+        self._max_history_h = max_history_h
+        self.perps: List[str] = []
+        self.coins: List[str] = []
+        self.start_hour = int(time.time()) // 3600
+        self.funding = np.full((0, 0), np.nan)
+        self.borrow = np.full((0, 0), np.nan)
+        self.borrow_estimates: Dict[str, float] = {}
+        self._rankings: Dict[int, List[CarryRank]] = {}
+        if self._path.exists():
+            self.load()
+
+    def load(self) -> None:
+        with np.load(self._path) as f:
+            self.perps, self.coins = [str(p) for p in f['perps']], [str(c) for c in f['coins']]
+            self.start_hour = int(f['start_hour'])
+            self.funding, self.borrow = f['funding'], f['borrow']
+            self.borrow_estimates = dict(zip(self.coins, f['borrow_estimates']))
+        self._rankings.clear()
+
+    def save(self) -> None:
+        self._path.parent.mkdir(parents=True, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=self._path.parent, suffix='.npz')
+        with os.fdopen(fd, 'wb') as f:
+            np.savez(f, perps=np.array(self.perps, dtype=str), coins=np.array(self.coins, dtype=str),
+                     start_hour=self.start_hour, funding=self.funding, borrow=self.borrow,
+                     borrow_estimates=np.array([self.borrow_estimates.get(c, np.nan) for c in self.coins]))
+        os.replace(tmp_path, self._path)
+
+    # Return the last hour with a rate in each row, -1 for rows with none
+    @staticmethod
+    def _last_hours(matrix: np.ndarray, start_hour: int) -> np.ndarray:
+        known = ~np.isnan(matrix)
+        if not matrix.shape[1]:
+            return np.full(len(matrix), -1)
+        last = matrix.shape[1] - 1 - np.argmax(known[:, ::-1], axis=1)
+        return np.where(known.any(axis=1), start_hour + last, -1)
+
+    # Grow both matrices to cover through hour and to hold the given rows, then drop hours past the history limit
+    def _extend(self, hour: int, perps: List[str], coins: List[str]) -> None:
+        new_perps = [p for p in perps if p not in self.perps]
+        new_coins = [c for c in coins if c not in self.coins]
+        hours = max(hour + 1 - self.start_hour, self.funding.shape[1])
+        if new_perps or new_coins or hours > self.funding.shape[1]:
+            funding = np.full((len(self.perps) + len(new_perps), hours), np.nan)
+            funding[:len(self.perps), :self.funding.shape[1]] = self.funding
+            borrow = np.full((len(self.coins) + len(new_coins), hours), np.nan)
+            borrow[:len(self.coins), :self.borrow.shape[1]] = self.borrow
+            self.funding, self.borrow = funding, borrow
+            self.perps, self.coins = self.perps + new_perps, self.coins + new_coins
+        excess = self.funding.shape[1] - self._max_history_h
+        if excess > 0:
+            self.funding, self.borrow = self.funding[:, excess:], self.borrow[:, excess:]
+            self.start_hour += excess
+
+    def _insert(self, matrix: np.ndarray, names: List[str], records: List[dict], name_key: str, rate_key: str) -> None:
+        index = {n: i for i, n in enumerate(names)}
+        rows, columns, rates = [], [], []
+        for r in records:
+            column = _hour(r['time']) - self.start_hour
+            if r[name_key] in index and 0 <= column < matrix.shape[1]:
+                rows.append(index[r[name_key]])
+                columns.append(column)
+                rates.append(float(r[rate_key]) * 100)
+        matrix[rows, columns] = rates
+
+    # Fetch funding and borrow hours newer than those stored, then save. Return the number of records fetched.
+    def sync(self, rest) -> int:
+        now_hour = int(time.time()) // 3600
+        if not self.perps:
+            self.start_hour = now_hour - BACKFILL_H
+        recent = [r for r in rest.get_all_funding_rates() if r['future'].endswith('-PERP')]
+        perps = sorted({r['future'] for r in recent})
+        coins = sorted({p.split('-')[0] for p in perps})
+        last_funding = dict(zip(self.perps, self._last_hours(self.funding, self.start_hour)))
+        last_borrow = self._last_hours(self.borrow, self.start_hour)
+        last_borrow = max(last_borrow.max() if len(last_borrow) else -1, now_hour - BACKFILL_H - 1)
+        self._extend(now_hour, perps, coins)
+
+        # Only the gap between a perp's last stored hour and its oldest hour in the bulk response is fetched
+        oldest_recent = {}
+        for r in recent:
+            oldest_recent[r['future']] = min(oldest_recent.get(r['future'], now_hour), _hour(r['time']))
+        records = list(recent)
+        for perp in perps:
+            first = max(last_funding.get(perp, -1), self.start_hour - 1) + 1
+            if first < oldest_recent[perp]:
+                records += fetch_pages(lambda s, e: rest.get_funding_rates(perp, s, e), first * 3600, oldest_recent[perp] * 3600 - 1)
+        self._insert(self.funding, self.perps, records, 'future', 'rate')
+
+        borrows = fetch_pages(rest.get_borrow_history, (last_borrow + 1) * 3600, time.time())
+        self._insert(self.borrow, self.coins, borrows, 'coin', 'rate')
+        try:
+            self.borrow_estimates.update({b['coin']: float(b['estimate']) * 100 for b in rest.get_borrow_rates()})
+        except Exception as e:
+            logging.getLogger().info(f"Borrow estimates unavailable: {e}")
+
+        self._rankings.clear()
+        self.save()
+        return len(records) + len(borrows)
+
+    # Return every perp ranked by net APR over the trailing window_h stored hours, best first
+    def rank(self, window_h: int = 168) -> List[CarryRank]:
+        if window_h in self._rankings:
+            return self._rankings[window_h]
+        funding = self.funding[:, -window_h:]
+        coin_index = {c: i for i, c in enumerate(self.coins)}
+        borrow_rows = np.array([coin_index.get(p.split('-')[0], -1) for p in self.perps], dtype=np.int64)
+
+        hours = np.sum(~np.isnan(funding), axis=1)
+        with np.errstate(invalid='ignore', divide='ignore'), warnings.catch_warnings():
+            # All NaN rows are expected, perps listed after the window started and coins never borrowed
+            warnings.simplefilter('ignore', RuntimeWarning)
+            mean = np.nanmean(funding, axis=1)
+            volatility = np.nanstd(funding, axis=1)
+            persistence = np.sum(np.sign(funding) == np.sign(mean)[:, None], axis=1) / hours
+            borrow_mean = np.nanmean(self.borrow[:, -window_h:], axis=1)
+        estimates = np.array([self.borrow_estimates.get(c, np.nan) for c in self.coins])
+        # Perps without a spot coin index the trailing NaN
+        borrow = np.append(np.where(np.isnan(borrow_mean), estimates, borrow_mean), np.nan)[borrow_rows]
+
+        funding_apr = np.abs(mean) * HOURS_PER_YEAR
+        borrow_apr = borrow * HOURS_PER_YEAR
+        # Positive funding is earned short perp and long spot, negative funding needs the spot leg borrowed
+        net_apr = np.where(mean >= 0, funding_apr, funding_apr - borrow_apr)
+
+        order = np.lexsort((-funding_apr, -np.nan_to_num(net_apr, nan=-np.inf)))
+        ranking = [CarryRank(self.perps[i], self.perps[i].split('-')[0], int(hours[i]), float(mean[i]), float(volatility[i]),
+                             float(persistence[i]), float(funding_apr[i]), float(borrow_apr[i]), float(net_apr[i]))
+                   for i in order if hours[i]]
+        self._rankings[window_h] = ranking
+        return ranking
+
+    # Return the best ranked perp with at least min_hours of funding and min_persistence, or None
+    def best(self, window_h: int = 168, min_hours: int = 24, min_persistence: float = 0.0) -> Optional[CarryRank]:
+        for r in self.rank(window_h):
+            if r.hours >= min_hours and r.persistence >= min_persistence:
+                return r
+        return None
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='Rank perpetuals by funding carry net of borrow.')
+    parser.add_argument('--path', default='cache/carry.npz')
+    parser.add_argument('--sync', action='store_true', help='Fetch new funding and borrow history before ranking')
+    parser.add_argument('--window', type=int, default=168, help='Trailing hours to rank on')
+    parser.add_argument('--top', type=int, default=20)
+    args = parser.parse_args()
+
+    store = CarryStore(args.path)
+    if args.sync:
+        from ftx_rest import FtxRestClient
+        rest = FtxRestClient(os.environ.get('BASIS_API_KEY_FTX'), os.environ.get('BASIS_API_SECRET_FTX'))
+        started = time.perf_counter()
+        added = store.sync(rest)
+        print(f"Synced {added} records in {time.perf_counter() - started:.1f}s")
+    started = time.perf_counter()
+    ranking = store.rank(args.window)
+    print(f"Ranked {len(ranking)} perps over {args.window}h in {(time.perf_counter() - started) * 1000:.1f}ms")
+    print(f"{'market':<14} {'hours':>5} {'mean %/h':>10} {'vol %/h':>10} {'persist':>7} {'fund APR':>9} {'borrow APR':>10} {'net APR':>9}")
+    for r in ranking[:args.top]:
+        print(f"{r.market:<14} {r.hours:>5} {r.mean_rate:>10.5f} {r.volatility:>10.5f} {r.persistence:>7.1%} "
+              f"{r.funding_apr:>9.2f} {r.borrow_apr:>10.2f} {r.net_apr:>9.2f}")
+
+
+if __name__ == '__main__':
+    main()
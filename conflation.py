@@ -0,0 +1,109 @@
+import time
+from threading import Condition
+from typing import Dict, List, Optional
+
+from models import Order
+from venue import BookEvent, TickerEvent
+
+
+DIRTY_ORDERBOOK = 1
+DIRTY_TICKER = 2
+
+
+class MarketUpdate:
+    __slots__ = ('market', 'orderbook', 'ticker', 'dirty', 'conflated', 'updated_at')
+
+    def __init__(self, market: str) -> None:
+        self.market = market
+        self.orderbook: Optional[BookEvent] = None
+        self.ticker: Optional[TickerEvent] = None
+        self.dirty = 0
+        self.conflated = 0
+        self.updated_at = 0.0
+
+    def __repr__(self) -> str:
+        return f"MarketUpdate({self.market}, dirty={self.dirty}, conflated={self.conflated})"
+
+
+class Conflator:
+    """
+    Collapses any number of book and ticker updates per market into the latest state plus dirty
+    flags, and hands the strategy one batch at a time. A batch is released at most once per
+    min_interval_s however fast the feed runs, ordered by market priority (highest first).
+    Markets with a negative priority never wake the strategy on their own and are only delivered
+    alongside the next batch.
+    """
+
+    def __init__(self, min_interval_s: float = 0.0, priorities: Dict[str, int] = None) -> None:
+        self._min_interval_s = min_interval_s
+        self._priorities = priorities or {}
+        self._cond = Condition()
+        self._latest: Dict[str, MarketUpdate] = {}
+        self._dirty: Dict[str, MarketUpdate] = {}
+        self._wake = False
+        self._last_batch_at = 0.0
+        self.updates_received = 0
+        self.batches_released = 0
+
+    def _mark(self, market: str, flag: int, orderbook=None, ticker=None) -> None:
+        with self._cond:
+            update = self._latest.get(market)
+            if update is None:
+                update = self._latest[market] = MarketUpdate(market)
+            if orderbook is not None:
+                update.orderbook = orderbook
+            if ticker is not None:
+                update.ticker = ticker
+            if update.dirty:
+                update.conflated += 1
+            update.dirty |= flag
+            update.updated_at = time.time()
+            self._dirty[market] = update
+            self.updates_received += 1
+            if self._priorities.get(market, 0) >= 0:
+                self._wake = True
+                self._cond.notify()
+
+    def on_orderbook(self, book: BookEvent) -> None:
+        self._mark(book.market, DIRTY_ORDERBOOK, orderbook=book)
+
+    def on_ticker(self, ticker: TickerEvent) -> None:
+        self._mark(ticker.market, DIRTY_TICKER, ticker=ticker)
+
+    # Order updates carry no market state to conflate, they only wake the strategy
+    def on_order(self, order: Order) -> None:
+        with self._cond:
+            self.updates_received += 1
+            self._wake = True
+            self._cond.notify()
+
+    def latest(self, market: str) -> Optional[MarketUpdate]:
+        return self._latest.get(market)
+
+    # Block until a batch is due or timeout passes, then return the dirty markets (possibly none)
+    # by priority and clear their flags. The returned updates are copies, safe to read while the feed runs.
+    def wait(self, timeout: float) -> List[MarketUpdate]:
+        deadline = time.time() + timeout
+        with self._cond:
+            while True:
+                now = time.time()
+                due = self._last_batch_at + self._min_interval_s
+                if self._wake and now >= due:
+                    break
+                if now >= deadline:
+                    break
+                self._cond.wait(min(deadline, due if self._wake else deadline) - now)
+
+            batch = []
+            for update in self._dirty.values():
+                copy = MarketUpdate(update.market)
+                copy.orderbook, copy.ticker, copy.dirty = update.orderbook, update.ticker, update.dirty
+                copy.conflated, copy.updated_at = update.conflated, update.updated_at
+                batch.append(copy)
+                update.dirty, update.conflated = 0, 0
+            self._dirty.clear()
+            self._wake = False
+            self._last_batch_at = time.time()
+            self.batches_released += 1
+        batch.sort(key=lambda u: -self._priorities.get(u.market, 0))
+        return batch
@@ -0,0 +1,127 @@
+import os
+import sys
+import time
+import logging
+from collections import deque
+from datetime import datetime
+from threading import Event, Lock, Thread
+from typing import Callable, Deque, List, Optional, TextIO
+
+
+class Dashboard:
+    """
+    Terminal view of strategy state, drawn from its own thread so console I/O never runs on the
+    strategy thread. render() is sampled fps times a second and only the changed part of each
+    changed line is rewritten. Strategy events go to a scrolling pane below it through event().
+
+    When output is not a terminal, or interactive is False, nothing is drawn, events are printed as
+    plain lines prefixed with label if one is set, also from the dashboard thread, and the rendered
+    state is only logged. The rendered state is logged whenever it changed, at most
+    once per log_interval_s.
+
+    With exit_key set, the key is polled on the dashboard thread and a press is latched until
+    the strategy collects it with pop_exit_request().
+    """
+
+    def __init__(self, render: Callable[[], List[str]], fps: float = 4, exit_key: Optional[str] = None,
+                 event_lines: int = 10, log_interval_s: float = 5, output: TextIO = None,
+                 interactive: Optional[bool] = None, label: Optional[str] = None) -> None:
+        self._render = render
+        self._interval_s = 1 / fps
+        self._exit_key = exit_key
+        self._is_pressed = None
+        if exit_key:
+            import keyboard
+            self._is_pressed = keyboard.is_pressed
+        self._exit_requested = Event()
+        self._events: Deque[str] = deque(maxlen=event_lines)
+        self._unprinted: List[str] = []                 # Events not yet printed when output is not a terminal
+        self._events_lock = Lock()
+        self._log_interval_s = log_interval_s
+        self._logged_at = 0.0
+        self._logged_state: List[str] = []
+        self._output = output or sys.stdout
+        self._interactive = self._output.isatty() if interactive is None else interactive
+        self._prefix = f"{label} | " if label else ''
+        self._screen: List[str] = []
+        self._stop = Event()
+        self._thread = Thread(target=self._run, daemon=True)
+
+    def start(self) -> None:
+        if self._interactive:
+            if os.name == 'nt':
+                # Switches the Windows console into ANSI escape sequence mode
+                os.system('')
+            self._output.write('\x1b[2J\x1b[H\x1b[?25l')
+            self._output.flush()
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread.is_alive():
+            self._thread.join()
+        self._print_events()
+        if self._interactive:
+            self._output.write(f'\x1b[{len(self._screen) + 1};1H\x1b[?25h\n')
+            self._output.flush()
+
+    def event(self, *parts) -> None:
+        message = ' '.join(str(p) for p in parts).strip().replace('\n', ' ')
+        with self._events_lock:
+            self._events.append(f"{datetime.now():%H:%M:%S}  {message}")
+            if not self._interactive:
+                self._unprinted.append(self._prefix + message + '\n')
+
+    def _print_events(self) -> None:
+        with self._events_lock:
+            lines, self._unprinted = self._unprinted, []
+        if lines:
+            self._output.write(''.join(lines))
+            self._output.flush()
+
+    def pop_exit_request(self) -> bool:
+        requested = self._exit_requested.is_set()
+        self._exit_requested.clear()
+        return requested
+
+    def _run(self) -> None:
+        while not self._stop.is_set():
+            started = time.perf_counter()
+            if self._is_pressed and self._is_pressed(self._exit_key):
+                self._exit_requested.set()
+            try:
+                state = self._render()
+            except Exception as e:
+                state = [f"Render failed: {e!r}"]
+            if self._interactive:
+                with self._events_lock:
+                    events = list(self._events)
+                self._draw(state + ['', 'Events:'] + events)
+            else:
+                self._print_events()
+            if state != self._logged_state and time.time() - self._logged_at >= self._log_interval_s:
+                logger = logging.getLogger()
+                for line in state:
+                    logger.info(line)
+                self._logged_state, self._logged_at = state, time.time()
+            self._stop.wait(max(self._interval_s - (time.perf_counter() - started), 0))
+
+    # Rewrite each line from its first changed character and clear what is left of the old one
+    def _draw(self, lines: List[str]) -> None:
+        out = []
+        for row, line in enumerate(lines):
+            old = self._screen[row] if row < len(self._screen) else ''
+            if line == old:
+                continue
+            column = 0
+            for a, b in zip(line, old):
+                if a != b:
+                    break
+                column += 1
+            out.append(f'\x1b[{row + 1};{column + 1}H{line[column:]}\x1b[K')
+        for row in range(len(lines), len(self._screen)):
+            out.append(f'\x1b[{row + 1};1H\x1b[K')
+        if out:
+            self._output.write(''.join(out))
+            self._output.flush()
+        self._screen = lines
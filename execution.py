@@ -0,0 +1,142 @@
+import logging
+from concurrent.futures import Future
+from typing import Container, Dict, List, NamedTuple, Tuple
+
+from models import Order, Position, StrategyParams
+
+
+class ChildOrder(NamedTuple):
+    market: str
+    side: str
+    size: int                               # Lots
+    price: int                              # Ticks
+
+
+class ExecutionEngine:
+    """
+    Works a signed target position per leg, in steps of the size increment common to both legs,
+    with up to max_children child limit orders at the quote level at once. Each child is sized
+    from the visible size at its price, depth_fraction of it but at least one step, and at most
+    the larger of target and position over orders_per_side, so an exit is worked in as many
+    children as the entry. A leg's position plus its working children may only lead the other
+    leg's position by max_lead steps, so working both legs concurrently never leaves more
+    unhedged than that if one side fills first.
+
+    While inactive no new exposure is added, but a leg behind the other is still worked up to
+    the other leg's size. Children working against the current target are cancelled.
+    """
+
+    def __init__(self, venue, legs: Tuple[str, str], step_lots: Dict[str, int], max_children: int,
+                 depth_fraction: float) -> None:
+        self._venue = venue
+        self._legs = legs
+        self._step_lots = step_lots
+        self._max_children = max_children
+        self._depth_fraction = depth_fraction
+        self._targets: Dict[str, int] = {m: 0 for m in legs}
+        self._scale: Dict[str, int] = {m: 0 for m in legs}      # Largest of target and position since targets were set
+        self._pending: List[Tuple[Future, str, int]] = []
+        self._cancelling = set()
+
+    @property
+    def targets(self) -> Dict[str, int]:
+        return dict(self._targets)
+
+    # Set signed targets in steps, positive long
+    def set_targets(self, targets: Dict[str, int]) -> None:
+        self._targets.update(targets)
+        for market, steps in targets.items():
+            self._scale[market] = abs(steps)
+
+    def _steps(self, market: str, size: float) -> int:
+        return round(self._venue.instrument(market).lots(size) / self._step_lots[market])
+
+    # Return the signed position of every leg in steps
+    def positions(self, positions: Dict[str, Position]) -> Dict[str, int]:
+        return {m: self._steps(m, positions[m].size) * positions[m].direction if m in positions else 0 for m in self._legs}
+
+    def at_target(self, positions: Dict[str, Position]) -> bool:
+        return self.positions(positions) == self._targets
+
+    # Return signed steps working per leg, from open orders and placements not yet seen as order updates, and the
+    # open children per leg
+    def _working(self, orders: Dict[int, Order], processed: Container[int]) -> Tuple[Dict[str, int], Dict[str, List[Order]]]:
+        working = {m: 0 for m in self._legs}
+        children = {m: [] for m in self._legs}
+        for o in orders.values():
+            if o.market in working and o.id not in self._cancelling:
+                working[o.market] += self._steps(o.market, o.remaining_size) * (1 if o.side == 'buy' else -1)
+                children[o.market].append(o)
+        pending = []
+        for future, market, steps in self._pending:
+            if future.done():
+                error = future.exception()
+                if error is not None:
+                    logging.getLogger().info(f"Child order on {market} failed: {error}")
+                    continue
+                if future.result()['id'] in processed:
+                    continue
+            working[market] += steps
+            pending.append((future, market, steps))
+        self._pending = pending
+        self._cancelling.intersection_update(orders)
+        return working, children
+
+    # Place and cancel children towards the targets. Return the children placed.
+    def step(self, positions: Dict[str, Position], orders: Dict[int, Order], processed: Container[int],
+             params: StrategyParams, active: bool, max_lead: int) -> List[ChildOrder]:
+        current = self.positions(positions)
+        working, children = self._working(orders, processed)
+        placed = []
+        for market, other in (self._legs, self._legs[::-1]):
+            target = self._targets[market]
+            gap = target - current[market]
+            self._scale[market] = max(self._scale[market], abs(current[market]))
+
+            # Children working against the target, such as entry children once unwinding, are cancelled
+            for o in children[market]:
+                sign = 1 if o.side == 'buy' else -1
+                if not gap or sign != (1 if gap > 0 else -1):
+                    self._cancelling.add(o.id)
+                    self._venue.cancel_order(o.id)
+                    working[market] -= self._steps(market, o.remaining_size) * sign
+            children[market] = [o for o in children[market] if o.id not in self._cancelling]
+
+            # While inactive a leg only catches up with the other leg
+            if not active and abs(target) > abs(current[market]):
+                target = (1 if target > 0 else -1) * min(abs(target), max(abs(current[market]), abs(current[other])))
+            need = target - current[market] - working[market]
+            if not need or need * gap < 0:
+                continue
+            direction = 1 if need > 0 else -1
+
+            # A leg may lead the other leg's position by max_lead steps, adding or reducing
+            projected = abs(current[market] + working[market])
+            if abs(target) > abs(current[market]):
+                room = max_lead + abs(current[other]) - projected
+            else:
+                room = max_lead + projected - abs(current[other])
+            remaining = min(abs(need), room)
+            count = len(children[market]) + len([p for p in self._pending if p[1] == market])
+
+            side = 'buy' if direction > 0 else 'sell'
+            book = self._venue.book(market)
+            levels = book.bids if side == 'buy' else book.asks
+            if not levels:
+                continue
+            price, visible = levels[min(params.quote_index, len(levels) - 1)]
+            largest = max(-(-self._scale[market] // params.orders_per_side), 1)
+            child = min(max(int(visible * self._depth_fraction) // self._step_lots[market], 1), largest, max(max_lead, 1))
+            while remaining > 0 and count < self._max_children:
+                steps = min(child, remaining)
+
+                # Room left under the lead cap is used once it fits a whole child, or finishes the leg
+                if steps < child and steps < abs(need):
+                    break
+                size = steps * self._step_lots[market]
+                future = self._venue.place_order(market, side, price, size)
+                self._pending.append((future, market, steps * direction))
+                placed.append(ChildOrder(market, side, size, price))
+                remaining -= steps
+                count += 1
+        return placed
@@ -0,0 +1,439 @@
+"""
+Synthetic FTX websocket feed for load and stress testing.
+
+    python feedgen.py --count 1000000                                   # measure generation rate
+    python feedgen.py --count 1000000 --output frames.txt               # record frames to a file
+    python feedgen.py --replay frames.txt                               # measure FtxWebsocketClient throughput
+    python feedgen.py --replay frames.txt --speed 10                    # replay at 10x the recorded feed rate
+    python feedgen.py --market BTC-PERP:30000:1 --market ETH-PERP:2000:0.1 --book-rate 50000 --count 500000
+
+Orderbook partials and updates carry correct checksums, so the client accepts them exactly as it
+would the exchange feed. Recorded frames are one per line, the feed time followed by a space and the raw frame.
+
+Neither path reaches 100k msg/s in one process. Measured on one core with CPython 3.11 and the default
+markets, generation runs at 40-55k msg/s, bound by the book simulation rather than frame formatting.
+Replay runs at about 37k msg/s, or 40k with --book-depth 20. Replay is bound by the client's own
+work per frame: JSON decoding, the book update and the checksum take about 25us. The replay loop
+itself delivers several million frames per second to a client that does nothing. Higher rates need
+several processes, each replaying its own recording.
+"""
+import json
+import time
+import zlib
+import heapq
+import random
+import argparse
+from bisect import bisect_left
+from math import log
+from datetime import datetime, timezone
+from typing import Dict, Iterator, List, NamedTuple, Optional, Tuple
+
+from models import increment_decimals
+from orderbook import CHECKSUM_DEPTH
+
+
+SIZE_POOL = 4096                    # Level and trade sizes are drawn from a pool of this many, with their texts precomputed
+
+
+class MarketSpec(NamedTuple):
+    market: str
+    mid: float
+    tick: float = 0.0001
+    spread_ticks: int = 1
+    depth: int = 50                 # Levels per side, at most CHECKSUM_DEPTH like the exchange feed
+    level_size: float = 100.0       # Mean size per level
+    volatility: float = 0.5         # Standard deviation of the mid in ticks per book update
+    reversion: float = 0.0          # Fraction of the distance back to the starting mid recovered per book update
+    book_rate: float = 1000.0       # Messages per second for each channel
+    ticker_rate: float = 100.0
+    trade_rate: float = 200.0
+    order_rate: float = 0.0         # Order and fill messages for our own synthetic orders
+
+
+class _Side:
+    """
+    One side of a synthetic book in integer ticks, held as parallel lists sorted best first
+    (bid keys are negated ticks). Each level keeps its checksum text, so the checksum is a
+    slice and a join with no float formatting per message.
+    """
+    __slots__ = ('sign', 'keys', 'sizes', 'texts')
+
+    def __init__(self, sign: int) -> None:
+        self.sign = sign
+        self.keys: List[int] = []
+        self.sizes: List[float] = []
+        self.texts: List[str] = []
+
+
+class _Market:
+    __slots__ = ('spec', 'quoted', 'decimals', 'mid', 'bids', 'asks', 'price_texts', 'sizes', 'size_texts', 'open_orders')
+
+    def __init__(self, spec: MarketSpec, rng: random.Random) -> None:
+        self.spec = spec
+        self.quoted = json.dumps(spec.market)
+        self.decimals = increment_decimals(spec.tick)
+        self.mid = spec.mid / spec.tick
+        self.bids, self.asks = _Side(-1), _Side(1)
+        self.price_texts: Dict[int, str] = {}
+        self.sizes = [max(round(rng.expovariate(1 / spec.level_size), 1), 0.1) for _ in range(SIZE_POOL)]
+        self.size_texts = [repr(size) for size in self.sizes]
+        self.open_orders: List[Dict] = []
+
+    def price(self, ticks: int) -> float:
+        return round(ticks * self.spec.tick, self.decimals)
+
+    def price_text(self, ticks: int) -> str:
+        text = self.price_texts.get(ticks)
+        if text is None:
+            text = self.price_texts[ticks] = repr(self.price(ticks))
+        return text
+
+
+class FeedGenerator:
+    """
+    Generates interleaved orderbook, ticker, trades, orders and fills frames for any number of
+    markets. Each channel of each market is a Poisson process at its configured rate, the mid
+    follows a random walk with optional mean reversion, and the book is kept at its configured
+    depth around it. Feed time is simulated, so frames are produced as fast as they can be built.
+
+    Frames are formatted from cached price and size texts rather than through json.dumps, roughly
+    tripling the frame rate. For stress rates above what one core generates, record frames first
+    and replay them with feed().
+    """
+
+    def __init__(self, specs: List[MarketSpec], seed: int = 0, start_time: Optional[float] = None) -> None:
+        for spec in specs:
+            if not 0 < spec.depth <= CHECKSUM_DEPTH:
+                raise Exception(f"Depth for {spec.market} must be between 1 and {CHECKSUM_DEPTH}, got {spec.depth}")
+        self._rng = random.Random(seed)
+        self._markets = {spec.market: _Market(spec, self._rng) for spec in specs}
+        self.start_time = time.time() if start_time is None else start_time
+        self.now = self.start_time
+        self._next_trade_id = 1
+        self._next_order_id = 1
+        self._time_second, self._time_prefix = None, ''
+        for m in self._markets.values():
+            self._reshape(m, {}, {})
+
+    def _iso_time(self) -> str:
+        second = int(self.now)
+        if second != self._time_second:
+            self._time_second = second
+            self._time_prefix = datetime.fromtimestamp(second, timezone.utc).strftime('%Y-%m-%dT%H:%M:%S')
+        return f'{self._time_prefix}.{int((self.now - second) * 1e6):06d}+00:00'
+
+    # Set a level, or remove it with size 0. changes maps ticks to [size before this message, size now, size text].
+    @staticmethod
+    def _set_level(m: _Market, side: _Side, ticks: int, size: float, size_text: str, changes: Dict[int, list]) -> None:
+        keys, key = side.keys, ticks * side.sign
+        i = bisect_left(keys, key)
+        if i < len(keys) and keys[i] == key:
+            previous = side.sizes[i]
+            if size:
+                side.sizes[i] = size
+                side.texts[i] = f'{m.price_texts.get(ticks) or m.price_text(ticks)}:{size_text}'
+            else:
+                del keys[i], side.sizes[i], side.texts[i]
+        else:
+            previous = 0.0
+            if size:
+                keys.insert(i, key)
+                side.sizes.insert(i, size)
+                side.texts.insert(i, f'{m.price_texts.get(ticks) or m.price_text(ticks)}:{size_text}')
+        change = changes.get(ticks)
+        if change is None:
+            changes[ticks] = [previous, size, size_text]
+        else:
+            change[1], change[2] = size, size_text
+
+    # Remove the level at index, 0 for the best or -1 for the worst
+    @staticmethod
+    def _pop_level(side: _Side, index: int, changes: Dict[int, list]) -> None:
+        ticks = side.keys.pop(index) * side.sign
+        previous = side.sizes.pop(index)
+        del side.texts[index]
+        change = changes.get(ticks)
+        if change is None:
+            changes[ticks] = [previous, 0.0, '0.0']
+        else:
+            change[1], change[2] = 0.0, '0.0'
+
+    def _set_random_level(self, m: _Market, side: _Side, ticks: int, changes: Dict[int, list]) -> None:
+        i = int(self._rng.random() * SIZE_POOL)
+        self._set_level(m, side, ticks, m.sizes[i], m.size_texts[i], changes)
+
+    # Move the mid one step, uncross and refill the inside, change a few random levels and trim to depth
+    def _step_book(self, m: _Market) -> Tuple[Dict[int, list], Dict[int, list]]:
+        spec, bids, asks, rng = m.spec, m.bids, m.asks, self._rng
+        m.mid += rng.gauss(0, spec.volatility) + spec.reversion * (spec.mid / spec.tick - m.mid)
+        bid_changes, ask_changes = {}, {}
+        self._reshape(m, bid_changes, ask_changes)
+        best_bid, best_ask = -bids.keys[0], asks.keys[0]
+        random = rng.random
+        for _ in range(1 + int(random() * 3)):
+            offset = min(int(-5 * log(1.0 - random())), spec.depth - 1)
+            if random() < 0.5:
+                side, ticks, changes = bids, best_bid - offset, bid_changes
+            else:
+                side, ticks, changes = asks, best_ask + offset, ask_changes
+            if offset and random() < 0.3:
+                self._set_level(m, side, ticks, 0.0, '0.0', changes)
+            else:
+                self._set_random_level(m, side, ticks, changes)
+        while len(bids.keys) > spec.depth:
+            self._pop_level(bids, -1, bid_changes)
+        while len(asks.keys) > spec.depth:
+            self._pop_level(asks, -1, ask_changes)
+        return bid_changes, ask_changes
+
+    # Ensure the inside levels sit at the current mid and spread, filling each side out to depth
+    def _reshape(self, m: _Market, bid_changes: Dict[int, list], ask_changes: Dict[int, list]) -> None:
+        spec, bids, asks = m.spec, m.bids, m.asks
+        best_bid = int(m.mid - spec.spread_ticks / 2)
+        best_ask = best_bid + spec.spread_ticks
+        while bids.keys and -bids.keys[0] > best_bid:
+            self._pop_level(bids, 0, bid_changes)
+        while asks.keys and asks.keys[0] < best_ask:
+            self._pop_level(asks, 0, ask_changes)
+        if not bids.keys or -bids.keys[0] != best_bid:
+            self._set_random_level(m, bids, best_bid, bid_changes)
+        if not asks.keys or asks.keys[0] != best_ask:
+            self._set_random_level(m, asks, best_ask, ask_changes)
+        for _ in range(spec.depth - len(bids.keys)):
+            self._set_random_level(m, bids, -bids.keys[-1] - 1, bid_changes)
+        for _ in range(spec.depth - len(asks.keys)):
+            self._set_random_level(m, asks, asks.keys[-1] + 1, ask_changes)
+
+    @staticmethod
+    def _checksum(m: _Market) -> int:
+        bid_texts, ask_texts = m.bids.texts[:CHECKSUM_DEPTH], m.asks.texts[:CHECKSUM_DEPTH]
+        n = min(len(bid_texts), len(ask_texts))
+        parts = [''] * (2 * n)
+        parts[::2] = bid_texts[:n]
+        parts[1::2] = ask_texts[:n]
+        parts.extend(bid_texts[n:] or ask_texts[n:])
+        return zlib.crc32(':'.join(parts).encode())
+
+    # Return JSON levels for the changes whose size differs from before the message
+    @staticmethod
+    def _changes_json(m: _Market, changes: Dict[int, list]) -> str:
+        return ', '.join([f'[{m.price_text(t)}, {text}]' for t, (previous, size, text) in changes.items() if size != previous])
+
+    def _orderbook_frame(self, m: _Market, action: str, bids: str, asks: str) -> str:
+        return (f'{{"channel": "orderbook", "market": {m.quoted}, "type": "{action}", "data": '
+                f'{{"time": {self.now!r}, "checksum": {self._checksum(m)}, "bids": [{bids}], "asks": [{asks}], '
+                f'"action": "{action}"}}}}')
+
+    def orderbook_partial(self, market: str) -> str:
+        m = self._markets[market]
+        bids = ', '.join([f'[{m.price_text(-k)}, {s!r}]' for k, s in zip(m.bids.keys, m.bids.sizes)])
+        asks = ', '.join([f'[{m.price_text(k)}, {s!r}]' for k, s in zip(m.asks.keys, m.asks.sizes)])
+        return self._orderbook_frame(m, 'partial', bids, asks)
+
+    def orderbook_update(self, market: str) -> str:
+        m = self._markets[market]
+        bid_changes, ask_changes = self._step_book(m)
+        return self._orderbook_frame(m, 'update', self._changes_json(m, bid_changes), self._changes_json(m, ask_changes))
+
+    def ticker(self, market: str) -> str:
+        m = self._markets[market]
+        best_bid, best_ask = -m.bids.keys[0], m.asks.keys[0]
+        last = best_bid if self._rng.random() < 0.5 else best_ask
+        return (f'{{"channel": "ticker", "market": {m.quoted}, "type": "update", "data": '
+                f'{{"bid": {m.price_text(best_bid)}, "ask": {m.price_text(best_ask)}, '
+                f'"bidSize": {m.bids.sizes[0]!r}, "askSize": {m.asks.sizes[0]!r}, '
+                f'"last": {m.price_text(last)}, "time": {self.now!r}}}}}')
+
+    def trades(self, market: str) -> str:
+        m, rng = self._markets[market], self._rng
+        trade_time = self._iso_time()
+        trades = []
+        for _ in range(1 + int(rng.random() * 3)):
+            buy = rng.random() < 0.5
+            side = m.asks if buy else m.bids
+            i = int(rng.random() * SIZE_POOL)
+            size = min(m.sizes[i], side.sizes[0])
+            trades.append(f'{{"id": {self._next_trade_id}, "price": {m.price_text(side.keys[0] * side.sign)}, '
+                          f'"size": {size!r}, "side": "{"buy" if buy else "sell"}", "liquidation": false, '
+                          f'"time": "{trade_time}"}}')
+            self._next_trade_id += 1
+        return f'{{"channel": "trades", "market": {m.quoted}, "type": "update", "data": [{", ".join(trades)}]}}'
+
+    # Advance one synthetic order of ours through new, partially filled, filled or cancelled.
+    # Return the frames produced, a fill frame precedes the order update it causes.
+    def order_event(self, market: str) -> List[str]:
+        m, rng = self._markets[market], self._rng
+        frames = []
+        if len(m.open_orders) < 5 and (not m.open_orders or rng.random() < 0.4):
+            side = 'buy' if rng.random() < 0.5 else 'sell'
+            ticks = -m.bids.keys[0] if side == 'buy' else m.asks.keys[0]
+            size = m.sizes[int(rng.random() * SIZE_POOL)]
+            order = {'id': self._next_order_id, 'clientId': None, 'market': market, 'type': 'limit', 'side': side,
+                     'price': m.price(ticks), 'size': size, 'status': 'new', 'filledSize': 0.0, 'remainingSize': size,
+                     'reduceOnly': False, 'liquidation': False, 'avgFillPrice': None, 'postOnly': True, 'ioc': False,
+                     'createdAt': self._iso_time()}
+            self._next_order_id += 1
+            m.open_orders.append(order)
+        else:
+            order = m.open_orders[rng.randrange(len(m.open_orders))]
+            if rng.random() < 0.2:
+                order['status'] = 'closed'
+            else:
+                remaining = order['remainingSize']
+                fill_size = remaining if remaining <= 0.1 or rng.random() < 0.5 else round(remaining / 2, 1)
+                order['filledSize'] = round(order['filledSize'] + fill_size, 1)
+                order['remainingSize'] = round(order['size'] - order['filledSize'], 1)
+                order['avgFillPrice'] = order['price']
+                order['status'] = 'open' if order['remainingSize'] > 0 else 'closed'
+                frames.append(json.dumps({'channel': 'fills', 'type': 'update', 'data': {
+                    'id': self._next_trade_id, 'market': market, 'type': 'order', 'side': order['side'],
+                    'price': order['price'], 'size': fill_size, 'orderId': order['id'], 'tradeId': self._next_trade_id,
+                    'time': self._iso_time(), 'feeRate': 0.0, 'fee': 0.0, 'feeCurrency': 'USD', 'liquidity': 'maker'}}))
+                self._next_trade_id += 1
+            if order['status'] == 'closed':
+                m.open_orders.remove(order)
+        frames.append(json.dumps({'channel': 'orders', 'type': 'update', 'data': order}))
+        return frames
+
+    # Yield (feed time, frame) pairs, a partial for every market first, until count frames or
+    # duration_s of feed time have been produced
+    def frames(self, count: Optional[int] = None, duration_s: Optional[float] = None) -> Iterator[Tuple[float, str]]:
+        produced = 0
+        end = self.start_time + duration_s if duration_s is not None else None
+        for market in self._markets:
+            if count is not None and produced >= count:
+                return
+            yield self.now, self.orderbook_partial(market)
+            produced += 1
+
+        channels = []
+        handlers = {'orderbook': self.orderbook_update, 'ticker': self.ticker, 'trades': self.trades}
+        for market, m in self._markets.items():
+            for kind, rate in (('orderbook', m.spec.book_rate), ('ticker', m.spec.ticker_rate),
+                               ('trades', m.spec.trade_rate), ('orders', m.spec.order_rate)):
+                if rate > 0:
+                    channels.append((self.now + self._rng.expovariate(rate), len(channels), handlers.get(kind), market, rate))
+        heapq.heapify(channels)
+
+        expovariate, heapreplace = self._rng.expovariate, heapq.heapreplace
+        while channels:
+            t, index, handler, market, rate = channels[0]
+            if end is not None and t > end:
+                return
+            heapreplace(channels, (t + expovariate(rate), index, handler, market, rate))
+            self.now = t
+            if handler is not None:
+                if count is not None and produced >= count:
+                    return
+                yield t, handler(market)
+                produced += 1
+                continue
+            for frame in self.order_event(market):
+                if count is not None and produced >= count:
+                    return
+                yield t, frame
+                produced += 1
+
+
+def write_frames(frames: Iterator[Tuple[float, str]], path: str) -> int:
+    written = 0
+    with open(path, 'w') as f:
+        for t, frame in frames:
+            f.write(f'{t:.6f} {frame}\n')
+            written += 1
+    return written
+
+
+def read_frames(path: str) -> Iterator[Tuple[float, str]]:
+    with open(path) as f:
+        for line in f:
+            t, frame = line.rstrip('\n').split(' ', 1)
+            yield float(t), frame
+
+
+# Feed frames straight into a client's message handler. With speed set, frames are paced to
+# their feed time scaled by speed, otherwise they are delivered as fast as the client takes them.
+# Return the number of frames delivered.
+def feed(client, frames: Iterator[Tuple[float, str]], speed: Optional[float] = None) -> int:
+    delivered = 0
+    started, first = time.perf_counter(), None
+    for t, frame in frames:
+        if speed:
+            first = t if first is None else first
+            delay = (t - first) / speed - (time.perf_counter() - started)
+            if delay > 0:
+                time.sleep(delay)
+        client._on_message(None, frame)
+        delivered += 1
+    return delivered
+
+
+# Subscribe a client to every market seen in frames without connecting, so fed frames are handled
+def prepare_client(client, markets: List[str]) -> None:
+    client._logged_in = True
+    client._subscriptions.extend([{'channel': 'orders'}, {'channel': 'fills'}])
+    for market in markets:
+        for channel in ('orderbook', 'ticker', 'trades'):
+            client._subscriptions.append({'channel': channel, 'market': market})
+
+
+def parse_market(value: str) -> Tuple[str, float, float]:
+    market, mid, *tick = value.split(':')
+    return market, float(mid), float(tick[0]) if tick else 0.0001
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='Generate a synthetic FTX websocket feed.')
+    parser.add_argument('--market', action='append', type=parse_market, metavar='NAME:MID[:TICK]',
+                        help='Market to generate, may be repeated (default GST/USD and GST-PERP)')
+    parser.add_argument('--depth', type=int, default=50)
+    parser.add_argument('--spread-ticks', type=int, default=1)
+    parser.add_argument('--volatility', type=float, default=0.5, help='Mid standard deviation in ticks per book update')
+    parser.add_argument('--reversion', type=float, default=0.0)
+    parser.add_argument('--book-rate', type=float, default=10000.0)
+    parser.add_argument('--ticker-rate', type=float, default=1000.0)
+    parser.add_argument('--trade-rate', type=float, default=2000.0)
+    parser.add_argument('--order-rate', type=float, default=10.0)
+    parser.add_argument('--count', type=int, default=1000000)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', help='Record frames to this file instead of discarding them')
+    parser.add_argument('--replay', help='Feed recorded frames into an FtxWebsocketClient and report its throughput')
+    parser.add_argument('--book-depth', type=int, help='Bounded book depth for the replay client')
+    parser.add_argument('--speed', type=float, help='Pace replay at this multiple of feed time instead of as fast as possible')
+    args = parser.parse_args()
+
+    if args.replay:
+        from ftx_ws import FtxWebsocketClient
+        frames = list(read_frames(args.replay))
+        client = FtxWebsocketClient(book_depth=args.book_depth)
+        prepare_client(client, sorted({json.loads(f).get('market') for _, f in frames} - {None}))
+        started = time.perf_counter()
+        delivered = feed(client, iter(frames), args.speed)
+        elapsed = time.perf_counter() - started
+        print(f"Delivered {delivered} frames in {elapsed:.2f}s, {delivered / elapsed:,.0f} msg/s, "
+              f"{elapsed / delivered * 1e6:.1f}us per frame in the client")
+        if args.speed and frames:
+            behind = elapsed - (frames[-1][0] - frames[0][0]) / args.speed
+            if behind > 0.01 * elapsed:
+                print(f"The client fell {behind:.2f}s behind the paced feed, its throughput limits this speed")
+        return
+
+    markets = args.market or [('GST/USD', 1.5, 0.0001), ('GST-PERP', 1.503, 0.0001)]
+    specs = [MarketSpec(market, mid, tick, args.spread_ticks, args.depth, volatility=args.volatility,
+                        reversion=args.reversion, book_rate=args.book_rate, ticker_rate=args.ticker_rate,
+                        trade_rate=args.trade_rate, order_rate=args.order_rate)
+             for market, mid, tick in markets]
+    generator = FeedGenerator(specs, seed=args.seed)
+    started = time.perf_counter()
+    if args.output:
+        produced = write_frames(generator.frames(count=args.count), args.output)
+    else:
+        produced = sum(1 for _ in generator.frames(count=args.count))
+    elapsed = time.perf_counter() - started
+    print(f"Generated {produced} frames covering {generator.now - generator.start_time:.1f}s of feed "
+          f"in {elapsed:.2f}s, {produced / elapsed:,.0f} msg/s on one core. Record with --output and "
+          f"replay the recording from several processes for higher rates")
+
+
+if __name__ == '__main__':
+    main()
@@ -3,6 +3,7 @@ import urllib.parse
 from typing import Optional, Dict, Any, List
 
 from requests import Request, Session, Response
+from requests.adapters import HTTPAdapter
 import hmac
 from ciso8601 import parse_datetime
 
@@ -12,8 +13,11 @@ import json
 class FtxRestClient:
     _ENDPOINT = 'https://ftx.com/api/'
 
-    def __init__(self, api_key=None, api_secret=None, subaccount_name=None) -> None:
+    # pool_size is the number of keep-alive connections held open, set it to the number of threads sharing the client
+    def __init__(self, api_key=None, api_secret=None, subaccount_name=None, pool_size: Optional[int] = None) -> None:
         self._session = Session()
+        if pool_size:
+            self._session.mount('https://', HTTPAdapter(pool_connections=1, pool_maxsize=pool_size))
         self._api_key = api_key
         self._api_secret = api_secret
         self._subaccount_name = subaccount_name
@@ -0,0 +1,278 @@
+import time
+import logging
+from collections import deque, defaultdict
+from concurrent.futures import Future
+from threading import Thread, Condition, RLock
+from typing import Any, Callable, DefaultDict, Deque, Dict, List, Optional, Tuple
+
+from ftx_rest import FtxRestClient
+
+
+# Priority lanes, highest priority first
+LANES = ('kill', 'cancel', 'hedge', 'place', 'modify', 'info')
+PROTECTIVE_LANES = ('cancel', 'hedge')
+RESERVED_LANES = ('kill',)          # Served only by a worker of their own, never waiting for one to free up
+
+# Default lane for each client method when called through the scheduler without an explicit lane
+METHOD_LANES = {
+    'cancel_order': 'cancel',
+    'cancel_orders': 'cancel',
+    'place_order': 'place',
+    'place_conditional_order': 'place',
+    'modify_order': 'modify',
+}
+
+# Endpoint class for each lane, every endpoint class draws from its own token bucket
+LANE_ENDPOINT_CLASSES = {
+    'kill': 'kill',
+    'cancel': 'cancel',
+    'hedge': 'order',
+    'place': 'order',
+    'modify': 'order',
+    'info': 'info',
+}
+
+# (requests per second, burst) per endpoint class
+DEFAULT_BUCKETS = {
+    'kill': (1, 4),
+    'cancel': (30, 15),
+    'order': (20, 10),
+    'info': (10, 5),
+}
+
+
+class TokenBucket:
+    __slots__ = ('rate', 'capacity', 'tokens', 'updated_at')
+
+    def __init__(self, rate: float, capacity: float) -> None:
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated_at = time.monotonic()
+
+    def _refill(self, now: float) -> None:
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+
+    # Return 0 and consume a token if one is available, otherwise the seconds until one will be
+    def take(self, now: float) -> float:
+        self._refill(now)
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+
+class _Job:
+    __slots__ = ('lane', 'method', 'args', 'kwargs', 'futures', 'key', 'queued_at')
+
+    def __init__(self, lane: str, method: str, args: tuple, kwargs: dict, key: Optional[Tuple]) -> None:
+        self.lane = lane
+        self.method = method
+        self.args = args
+        self.kwargs = kwargs
+        self.futures: List[Future] = [Future()]
+        self.key = key
+        self.queued_at = time.monotonic()
+
+
+class FtxRequestScheduler:
+    """
+    Sends FtxRestClient calls through priority lanes (cancel > hedge > place > modify > info),
+    each drawing on a token bucket for its endpoint class. Protective lanes may use every
+    worker, order lanes leave one worker free for them and info calls leave two, so cancels
+    and hedges never queue behind informational calls. Pending modifies of the same order are
+    coalesced so only the latest price is sent.
+
+    The kill lane is for emergency bulk cancels. It has a worker and a token bucket of its own,
+    so a request on it goes out immediately however busy the other lanes are.
+
+    Client methods called directly on the scheduler block until the response arrives, submit()
+    returns a Future instead.
+    """
+
+    def __init__(self, client: FtxRestClient, workers: int = 4, buckets: Dict[str, Tuple[float, float]] = None) -> None:
+        self._client = client
+        self._workers = max(workers, 2)
+        self._buckets = {name: TokenBucket(rate, burst) for name, (rate, burst) in {**DEFAULT_BUCKETS, **(buckets or {})}.items()}
+        self._queues: Dict[str, Deque[_Job]] = {lane: deque() for lane in LANES}
+        self._pending_modifies: Dict[Tuple, _Job] = {}
+        self._in_flight: DefaultDict[str, int] = defaultdict(int)
+        lock = RLock()
+        self._cond = Condition(lock)
+        self._reserved_cond = Condition(lock)
+        self._running = True
+
+        self._submitted: DefaultDict[str, int] = defaultdict(int)
+        self._completed: DefaultDict[str, int] = defaultdict(int)
+        self._failed: DefaultDict[str, int] = defaultdict(int)
+        self._coalesced = 0
+        self._throttled: DefaultDict[str, int] = defaultdict(int)
+        self._max_depth: DefaultDict[str, int] = defaultdict(int)
+        self._wait_total: DefaultDict[str, float] = defaultdict(float)
+        self._wait_max: DefaultDict[str, float] = defaultdict(float)
+        self._latency: Dict[str, List[float]] = {}          # method: [count, total_s, max_s, last_s]
+
+        shared_lanes = tuple(lane for lane in LANES if lane not in RESERVED_LANES)
+        for lanes, cond in [(shared_lanes, self._cond)] * self._workers + [(RESERVED_LANES, self._reserved_cond)]:
+            t = Thread(target=self._run_worker, args=(lanes, cond))
+            t.daemon = True
+            t.start()
+
+    @property
+    def client(self) -> FtxRestClient:
+        return self._client
+
+    def __getattr__(self, name: str) -> Callable:
+        if name.startswith('_') or not callable(getattr(self._client, name, None)):
+            raise AttributeError(name)
+        lane = METHOD_LANES.get(name, 'info')
+
+        def call(*args, **kwargs) -> Any:
+            return self.submit(lane, name, *args, **kwargs).result()
+        return call
+
+    def submit(self, lane: str, method: str, *args, **kwargs) -> Future:
+        assert lane in self._queues, f'Unknown lane {lane}'
+        key = self._modify_key(method, args, kwargs)
+        with self._cond:
+            self._submitted[lane] += 1
+
+            # Replace the arguments of a modify that has not been sent yet, both callers get the latest result
+            if key is not None and key in self._pending_modifies:
+                job = self._pending_modifies[key]
+                job.args, job.kwargs = args, kwargs
+                future = Future()
+                job.futures.append(future)
+                self._coalesced += 1
+                return future
+
+            job = _Job(lane, method, args, kwargs, key)
+            if key is not None:
+                self._pending_modifies[key] = job
+            self._queues[lane].append(job)
+            self._max_depth[lane] = max(self._max_depth[lane], len(self._queues[lane]))
+            (self._reserved_cond if lane in RESERVED_LANES else self._cond).notify()
+        return job.futures[0]
+
+    def close(self) -> None:
+        with self._cond:
+            self._running = False
+            self._cond.notify_all()
+            self._reserved_cond.notify_all()
+
+    @staticmethod
+    def _modify_key(method: str, args: tuple, kwargs: dict) -> Optional[Tuple]:
+        if method != 'modify_order':
+            return None
+        existing_order_id = args[0] if len(args) > 0 else kwargs.get('existing_order_id')
+        existing_client_order_id = args[1] if len(args) > 1 else kwargs.get('existing_client_order_id')
+        return (existing_order_id, existing_client_order_id)
+
+    # Return the maximum number of workers a lane may occupy
+    def _lane_limit(self, lane: str) -> int:
+        if lane in RESERVED_LANES:
+            return 1
+        if lane in PROTECTIVE_LANES:
+            return self._workers
+        if lane == 'info':
+            return max(self._workers - 2, 1)
+        return self._workers - 1
+
+    def _lanes_in_flight(self, lane: str) -> int:
+        if lane in RESERVED_LANES:
+            return self._in_flight[lane]
+        if lane in PROTECTIVE_LANES:
+            return sum(n for l, n in self._in_flight.items() if l not in RESERVED_LANES)
+        if lane == 'info':
+            return self._in_flight['info']
+        return sum(n for l, n in self._in_flight.items() if l not in PROTECTIVE_LANES and l not in RESERVED_LANES)
+
+    # Return the highest priority job of lanes allowed to go out now, or None and the seconds until one may be
+    def _next_job(self, lanes: Tuple[str, ...]) -> Tuple[Optional[_Job], Optional[float]]:
+        now = time.monotonic()
+        wait = None
+        for lane in lanes:
+            queue = self._queues[lane]
+            if not queue or self._lanes_in_flight(lane) >= self._lane_limit(lane):
+                continue
+            bucket_wait = self._buckets[LANE_ENDPOINT_CLASSES[lane]].take(now)
+            if bucket_wait:
+                self._throttled[lane] += 1
+                wait = bucket_wait if wait is None else min(wait, bucket_wait)
+                continue
+            job = queue.popleft()
+            if job.key is not None:
+                del self._pending_modifies[job.key]
+            return job, None
+        return None, wait
+
+    def _run_worker(self, lanes: Tuple[str, ...], cond: Condition) -> None:
+        while True:
+            with cond:
+                job, wait = self._next_job(lanes)
+                while job is None:
+                    if not self._running:
+                        return
+                    cond.wait(wait)
+                    job, wait = self._next_job(lanes)
+                self._in_flight[job.lane] += 1
+                waited = time.monotonic() - job.queued_at
+                self._wait_total[job.lane] += waited
+                self._wait_max[job.lane] = max(self._wait_max[job.lane], waited)
+
+            sent_at = time.monotonic()
+            try:
+                result = getattr(self._client, job.method)(*job.args, **job.kwargs)
+            except Exception as e:
+                logging.getLogger().info(f'{job.lane} request {job.method} failed: {e}')
+                with self._cond:
+                    self._failed[job.lane] += 1
+                for future in job.futures:
+                    future.set_exception(e)
+            else:
+                for future in job.futures:
+                    future.set_result(result)
+            finally:
+                latency = time.monotonic() - sent_at
+                with self._cond:
+                    self._in_flight[job.lane] -= 1
+                    self._completed[job.lane] += 1
+                    stats = self._latency.get(job.method)
+                    if stats is None:
+                        self._latency[job.method] = [1, latency, latency, latency]
+                    else:
+                        stats[0] += 1
+                        stats[1] += latency
+                        stats[2] = max(stats[2], latency)
+                        stats[3] = latency
+                    self._cond.notify_all()
+
+    # Return queue depth, throughput and wait time per lane, bucket levels per endpoint class and response time per client method
+    def metrics(self) -> Dict[str, Any]:
+        with self._cond:
+            now = time.monotonic()
+            lanes = {}
+            for lane in LANES:
+                done = self._completed[lane]
+                lanes[lane] = {
+                    'depth': len(self._queues[lane]),
+                    'max_depth': self._max_depth[lane],
+                    'in_flight': self._in_flight[lane],
+                    'submitted': self._submitted[lane],
+                    'completed': done,
+                    'failed': self._failed[lane],
+                    'throttled': self._throttled[lane],
+                    'oldest_wait_s': now - self._queues[lane][0].queued_at if self._queues[lane] else 0.0,
+                    'avg_wait_s': self._wait_total[lane] / done if done else 0.0,
+                    'max_wait_s': self._wait_max[lane],
+                }
+            buckets = {}
+            for name, bucket in self._buckets.items():
+                bucket._refill(now)
+                buckets[name] = bucket.tokens
+            endpoints = {
+                method: {'requests': count, 'avg_latency_s': total / count, 'max_latency_s': worst, 'last_latency_s': last}
+                for method, (count, total, worst, last) in self._latency.items()
+            }
+            return {'lanes': lanes, 'buckets': buckets, 'coalesced_modifies': self._coalesced, 'endpoints': endpoints}
@@ -1,24 +1,31 @@
 import hmac
+import sys
 import json
 import time
-import zlib
 from copy import deepcopy
 from datetime import datetime
 from collections import defaultdict, deque
-from itertools import zip_longest
-from typing import DefaultDict, Deque, List, Dict, Tuple, Optional
+from typing import Callable, DefaultDict, Deque, List, Dict, Tuple, Optional, Set
 from gevent.event import Event
-from threading import Thread, Lock
+from threading import Thread, Lock, Event as ThreadEvent
 
 from websocket import WebSocketApp
 
+from orderbook import BoundedOrderbook, SortedOrderbook, CHECKSUM_DEPTH, SLACK_LEVELS, BIDS, ASKS
+
 
 class WebsocketManager:
     _CONNECT_TIMEOUT_S = 5
+    _RETRY_BACKOFF_S = (0.05, 2)
+    _PING_INTERVAL_S = 1                    # Pongs keep a quiet but healthy connection receiving, see last_received_age()
 
     def __init__(self):
         self.connect_lock = Lock()
         self.ws = None
+        self._connect_attempt_done = ThreadEvent()
+        self._disconnected_at: Optional[float] = None
+        self._downtimes: Deque[float] = deque([], maxlen=1000)
+        self._received_at: Optional[float] = None
 
     def _get_url(self):
         raise NotImplementedError()
@@ -26,6 +33,9 @@ class WebsocketManager:
     def _on_message(self, ws, message):
         raise NotImplementedError()
 
+    def _on_open(self, ws):
+        pass
+
     def send(self, message):
         self.connect()
         self.ws.send(message)
@@ -36,9 +46,12 @@ class WebsocketManager:
     def _connect(self):
         assert not self.ws, "ws should be closed before attempting to connect"
 
+        self._connect_attempt_done.clear()
         self.ws = WebSocketApp(
             self._get_url(),
-            on_message=self._wrap_callback(self._on_message),
+            on_open=self._wrap_callback(self._handle_open),
+            on_message=self._wrap_callback(self._receive),
+            on_pong=self._wrap_callback(self._on_pong),
             on_close=self._wrap_callback(self._on_close),
             on_error=self._wrap_callback(self._on_error),
         )
@@ -47,13 +60,29 @@ class WebsocketManager:
         wst.daemon = True
         wst.start()
 
-        # Wait for socket to connect
-        ts = time.time()
-        while self.ws and (not self.ws.sock or not self.ws.sock.connected):
-            if time.time() - ts > self._CONNECT_TIMEOUT_S:
-                self.ws = None
-                return
-            time.sleep(0.1)
+        # Wait for the socket to open, or for the attempt to fail
+        if not self._connect_attempt_done.wait(self._CONNECT_TIMEOUT_S) and self.ws:
+            ws, self.ws = self.ws, None
+            ws.close()
+
+    def _receive(self, ws, message):
+        self._received_at = time.monotonic()
+        self._on_message(ws, message)
+
+    def _on_pong(self, ws, data):
+        self._received_at = time.monotonic()
+
+    # Return seconds since the connection last received a message or pong, None if it never has
+    def last_received_age(self) -> Optional[float]:
+        received_at = self._received_at
+        return None if received_at is None else time.monotonic() - received_at
+
+    def _handle_open(self, ws):
+        if self._disconnected_at is not None:
+            self._downtimes.append(time.time() - self._disconnected_at)
+            self._disconnected_at = None
+        self._on_open(ws)
+        self._connect_attempt_done.set()
 
     def _wrap_callback(self, f):
         def wrapped_f(ws, *args, **kwargs):
@@ -66,7 +95,7 @@ class WebsocketManager:
 
     def _run_websocket(self, ws):
         try:
-            ws.run_forever()
+            ws.run_forever(ping_interval=self._PING_INTERVAL_S)
         except Exception as e:
             raise Exception(f'Unexpected error while running websocket: {e}')
         finally:
@@ -75,7 +104,10 @@ class WebsocketManager:
     def _reconnect(self, ws):
         assert ws is not None, '_reconnect should only be called with an existing ws'
         if ws is self.ws:
+            if self._disconnected_at is None:
+                self._disconnected_at = time.time()
             self.ws = None
+            self._connect_attempt_done.set()
             ws.close()
             self.connect()
 
@@ -83,10 +115,13 @@ class WebsocketManager:
         if self.ws:
             return
         with self.connect_lock:
+            backoff = self._RETRY_BACKOFF_S[0]
             while not self.ws:
                 self._connect()
                 if self.ws:
                     return
+                time.sleep(backoff)
+                backoff = min(backoff * 2, self._RETRY_BACKOFF_S[1])
 
     def _on_close(self, ws):
         self._reconnect(ws)
@@ -98,35 +133,72 @@ class WebsocketManager:
         if self.ws is not None:
             self._reconnect(self.ws)
 
+    # Return number of reconnects and the last, mean and worst downtime in seconds
+    def get_reconnect_stats(self) -> Dict[str, float]:
+        downtimes = list(self._downtimes)
+        return {
+            'reconnects': len(downtimes),
+            'last_downtime_s': downtimes[-1] if downtimes else 0.0,
+            'mean_downtime_s': sum(downtimes) / len(downtimes) if downtimes else 0.0,
+            'max_downtime_s': max(downtimes) if downtimes else 0.0,
+            'disconnected_for_s': time.time() - self._disconnected_at if self._disconnected_at else 0.0,
+        }
+
 
 class FtxWebsocketClient(WebsocketManager):
     _ENDPOINT = 'wss://ftx.com/ws/'
 
-    def __init__(self, api_key=None, api_secret=None, subaccount_name=None) -> None:
+    # book_depth bounds each book to that many levels per side in preallocated arrays, None keeps every level
+    # the exchange sends. Bounded books keep enough levels for the checksum unless verify_checksum is False.
+    def __init__(self, api_key=None, api_secret=None, subaccount_name=None, book_depth: Optional[int] = None,
+                 verify_checksum: bool = True) -> None:
         super().__init__()
+        self._book_depth = book_depth
+        self._verify_checksum = verify_checksum
+        if book_depth:
+            self._book_capacity = (max(book_depth, CHECKSUM_DEPTH) if verify_checksum else book_depth) + SLACK_LEVELS
         self._trades: DefaultDict[str, Deque] = defaultdict(lambda: deque([], maxlen=10000))
         self._fills: Deque = deque([], maxlen=10000)
         self._api_key = api_key
         self._api_secret = api_secret
         self._subaccount_name = subaccount_name
         self._orderbook_update_events: DefaultDict[str, Event] = defaultdict(Event)
+        self._orderbook_ready: DefaultDict[str, ThreadEvent] = defaultdict(ThreadEvent)
+        self._ticker_ready: DefaultDict[str, ThreadEvent] = defaultdict(ThreadEvent)
+        self._orderbook_listeners: List[Callable[[str, Dict[str, List[Tuple[float, float]]]], None]] = []
+        self._ticker_listeners: List[Callable[[str, Dict], None]] = []
+        self._order_listeners: List[Callable[[Dict], None]] = []
+        self._trade_listeners: List[Callable[[str, List[Dict]], None]] = []
+        self._subscriptions: List[Dict] = []
+        self._logged_in = False
+        self._message_counts: DefaultDict[Tuple[str, Optional[str]], int] = defaultdict(int)
+        self._checksum_failures: DefaultDict[str, int] = defaultdict(int)
         self._reset_data()
 
     def _on_open(self, ws):
-        self._reset_data()
+        self._resync()
 
     def _reset_data(self) -> None:
-        self._subscriptions: List[Dict] = []
         self._orders: DefaultDict[int, Dict] = defaultdict(dict)
         self._tickers: DefaultDict[str, Dict] = defaultdict(dict)
         self._markets: DefaultDict[str, Dict] = defaultdict(dict)
         self._orderbook_timestamps: DefaultDict[str, float] = defaultdict(float)
         self._orderbook_update_events.clear()
-        self._orderbooks: DefaultDict[str, Dict[str, DefaultDict[float, float]]] = defaultdict(
-            lambda: {side: defaultdict(float) for side in {'bids', 'asks'}})
+        if self._book_depth:
+            self._orderbooks: DefaultDict[str, BoundedOrderbook] = defaultdict(lambda: BoundedOrderbook(self._book_capacity))
+        else:
+            self._orderbooks: DefaultDict[str, SortedOrderbook] = defaultdict(SortedOrderbook)
         self._orderbook_timestamps.clear()
-        self._logged_in = False
-        self._last_received_orderbook_data_at: float = 0.0
+        self._stale_orderbooks: Set[str] = set()
+
+    # Restore login and every subscription in one burst after a reconnect. Books keep their
+    # last state but are marked stale until the fresh partial for the new connection arrives.
+    def _resync(self) -> None:
+        self._stale_orderbooks = {s['market'] for s in self._subscriptions if s['channel'] == 'orderbook'}
+        if self._logged_in:
+            self._login()
+        for subscription in self._subscriptions:
+            self.send_json({'op': 'subscribe', **subscription})
 
     def _reset_orderbook(self, market: str) -> None:
         if market in self._orderbooks:
@@ -137,14 +209,17 @@ class FtxWebsocketClient(WebsocketManager):
     def _get_url(self) -> str:
         return self._ENDPOINT
 
-    def _login(self) -> None:
+    def _login_message(self) -> Dict:
         ts = int(time.time() * 1000)
-        self.send_json({'op': 'login', 'args': {
+        return {'op': 'login', 'args': {
             'key': self._api_key,
             'sign': hmac.new(
                 self._api_secret.encode(), f'{ts}websocket_login'.encode(), 'sha256').hexdigest(),
             'time': ts,
-            'subaccount': self._subaccount_name}})
+            'subaccount': self._subaccount_name}}
+
+    def _login(self) -> None:
+        self.send_json(self._login_message())
         self._logged_in = True
 
     def _subscribe(self, subscription: Dict) -> None:
@@ -188,26 +263,65 @@ class FtxWebsocketClient(WebsocketManager):
         subscription = {'channel': 'orderbook', 'market': market}
         if subscription not in self._subscriptions:
             self._subscribe(subscription)
-        if self._orderbook_timestamps[market] == 0:
+        if self._orderbook_timestamps[market] == 0 or market in self._stale_orderbooks:
             self.wait_for_orderbook_update(market, 5)
-        return {
-            side: sorted(
-                [(price, quantity) for price, quantity in list(self._orderbooks[market][side].items())
-                 if quantity],
-                key=lambda order: order[0] * (-1 if side == 'bids' else 1)
-            )
-            for side in {'bids', 'asks'}
-        }
+        return self._sorted_orderbook(market)
+
+    def _sorted_orderbook(self, market: str) -> Dict[str, List[Tuple[float, float]]]:
+        book, depth = self._orderbooks[market], self._book_depth or sys.maxsize
+        return {'bids': book.levels(BIDS, depth), 'asks': book.levels(ASKS, depth)}
 
     def get_orderbook_timestamp(self, market: str) -> float:
         return self._orderbook_timestamps[market]
 
+    def is_orderbook_stale(self, market: str) -> bool:
+        return market in self._stale_orderbooks
+
+    # Return messages received per (channel, market) and checksum failures per market since the client was created.
+    # Every checksum failure resubscribes the book.
+    def get_feed_stats(self) -> Dict[str, Dict]:
+        return {
+            'messages': dict(self._message_counts),
+            'checksum_failures': dict(self._checksum_failures),
+        }
+
+    # Register a callback run on the websocket thread with (market, sorted orderbook) after every verified book update
+    def add_orderbook_listener(self, listener: Callable[[str, Dict[str, List[Tuple[float, float]]]], None]) -> None:
+        self._orderbook_listeners.append(listener)
+
+    # Register a callback run on the websocket thread with (market, ticker) after every ticker update
+    def add_ticker_listener(self, listener: Callable[[str, Dict], None]) -> None:
+        self._ticker_listeners.append(listener)
+
+    # Register a callback run on the websocket thread with the order after every order update
+    def add_order_listener(self, listener: Callable[[Dict], None]) -> None:
+        self._order_listeners.append(listener)
+
+    # Register a callback run on the websocket thread with (market, trades) for every trades message
+    def add_trade_listener(self, listener: Callable[[str, List[Dict]], None]) -> None:
+        self._trade_listeners.append(listener)
+
     def wait_for_orderbook_update(self, market: str, timeout: Optional[float]) -> None:
         subscription = {'channel': 'orderbook', 'market': market}
         if subscription not in self._subscriptions:
             self._subscribe(subscription)
         self._orderbook_update_events[market].wait(timeout)
 
+    # Subscribe to books and tickers for all markets without blocking, then wait until each has delivered data.
+    # Return False if any has not within timeout seconds.
+    def wait_until_ready(self, markets: List[str], timeout: float) -> bool:
+        for market in markets:
+            for channel in ('orderbook', 'ticker'):
+                subscription = {'channel': channel, 'market': market}
+                if subscription not in self._subscriptions:
+                    self._subscribe(subscription)
+        deadline = time.time() + timeout
+        for market in markets:
+            for event in (self._orderbook_ready[market], self._ticker_ready[market]):
+                if not event.wait(max(deadline - time.time(), 0)):
+                    return False
+        return True
+
     def get_ticker(self, market: str) -> Dict:
         subscription = {'channel': 'ticker', 'market': market}
         if subscription not in self._subscriptions:
@@ -222,36 +336,41 @@ class FtxWebsocketClient(WebsocketManager):
         data = message['data']
         if data['action'] == 'partial':
             self._reset_orderbook(market)
-        for side in {'bids', 'asks'}:
-            book = self._orderbooks[market][side]
+            self._stale_orderbooks.discard(market)
+        elif market in self._stale_orderbooks:
+            return
+        book = self._orderbooks[market]
+        for side, side_index in (('bids', BIDS), ('asks', ASKS)):
             for price, size in data[side]:
-                if size:
-                    book[price] = size
-                else:
-                    del book[price]
-            self._orderbook_timestamps[market] = data['time']
-        checksum = data['checksum']
-        orderbook = self.get_orderbook(market)
-        checksum_data = [
-            ':'.join([f'{float(order[0])}:{float(order[1])}' for order in (bid, offer) if order])
-            for (bid, offer) in zip_longest(orderbook['bids'][:100], orderbook['asks'][:100])
-        ]
-
-        computed_result = int(zlib.crc32(':'.join(checksum_data).encode()))
-        if computed_result != checksum:
-            self._last_received_orderbook_data_at = 0
+                book.update(side_index, price, size)
+        self._orderbook_timestamps[market] = data['time']
+        valid = not self._verify_checksum or book.checksum() == data['checksum']
+
+        if not valid:
+            self._checksum_failures[market] += 1
             self._reset_orderbook(market)
+            self._stale_orderbooks.add(market)
             self._unsubscribe({'market': market, 'channel': 'orderbook'})
             self._subscribe({'market': market, 'channel': 'orderbook'})
         else:
             self._orderbook_update_events[market].set()
             self._orderbook_update_events[market].clear()
+            self._orderbook_ready[market].set()
+            if self._orderbook_listeners:
+                orderbook = self._sorted_orderbook(market)
+                for listener in self._orderbook_listeners:
+                    listener(market, orderbook)
 
     def _handle_trades_message(self, message: Dict) -> None:
         self._trades[message['market']].append(message['data'])
+        for listener in self._trade_listeners:
+            listener(message['market'], message['data'])
 
     def _handle_ticker_message(self, message: Dict) -> None:
         self._tickers[message['market']] = message['data']
+        self._ticker_ready[message['market']].set()
+        for listener in self._ticker_listeners:
+            listener(message['market'], message['data'])
 
     def _handle_fills_message(self, message: Dict) -> None:
         data = deepcopy(message['data'])
@@ -263,12 +382,16 @@ class FtxWebsocketClient(WebsocketManager):
         data['msg_time'] = time.time_ns()
         # print("WS MESSAGE AT:", str(data['msg_time']), message)
         self._orders.update({data['id']: data})
+        for listener in self._order_listeners:
+            listener(data)
 
     def _handle_markets_message(self, message: Dict) -> None:
         self._markets = message['data']
 
     def _on_message(self, ws, raw_message: str) -> None:
-        message = json.loads(raw_message)
+        self._handle_message(json.loads(raw_message))
+
+    def _handle_message(self, message: Dict) -> None:
         message_type = message['type']
         if message_type in {'subscribed', 'unsubscribed'}:
             return
@@ -278,6 +401,7 @@ class FtxWebsocketClient(WebsocketManager):
         elif message_type == 'error':
             raise Exception(message)
         channel = message['channel']
+        self._message_counts[(channel, message.get('market'))] += 1
 
         if channel == 'orderbook':
             self._handle_orderbook_message(message)
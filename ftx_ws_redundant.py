@@ -0,0 +1,151 @@
+import json
+import time
+from collections import OrderedDict, defaultdict
+from threading import Lock
+from typing import Dict, List, Optional, Tuple
+
+from ftx_ws import WebsocketManager, FtxWebsocketClient
+
+
+class _FeedConnection(WebsocketManager):
+
+    def __init__(self, owner: 'RedundantFtxWebsocketClient', index: int) -> None:
+        super().__init__()
+        self._owner = owner
+        self._index = index
+
+    def _get_url(self) -> str:
+        return self._owner._get_url()
+
+    def _on_open(self, ws) -> None:
+        self._owner._on_connection_open(self._index)
+
+    def _on_message(self, ws, raw_message: str) -> None:
+        self._owner._on_connection_message(self._index, raw_message)
+
+    def is_connected(self) -> bool:
+        return bool(self.ws and self.ws.sock and self.ws.sock.connected)
+
+
+class RedundantFtxWebsocketClient(FtxWebsocketClient):
+    """
+    FtxWebsocketClient fed by several independent connections subscribed to the same channels.
+    Each update is applied from whichever connection delivers it first and later copies are
+    dropped, keyed by market and exchange timestamp/checksum (trade, fill and order ids for the
+    private and trades channels). A connection dropping out costs nothing while another is up.
+    """
+
+    _DEDUP_WINDOW = 50000
+
+    def __init__(self, api_key=None, api_secret=None, subaccount_name=None, connections: int = 2,
+                 book_depth: Optional[int] = None, verify_checksum: bool = True) -> None:
+        self._connections = [_FeedConnection(self, i) for i in range(max(connections, 1))]
+        self._dispatch_lock = Lock()
+        self._seen: 'OrderedDict[Tuple, float]' = OrderedDict()
+        self._stats: List[Dict[str, float]] = [defaultdict(float) for _ in self._connections]
+        super().__init__(api_key, api_secret, subaccount_name, book_depth, verify_checksum)
+
+    def connect(self) -> None:
+        for connection in self._connections:
+            connection.connect()
+
+    # Return seconds since any connection last received a message or pong, None if none has
+    def last_received_age(self) -> Optional[float]:
+        ages = [age for age in (c.last_received_age() for c in self._connections) if age is not None]
+        return min(ages) if ages else None
+
+    def reconnect(self) -> None:
+        for connection in self._connections:
+            connection.reconnect()
+
+    def send(self, message) -> None:
+        for connection in self._connections:
+            connection.send(message)
+
+    # Restore login and subscriptions on the connection that just opened. Books are only marked
+    # stale if no other connection is still delivering them.
+    def _on_connection_open(self, index: int) -> None:
+        connection = self._connections[index]
+        if not any(c.is_connected() for i, c in enumerate(self._connections) if i != index):
+            self._stale_orderbooks = {s['market'] for s in self._subscriptions if s['channel'] == 'orderbook'}
+        if self._logged_in:
+            connection.send_json(self._login_message())
+        for subscription in self._subscriptions:
+            connection.send_json({'op': 'subscribe', **subscription})
+
+    @staticmethod
+    def _dedup_key(message: Dict) -> Optional[Tuple]:
+        channel, data = message['channel'], message['data']
+        if channel == 'orderbook':
+            return channel, message['market'], data['action'], data['time'], data['checksum']
+        elif channel == 'ticker':
+            return channel, message['market'], data['time']
+        elif channel == 'trades':
+            return (channel, message['market']) + tuple(t['id'] for t in data)
+        elif channel == 'fills':
+            return channel, data['id']
+        elif channel == 'orders':
+            return channel, data['id'], data['status'], data['filledSize'], data['size'], data['price']
+        return None
+
+    def _on_connection_message(self, index: int, raw_message: str) -> None:
+        received_at = time.time()
+        message = json.loads(raw_message)
+        message_type = message['type']
+
+        # Control messages belong to the connection they arrived on
+        if message_type in {'subscribed', 'unsubscribed'}:
+            return
+        elif message_type == 'info':
+            if message['code'] == 20001:
+                return self._connections[index].reconnect()
+        elif message_type == 'error':
+            raise Exception(message)
+
+        key = self._dedup_key(message)
+        stats = self._stats[index]
+        with self._dispatch_lock:
+            if key is not None:
+                first_received_at = self._seen.get(key)
+                if first_received_at is not None:
+                    lag = received_at - first_received_at
+                    stats['lagging'] += 1
+                    stats['lag_total_s'] += lag
+                    stats['lag_max_s'] = max(stats['lag_max_s'], lag)
+                    return
+                self._seen[key] = received_at
+                if len(self._seen) > self._DEDUP_WINDOW:
+                    self._seen.popitem(last=False)
+            stats['leading'] += 1
+
+            # A partial from a connection that just (re)subscribed would rewind a book another connection keeps live
+            if message['channel'] == 'orderbook' and message['data']['action'] == 'partial':
+                market = message['market']
+                if market not in self._stale_orderbooks and self._orderbook_timestamps.get(market):
+                    return
+            self._handle_message(message)
+
+    # Return per connection counts of updates delivered first and late, and how late the late copies were
+    def get_connection_stats(self) -> List[Dict[str, float]]:
+        result = []
+        for connection, stats in zip(self._connections, self._stats):
+            lagging = stats['lagging']
+            result.append({
+                'connected': connection.is_connected(),
+                'leading': stats['leading'],
+                'lagging': lagging,
+                'mean_lag_s': stats['lag_total_s'] / lagging if lagging else 0.0,
+                'max_lag_s': stats['lag_max_s'],
+                **connection.get_reconnect_stats(),
+            })
+        return result
+
+    def get_reconnect_stats(self) -> Dict[str, float]:
+        per_connection = [c.get_reconnect_stats() for c in self._connections]
+        return {
+            'reconnects': sum(s['reconnects'] for s in per_connection),
+            'last_downtime_s': max(s['last_downtime_s'] for s in per_connection),
+            'mean_downtime_s': max(s['mean_downtime_s'] for s in per_connection),
+            'max_downtime_s': max(s['max_downtime_s'] for s in per_connection),
+            'disconnected_for_s': min(s['disconnected_for_s'] for s in per_connection),
+        }
@@ -0,0 +1,267 @@
+"""
+Local ledger of fills, funding payments and order history with per-trade aggregates.
+
+    python ledger.py --sync                 # fetch records newer than the ledger, then report
+    python ledger.py --since 2022-05-01     # report on trades opened since a date without fetching
+"""
+import os
+import json
+import time
+import sqlite3
+import argparse
+from pathlib import Path
+from typing import Callable, Dict, List, Optional
+
+from ciso8601 import parse_datetime
+
+from models import Position
+
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS fills (
+    id INTEGER PRIMARY KEY,
+    market TEXT NOT NULL,
+    underlying TEXT NOT NULL,
+    side TEXT NOT NULL,
+    price REAL NOT NULL,
+    size REAL NOT NULL,
+    fee REAL NOT NULL,                      -- In quote currency
+    liquidity TEXT,
+    order_id INTEGER,
+    time REAL NOT NULL,
+    raw TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS fills_market_time ON fills (market, time);
+CREATE INDEX IF NOT EXISTS fills_underlying_time ON fills (underlying, time);
+CREATE INDEX IF NOT EXISTS fills_order ON fills (order_id);
+CREATE INDEX IF NOT EXISTS fills_time ON fills (time);
+
+CREATE TABLE IF NOT EXISTS funding_payments (
+    id INTEGER PRIMARY KEY,
+    market TEXT NOT NULL,
+    underlying TEXT NOT NULL,
+    payment REAL NOT NULL,                  -- Positive when paid, as reported by the exchange
+    rate REAL NOT NULL,
+    time REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS funding_market_time ON funding_payments (market, time);
+CREATE INDEX IF NOT EXISTS funding_underlying_time ON funding_payments (underlying, time);
+
+CREATE TABLE IF NOT EXISTS orders (
+    id INTEGER PRIMARY KEY,
+    market TEXT NOT NULL,
+    side TEXT NOT NULL,
+    type TEXT NOT NULL,
+    price REAL,
+    size REAL NOT NULL,
+    filled_size REAL NOT NULL,
+    avg_fill_price REAL,
+    status TEXT NOT NULL,
+    created_at REAL NOT NULL,
+    raw TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS orders_market_created ON orders (market, created_at);
+CREATE INDEX IF NOT EXISTS orders_status ON orders (status);
+
+-- A trade runs from the first fill that opens exposure in an underlying until every market of it is flat again
+CREATE TABLE IF NOT EXISTS trades (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    underlying TEXT NOT NULL,
+    opened_at REAL NOT NULL,
+    closed_at REAL,                         -- NULL while open
+    fills INTEGER NOT NULL,
+    volume REAL NOT NULL,                   -- Quote notional traded
+    realized_pnl REAL NOT NULL,
+    fees REAL NOT NULL,
+    funding REAL NOT NULL,                  -- Earned, payments received less paid
+    net_pnl REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS trades_underlying_opened ON trades (underlying, opened_at);
+CREATE INDEX IF NOT EXISTS trades_opened ON trades (opened_at);
+"""
+DUST_FRACTION = 0.002                       # Size left in a market, as a fraction of its largest size in the trade, that still counts as flat
+
+
+# Return the underlying coin of a spot market (GST/USD) or future (GST-PERP)
+def underlying(market: str) -> str:
+    return market.split('/')[0].split('-')[0]
+
+
+def _timestamp(value: str) -> float:
+    return parse_datetime(value).timestamp()
+
+
+# Return every record of a history endpoint from start onwards. Pages are requested backwards from now and
+# stop at the first page without unseen ids, so no page size has to be assumed.
+def fetch_since(fetch: Callable[[float, float], List[dict]], start: float, time_key: str = 'time') -> List[dict]:
+    records, seen = [], set()
+    end = time.time()
+    while end >= start:
+        page = [r for r in fetch(start, end) if r['id'] not in seen]
+        if not page:
+            break
+        records.extend(page)
+        seen.update(r['id'] for r in page)
+        end = min(_timestamp(r[time_key]) for r in page)
+    return records
+
+
+class Ledger:
+    """
+    SQLite copy of the account's fills, funding payments and order history. sync() only requests
+    records from the last stored time onwards, inserts are idempotent, and trades touched by new
+    fills are rebuilt from the fills after the last closed trade, so reports are indexed local
+    queries. A ledger holds a single connection. sqlite3 refuses that connection on any thread
+    but the one that opened it, so a ledger is created, used and closed on one thread, as arb.py
+    does on its main thread once a trade completes.
+    """
+
+    def __init__(self, path: str) -> None:
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        self._db = sqlite3.connect(path)
+        self._db.row_factory = sqlite3.Row
+        self._db.execute('PRAGMA journal_mode=WAL')
+        self._db.executescript(SCHEMA)
+
+    def close(self) -> None:
+        self._db.close()
+
+    def _last_time(self, table: str, column: str = 'time') -> float:
+        return self._db.execute(f'SELECT MAX({column}) FROM {table}').fetchone()[0] or 0.0
+
+    # Fetch records newer than those stored and rebuild affected trades. Return the number of records stored per table.
+    def sync(self, rest) -> Dict[str, int]:
+        fills = fetch_since(lambda s, e: rest.get_fills(start_time=s, end_time=e), self._last_time('fills'))
+        payments = fetch_since(rest.get_funding_payments, self._last_time('funding_payments'))
+
+        # Orders change status after creation, so open ones are fetched again until they close
+        oldest_open = self._db.execute("SELECT MIN(created_at) FROM orders WHERE status != 'closed'").fetchone()[0]
+        orders = fetch_since(lambda s, e: rest.get_order_history(start_time=s, end_time=e),
+                             oldest_open or self._last_time('orders', 'created_at'), 'createdAt')
+
+        with self._db:
+            counts = {
+                'fills': self._insert_fills(fills),
+                'funding_payments': self._insert_funding(payments),
+                'orders': len(orders),
+            }
+            self._db.executemany(
+                'INSERT OR REPLACE INTO orders VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                [(o['id'], o['market'], o['side'], o['type'], o['price'], o['size'], o['filledSize'], o['avgFillPrice'],
+                  o['status'], _timestamp(o['createdAt']), json.dumps(o)) for o in orders])
+            for coin in {underlying(f['market']) for f in fills} | {underlying(p['future']) for p in payments}:
+                self._rebuild_trades(coin)
+        return counts
+
+    def _insert_fills(self, fills: List[dict]) -> int:
+        rows = []
+        for f in fills:
+            # Spot buys pay their fee in the coin bought
+            fee = f['fee'] * f['price'] if f['feeCurrency'] == f.get('baseCurrency') else f['fee']
+            rows.append((f['id'], f['market'], underlying(f['market']), f['side'], f['price'], f['size'], fee,
+                         f.get('liquidity'), f.get('orderId'), _timestamp(f['time']), json.dumps(f)))
+        before = self._db.total_changes
+        self._db.executemany('INSERT OR IGNORE INTO fills VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)', rows)
+        return self._db.total_changes - before
+
+    def _insert_funding(self, payments: List[dict]) -> int:
+        before = self._db.total_changes
+        self._db.executemany('INSERT OR IGNORE INTO funding_payments VALUES (?, ?, ?, ?, ?, ?)',
+                             [(p['id'], p['future'], underlying(p['future']), p['payment'], p['rate'], _timestamp(p['time']))
+                              for p in payments])
+        return self._db.total_changes - before
+
+    # Replace the open trade of an underlying with trades rebuilt from the fills after its last closed trade
+    def _rebuild_trades(self, coin: str) -> None:
+        db = self._db
+        db.execute('DELETE FROM trades WHERE underlying = ? AND closed_at IS NULL', (coin,))
+        after = db.execute('SELECT MAX(closed_at) FROM trades WHERE underlying = ?', (coin,)).fetchone()[0] or 0.0
+        # Fees charged in the coin bought or sold change the coin held, so they are netted out of the size.
+        # What remains after closing at the traded size is fee dust, below DUST_FRACTION of the peak size.
+        fills = db.execute("SELECT market, side, price, size, fee, time, CASE WHEN json_extract(raw, '$.feeCurrency') = "
+                           "json_extract(raw, '$.baseCurrency') THEN json_extract(raw, '$.fee') ELSE 0 END AS base_fee "
+                           'FROM fills WHERE underlying = ? AND time > ? ORDER BY time, id', (coin, after)).fetchall()
+        trade = None
+        for f in fills:
+            if trade is None:
+                trade = {'opened_at': f['time'], 'fills': 0, 'volume': 0.0, 'fees': 0.0, 'positions': {}, 'peaks': {}}
+            position = trade['positions'].setdefault(f['market'], Position(f['market'], 'perp' if '-' in f['market'] else 'spot', f['side']))
+            position.apply_fill(f['side'], f['size'] - f['base_fee'] if f['side'] == 'buy' else f['size'] + f['base_fee'], f['price'])
+            trade['peaks'][f['market']] = max(trade['peaks'].get(f['market'], 0.0), position.size)
+            trade['fills'] += 1
+            trade['volume'] += f['price'] * f['size']
+            trade['fees'] += f['fee']
+            if all(p.size <= trade['peaks'][m] * DUST_FRACTION for m, p in trade['positions'].items()):
+                self._write_trade(coin, trade, f['time'])
+                trade = None
+        if trade:
+            self._write_trade(coin, trade, None)
+
+    def _write_trade(self, coin: str, trade: Dict, closed_at: Optional[float]) -> None:
+        paid = self._db.execute('SELECT COALESCE(SUM(payment), 0) FROM funding_payments WHERE underlying = ? AND time >= ? AND time <= ?',
+                                (coin, trade['opened_at'], closed_at or float('inf'))).fetchone()[0]
+        realized = sum(p.realized_pnl for p in trade['positions'].values())
+        self._db.execute('INSERT INTO trades (underlying, opened_at, closed_at, fills, volume, realized_pnl, fees, funding, net_pnl) '
+                         'VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                         (coin, trade['opened_at'], closed_at, trade['fills'], trade['volume'], realized, trade['fees'],
+                          -paid, realized - trade['fees'] - paid))
+
+    # -----------------------------------------------------------------
+    # Queries
+    # -----------------------------------------------------------------
+
+    def trades(self, coin: str = None, since: float = 0.0, until: float = None) -> List[sqlite3.Row]:
+        query, args = 'SELECT * FROM trades WHERE opened_at >= ? AND opened_at <= ?', [since, until or float('inf')]
+        if coin:
+            query, args = query + ' AND underlying = ?', args + [coin]
+        return self._db.execute(query + ' ORDER BY opened_at', args).fetchall()
+
+    def fills(self, market: str = None, order_id: int = None, since: float = 0.0, until: float = None) -> List[sqlite3.Row]:
+        query, args = 'SELECT * FROM fills WHERE time >= ? AND time <= ?', [since, until or float('inf')]
+        if market:
+            query, args = query + ' AND market = ?', args + [market]
+        if order_id is not None:
+            query, args = query + ' AND order_id = ?', args + [order_id]
+        return self._db.execute(query + ' ORDER BY time, id', args).fetchall()
+
+    # Return totals per underlying over trades opened in [since, until]
+    def summary(self, since: float = 0.0, until: float = None) -> List[sqlite3.Row]:
+        return self._db.execute(
+            'SELECT underlying, COUNT(*) AS trades, SUM(closed_at IS NULL) AS open, SUM(fills) AS fills, SUM(volume) AS volume, '
+            'SUM(realized_pnl) AS realized_pnl, SUM(fees) AS fees, SUM(funding) AS funding, SUM(net_pnl) AS net_pnl '
+            'FROM trades WHERE opened_at >= ? AND opened_at <= ? GROUP BY underlying ORDER BY net_pnl DESC',
+            (since, until or float('inf'))).fetchall()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='Sync and report on the local fills and funding ledger.')
+    parser.add_argument('--path', default='state/ledger.db')
+    parser.add_argument('--sync', action='store_true', help='Fetch new fills, funding payments and orders first')
+    parser.add_argument('--subaccount', help='Subaccount to sync')
+    parser.add_argument('--since', help='Only report trades opened from this ISO date or time')
+    parser.add_argument('--trades', action='store_true', help='List each trade, not only the totals')
+    args = parser.parse_args()
+
+    ledger = Ledger(args.path)
+    if args.sync:
+        from ftx_rest import FtxRestClient
+        rest = FtxRestClient(os.environ['BASIS_API_KEY_FTX'], os.environ['BASIS_API_SECRET_FTX'], args.subaccount)
+        started = time.perf_counter()
+        counts = ledger.sync(rest)
+        print(f"Synced {counts} in {time.perf_counter() - started:.1f}s")
+
+    since = _timestamp(args.since) if args.since else 0.0
+    print(f"{'underlying':<10} {'trades':>6} {'open':>4} {'fills':>6} {'volume':>12} {'realized':>10} {'fees':>9} {'funding':>9} {'net':>10}")
+    for s in ledger.summary(since):
+        print(f"{s['underlying']:<10} {s['trades']:>6} {s['open']:>4} {s['fills']:>6} {s['volume']:>12.2f} {s['realized_pnl']:>10.4f} "
+              f"{s['fees']:>9.4f} {s['funding']:>9.4f} {s['net_pnl']:>10.4f}")
+    if args.trades:
+        for t in ledger.trades(since=since):
+            closed = time.strftime('%Y-%m-%d %H:%M', time.localtime(t['closed_at'])) if t['closed_at'] else 'open'
+            print(f"#{t['id']:<5} {t['underlying']:<8} {time.strftime('%Y-%m-%d %H:%M', time.localtime(t['opened_at']))} -> {closed:<16} "
+                  f"fills {t['fills']:>3}  net {t['net_pnl']:.4f}  (realized {t['realized_pnl']:.4f}, fees {t['fees']:.4f}, funding {t['funding']:.4f})")
+    ledger.close()
+
+
+if __name__ == '__main__':
+    main()
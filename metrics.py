@@ -0,0 +1,100 @@
+import time
+import logging
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from threading import Lock, Thread
+from typing import Callable, Deque, Dict, Hashable, List, NamedTuple, Tuple
+
+
+class Sample(NamedTuple):
+    name: str
+    value: float
+    labels: Tuple[Tuple[str, str], ...] = ()
+
+
+def _escape(value) -> str:
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+# Return samples in the Prometheus text exposition format
+def format_samples(samples: List[Sample]) -> str:
+    lines = []
+    for sample in samples:
+        labels = ','.join(f'{k}="{_escape(v)}"' for k, v in sample.labels)
+        lines.append(f"{sample.name}{{{labels}}} {float(sample.value)!r}" if labels else f"{sample.name} {float(sample.value)!r}")
+    return '\n'.join(lines) + '\n'
+
+
+class RateTracker:
+    """
+    Turns ever increasing counters into per second rates over roughly the last window_s, however
+    often or rarely it is asked.
+    """
+
+    def __init__(self, window_s: float) -> None:
+        self._window_s = window_s
+        self._history: Deque[Tuple[float, Dict[Hashable, int]]] = deque()
+        self._lock = Lock()
+
+    def rates(self, counts: Dict[Hashable, int]) -> Dict[Hashable, float]:
+        now = time.monotonic()
+        with self._lock:
+            self._history.append((now, dict(counts)))
+            while len(self._history) > 2 and now - self._history[1][0] >= self._window_s:
+                self._history.popleft()
+            then, old = self._history[0]
+        elapsed = now - then
+        if not elapsed:
+            return {key: 0.0 for key in counts}
+        return {key: (count - old.get(key, 0)) / elapsed for key, count in counts.items()}
+
+
+class MetricsServer:
+    """
+    Serves GET /metrics in the Prometheus text format from a daemon thread. collect() is only
+    called when the endpoint is scraped, so nothing is added to the strategy or feed threads.
+    """
+
+    def __init__(self, port: int, collect: Callable[[], List[Sample]], host: str = '127.0.0.1') -> None:
+        def handler_factory(*args, **kwargs):
+            return _MetricsHandler(collect, *args, **kwargs)
+        self._server = ThreadingHTTPServer((host, port), handler_factory)
+        self._server.daemon_threads = True
+        self._thread = Thread(target=self._server.serve_forever, daemon=True)
+
+    @property
+    def port(self) -> int:
+        return self._server.server_address[1]
+
+    def start(self) -> None:
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._server.shutdown()
+        self._server.server_close()
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+
+    def __init__(self, collect: Callable[[], List[Sample]], *args, **kwargs) -> None:
+        self._collect = collect
+        super().__init__(*args, **kwargs)
+
+    def do_GET(self) -> None:
+        if self.path.split('?')[0] != '/metrics':
+            self.send_error(404)
+            return
+        try:
+            body = format_samples(self._collect()).encode()
+        except Exception as e:
+            logging.getLogger().info(f"Metrics collection failed: {e}")
+            self.send_error(500)
+            return
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain; version=0.0.4')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args) -> None:
+        pass
@@ -0,0 +1,216 @@
+from decimal import Decimal
+from typing import Dict, NamedTuple, Optional, Tuple
+
+
+class StrategyParams(NamedTuple):
+    """
+    Tuning constants of the strategy loop, passed to run() and evaluated offline by sweep.py.
+    The defaults in use live in arb.py as STRATEGY_PARAMS.
+    """
+    basis_threshold: float          # Smallest percentage basis that qualifies for an entry
+    margin_for_entry: float         # Fraction of basis_threshold required for entries after the first
+    bad_entry_cutoff: float         # % past entry at which an unhedged leg is stopped out
+    apr_exit_threshold: float       # Funding in the wrong direction at or above this is an exit
+    quote_index: int                # Book level used for limit order prices, 0 is the top of book
+    move_order_threshold: int       # Ticks between order and quote price before an order is moved
+    orders_per_side: int            # Staggered orders used to reach max size
+
+
+class Settings(NamedTuple):
+    """
+    Operational settings of run(): markets, sizing, feeds, paths and supervision. Everything the
+    strategy decides with lives in StrategyParams instead. The defaults in use live in arb.py as
+    SETTINGS, a config file or command line flags override them by field name.
+    """
+    subaccount: str
+    market: Tuple[str, str, float]  # (spot ticker, perp ticker, size step common to both)
+    account_size: float             # Maximum combined notional of both positions
+    max_child_orders: int           # Child limit orders worked at once per leg
+    child_depth_fraction: float     # Fraction of the visible size at its price a child order is sized to
+    reprice_min_gain_s: float       # Seconds sooner an order must be expected to fill before it is moved
+    orderbook_depth: Optional[int]  # Book levels kept per side, None keeps every level
+    ws_connections: int             # Websocket connections market data is taken from
+    ws_ready_timeout_s: float
+    market_cache_path: str
+    market_cache_max_age_s: float
+    log_path: str
+    state_path: str
+    ledger_path: str
+    reconcile_interval_s: float
+    feed_stale_s: Tuple[float, float]   # Seconds without a (spot, perp) book update before that market is frozen
+    feed_resume_after_s: float
+    feed_check_interval_s: float
+    profile_path: str
+    profile_sample_interval_s: float
+    profile_default_s: float
+    min_evaluation_interval_s: float
+    max_evaluation_interval_s: float
+    metrics_port: Optional[int]     # None disables the endpoint
+    metrics_rate_window_s: float
+    dashboard_fps: float
+    manual_exit_key: Optional[str]  # None disables it
+    debug_output: bool
+
+
+# Return the number of decimal places an increment is written with, 7 for 2.5e-06 and 0 for 10.0
+def increment_decimals(increment: float) -> int:
+    return max(-Decimal(str(increment)).normalize().as_tuple().exponent, 0)
+
+
+class Instrument:
+    """
+    Price and size increments of one market. Strategy side prices and sizes are integer ticks and
+    lots of these increments, exact to compare and hash. They become floats only for the exchange
+    and for display, rounded to the increment's decimals so they read as the exchange writes them.
+    """
+    __slots__ = ('market', 'price_increment', 'size_increment', '_price_decimals', '_size_decimals')
+
+    def __init__(self, market: str, price_increment: float, size_increment: float) -> None:
+        self.market = market
+        self.price_increment = price_increment
+        self.size_increment = size_increment
+        self._price_decimals = increment_decimals(price_increment)
+        self._size_decimals = increment_decimals(size_increment)
+
+    # Return the Instrument of a market from its exchange metadata, as returned by get_markets
+    @classmethod
+    def from_market(cls, info: Dict) -> 'Instrument':
+        return cls(info['name'], info['priceIncrement'], info['sizeIncrement'])
+
+    def ticks(self, price: float) -> int:
+        return round(price / self.price_increment)
+
+    def price(self, ticks: int) -> float:
+        return round(ticks * self.price_increment, self._price_decimals)
+
+    def lots(self, size: float) -> int:
+        return round(size / self.size_increment)
+
+    def size(self, lots: int) -> float:
+        return round(lots * self.size_increment, self._size_decimals)
+
+    def __repr__(self) -> str:
+        return f"Instrument({self.market}, {self.price_increment}, {self.size_increment})"
+
+
+class Order:
+    __slots__ = ('id', 'market', 'side', 'type', 'price', 'size', 'filled_size', 'avg_fill_price', 'status', 'msg_time')
+
+    def __init__(self, id: int, market: str, side: str, type: str, price: Optional[float], size: float,
+                 filled_size: float = 0.0, avg_fill_price: Optional[float] = None, status: str = 'new',
+                 msg_time: int = 0) -> None:
+        self.id = id
+        self.market = market
+        self.side = side
+        self.type = type
+        self.price = price
+        self.size = size
+        self.filled_size = filled_size
+        self.avg_fill_price = avg_fill_price
+        self.status = status
+        self.msg_time = msg_time
+
+    # Return an Order from an exchange order payload, as received on the orders channel
+    @classmethod
+    def from_update(cls, update: Dict) -> 'Order':
+        return cls(update['id'], update['market'], update['side'], update['type'], update['price'], update['size'],
+                   update['filledSize'], update['avgFillPrice'], update['status'], update.get('msg_time', 0))
+
+    def update(self, update: Dict) -> None:
+        self.price = update['price']
+        self.size = update['size']
+        self.filled_size = update['filledSize']
+        self.avg_fill_price = update['avgFillPrice']
+        self.status = update['status']
+        self.msg_time = update.get('msg_time', self.msg_time)
+
+    def to_dict(self) -> Dict:
+        return {k: getattr(self, k) for k in self.__slots__}
+
+    @classmethod
+    def from_dict(cls, data: Dict) -> 'Order':
+        return cls(**data)
+
+    @property
+    def remaining_size(self) -> float:
+        return self.size - self.filled_size
+
+    def __repr__(self) -> str:
+        return f"Order({self.id}, {self.market}, {self.side}, {self.price}, {self.size}, {self.status})"
+
+
+class Position:
+    """
+    Position in one market with an exact size weighted average entry. Realized PnL is booked on
+    every reducing fill, unrealized PnL on every mark and funding as it is paid or received,
+    so total PnL is always current without recomputing from fills.
+    """
+    __slots__ = ('ticker', 'type', 'side', 'size', 'avg_entry_price', 'fill_count', 'mark_price',
+                 'realized_pnl', 'unrealized_pnl', 'funding_pnl')
+
+    def __init__(self, ticker: str, type: str, side: str) -> None:
+        self.ticker = ticker
+        self.type = type
+        self.side = side
+        self.size = 0.0
+        self.avg_entry_price = 0.0
+        self.fill_count = 0
+        self.mark_price = 0.0
+        self.realized_pnl = 0.0
+        self.unrealized_pnl = 0.0
+        self.funding_pnl = 0.0
+
+    def to_dict(self) -> Dict:
+        return {k: getattr(self, k) for k in self.__slots__}
+
+    @classmethod
+    def from_dict(cls, data: Dict) -> 'Position':
+        position = cls(data['ticker'], data['type'], data['side'])
+        for k in cls.__slots__:
+            setattr(position, k, data[k])
+        return position
+
+    @property
+    def direction(self) -> int:
+        return 1 if self.side == 'buy' else -1
+
+    @property
+    def total_pnl(self) -> float:
+        return self.realized_pnl + self.unrealized_pnl + self.funding_pnl
+
+    def apply_fill(self, side: str, size: float, price: float) -> None:
+        if self.size == 0:
+            self.side = side
+
+        # Increase, average entry is weighted by filled size
+        if side == self.side:
+            new_size = self.size + size
+            self.avg_entry_price = (self.avg_entry_price * self.size + price * size) / new_size
+            self.size = round(new_size, 8)
+            self.fill_count += 1
+
+        # Decrease, book realized PnL on the closed size and flip if the fill is larger than the position
+        else:
+            closed = min(size, self.size)
+            self.realized_pnl += (price - self.avg_entry_price) * closed * self.direction
+            self.size = round(self.size - closed, 8)
+            self.fill_count = max(self.fill_count - 1, 0)
+            if size > closed:
+                self.side = side
+                self.size = round(size - closed, 8)
+                self.avg_entry_price = price
+                self.fill_count = 1
+            elif self.size == 0:
+                self.avg_entry_price = 0.0
+        self.mark(self.mark_price or price)
+
+    def mark(self, price: float) -> None:
+        self.mark_price = price
+        self.unrealized_pnl = (price - self.avg_entry_price) * self.size * self.direction
+
+    # Accrue one funding payment at the given rate, longs pay shorts when the rate is positive
+    def accrue_funding(self, rate: float) -> None:
+        self.funding_pnl -= rate * self.size * self.mark_price * self.direction
+
+    def __repr__(self) -> str:
+        return f"Position({self.ticker}, {self.side}, {self.size} @ {self.avg_entry_price}, pnl {self.total_pnl})"
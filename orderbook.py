@@ -0,0 +1,172 @@
+import struct
+import zlib
+from bisect import bisect_left
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+
+CHECKSUM_DEPTH = 100                        # Levels per side covered by the exchange orderbook checksum
+LEVEL_TEXT_BYTES = 8                        # Initial width of a bounded book level checksum text, widened to the longest one seen
+SLACK_LEVELS = 20                           # Extra levels kept so inserts and deletes within one message never lose a level that is still needed
+
+BIDS, ASKS = 0, 1
+
+
+# Return the checksum text of one level as the exchange writes it, price and size as floats
+def level_text(price: float, size: float) -> str:
+    return f'{float(price)}:{float(size)}'
+
+
+# Return the exchange CRC32 checksum from the level texts of each side, best first. Levels
+# alternate bid and ask, the longer side continues alone once the shorter one runs out.
+def checksum_from_texts(bids: List[str], asks: List[str]) -> int:
+    bids, asks = bids[:CHECKSUM_DEPTH], asks[:CHECKSUM_DEPTH]
+    n = min(len(bids), len(asks))
+    parts = [''] * (2 * n)
+    parts[0::2], parts[1::2] = bids[:n], asks[:n]
+    return zlib.crc32(':'.join(parts + bids[n:] + asks[n:]).encode())
+
+
+# Return the exchange CRC32 checksum of a book given as sorted (price, size) levels, best first
+def orderbook_checksum(bids: List[Tuple[float, float]], asks: List[Tuple[float, float]]) -> int:
+    return checksum_from_texts([level_text(p, s) for p, s in bids[:CHECKSUM_DEPTH]],
+                               [level_text(p, s) for p, s in asks[:CHECKSUM_DEPTH]])
+
+
+class SortedOrderbook:
+    """
+    Book of every level the exchange sends. Prices are kept sorted best first as they are inserted
+    and deleted, bid prices negated so both sides search ascending, and each level's checksum text
+    is formatted once when it changes and kept in the same order, so neither a sort nor float
+    formatting runs per message.
+    """
+    __slots__ = ('_keys', '_sizes', '_texts')
+
+    def __init__(self) -> None:
+        self._keys: Tuple[List[float], List[float]] = ([], [])
+        self._sizes: Tuple[Dict[float, float], Dict[float, float]] = ({}, {})
+        self._texts: Tuple[List[str], List[str]] = ([], [])
+
+    def update(self, side: int, price: float, size: float) -> None:
+        keys, sizes, texts = self._keys[side], self._sizes[side], self._texts[side]
+        if not size and price not in sizes:
+            return
+        key = -price if side == BIDS else price
+        i = bisect_left(keys, key)
+        if not size:
+            del keys[i], texts[i], sizes[price]
+        elif price in sizes:
+            sizes[price] = size
+            texts[i] = level_text(price, size)
+        else:
+            keys.insert(i, key)
+            texts.insert(i, level_text(price, size))
+            sizes[price] = size
+
+    def levels(self, side: int, depth: int) -> List[Tuple[float, float]]:
+        sizes = self._sizes[side]
+        if side == BIDS:
+            return [(-k, sizes[-k]) for k in self._keys[side][:depth]]
+        return [(k, sizes[k]) for k in self._keys[side][:depth]]
+
+    def best(self, side: int) -> Optional[Tuple[float, float]]:
+        keys = self._keys[side]
+        if not keys:
+            return None
+        price = -keys[0] if side == BIDS else keys[0]
+        return (price, self._sizes[side][price])
+
+    def checksum(self) -> int:
+        return checksum_from_texts(*self._texts)
+
+
+class BoundedOrderbook:
+    """
+    Fixed capacity book held in a preallocated buffer, one row per level holding the key, the size
+    and the level's checksum text NUL padded to a fixed width, each side sorted best first. Keys
+    are the prices with bids negated so both sides search ascending. An insert into a full side
+    drops its worst level, so memory per book never grows, and rows are the only per-level state.
+    A checksum interleaves the top CHECKSUM_DEPTH texts of both sides into a second buffer.
+    """
+    __slots__ = ('capacity', '_counts', '_width', '_row', '_pack', '_rows', '_buffers', '_keys', '_sizes',
+                 '_texts', '_joined', '_pairs')
+
+    def __init__(self, capacity: int) -> None:
+        self.capacity = capacity
+        self._width = LEVEL_TEXT_BYTES
+        self.clear()
+
+    def clear(self) -> None:
+        self._counts = [0, 0]
+        self._set_width(self._width, False)
+
+    # Allocate rows for texts up to width bytes, rounded up to a multiple of 8 so keys and sizes stay
+    # aligned, and copy the levels of the current rows if asked. Each side's rows are reached through
+    # a byte view for row moves and strided views of keys and sizes for searching and reading levels.
+    # The checksum copies the texts of both sides into pairs exactly width bytes wide.
+    def _set_width(self, width: int, copy: bool) -> None:
+        dtype = np.dtype([('key', 'f8'), ('size', 'f8'), ('text', f'S{-(-width // 8) * 8}')])
+        self._width, self._row = width, dtype.itemsize
+        self._pack = struct.Struct(f'dd{dtype.itemsize - 16}s').pack_into
+        buffer = memoryview(bytearray(2 * self.capacity * self._row))
+        rows = np.frombuffer(buffer, dtype).reshape(2, self.capacity)
+        if copy:
+            rows[:] = self._rows.astype(dtype)
+        half = self.capacity * self._row
+        self._rows, self._buffers = rows, (buffer[:half], buffer[half:])
+        self._keys = tuple(b.cast('d')[0::self._row // 8] for b in self._buffers)
+        self._sizes = tuple(b.cast('d')[1::self._row // 8] for b in self._buffers)
+        self._texts = rows['text'].T
+        depth = min(self.capacity, CHECKSUM_DEPTH)
+        self._joined = bytearray(2 * depth * width)
+        self._pairs = np.frombuffer(self._joined, f'S{width}').reshape(depth, 2)
+
+    def update(self, side: int, price: float, size: float) -> None:
+        keys, n, row = self._keys[side], self._counts[side], self._row
+        key = -price if side == BIDS else price
+        i = bisect_left(keys, key, 0, n)
+        if i < n and keys[i] == key:
+            if not size:
+                buffer = self._buffers[side]
+                buffer[i * row:(n - 1) * row] = buffer[(i + 1) * row:n * row]
+                self._counts[side] = n - 1
+                return
+        elif not size or i == self.capacity:
+            return
+        else:
+            buffer = self._buffers[side]
+            if n == self.capacity:
+                n -= 1
+            buffer[(i + 1) * row:(n + 1) * row] = buffer[i * row:n * row]
+            self._counts[side] = n + 1
+        text = f'{float(price)!r}:{float(size)!r}:'.encode()
+        if len(text) > self._width:
+            self._set_width(len(text), True)
+            row = self._row
+        self._pack(self._buffers[side], i * row, key, size, text)
+
+    def levels(self, side: int, depth: int) -> List[Tuple[float, float]]:
+        n = min(self._counts[side], depth)
+        prices = self._keys[side][:n].tolist()
+        if side == BIDS:
+            prices = [-k for k in prices]
+        return list(zip(prices, self._sizes[side][:n].tolist()))
+
+    def best(self, side: int) -> Optional[Tuple[float, float]]:
+        if not self._counts[side]:
+            return None
+        key = self._keys[side][0]
+        return (-key if side == BIDS else key, self._sizes[side][0])
+
+    # Texts past the shorter side are left as padding, so once padding is dropped the longer side simply continues
+    def checksum(self) -> int:
+        bids, asks = self._counts
+        depth = min(max(bids, asks), CHECKSUM_DEPTH)
+        self._pairs[:depth] = self._texts[:depth]
+        if bids < depth:
+            self._pairs[bids:depth, BIDS] = b''
+        elif asks < depth:
+            self._pairs[asks:depth, ASKS] = b''
+        joined = self._joined if depth == len(self._pairs) else self._joined[:2 * depth * self._width]
+        return zlib.crc32(memoryview(joined.translate(None, b'\0'))[:-1])
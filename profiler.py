@@ -0,0 +1,184 @@
+import os
+import sys
+import time
+import signal
+import logging
+import threading
+from collections import Counter
+from pathlib import Path
+from typing import Callable, Dict, List, Optional
+
+
+TRIGGER_CHECK_INTERVAL_S = 1                # The trigger file is looked for at most this often, not on every loop iteration
+
+
+class SectionTimer:
+    """
+    Lap timer for the sections of the strategy loop. lap(name) charges the time since the previous
+    lap, or since start_iteration(), to name. While disabled every call is a single flag check, so
+    the calls stay in place and timing can be switched on in a running process.
+    """
+
+    def __init__(self, enabled: bool = False) -> None:
+        self.enabled = enabled
+        self._lock = threading.Lock()
+        self._stats: Dict[str, List[float]] = {}        # name: [count, total_s, max_s]
+        self._mark = 0.0
+        self._started_at = time.time()
+
+    def start_iteration(self) -> None:
+        if self.enabled:
+            self._mark = time.perf_counter()
+
+    def lap(self, name: str) -> None:
+        if not self.enabled:
+            return
+        now = time.perf_counter()
+        mark, self._mark = self._mark, now
+        if not mark:
+            # Enabled part way through an iteration, there is no start to measure from
+            return
+        elapsed = now - mark
+        with self._lock:
+            stats = self._stats.get(name)
+            if stats is None:
+                self._stats[name] = [1, elapsed, elapsed]
+            else:
+                stats[0] += 1
+                stats[1] += elapsed
+                stats[2] = max(stats[2], elapsed)
+
+    def reset(self) -> None:
+        with self._lock:
+            self._stats.clear()
+            self._mark = 0.0
+            self._started_at = time.time()
+
+    # Return one line per section by total time, with count, mean, worst and share of all timed sections
+    def summary(self) -> List[str]:
+        with self._lock:
+            stats = sorted(self._stats.items(), key=lambda s: -s[1][1])
+        total = sum(s[1] for _, s in stats) or 1.0
+        lines = [f"{'section':<14} {'count':>7} {'mean ms':>9} {'max ms':>9} {'share':>7}   over {time.time() - self._started_at:.0f}s"]
+        for name, (count, total_s, max_s) in stats:
+            lines.append(f"{name:<14} {count:>7} {total_s / count * 1000:>9.3f} {max_s * 1000:>9.3f} {total_s / total:>7.1%}")
+        return lines
+
+
+class SamplingProfiler:
+    """
+    Samples the stack of one thread every interval_s from a background thread and counts identical
+    stacks. Nothing is hooked into the sampled thread, so starting it on a live process is safe and
+    the cost is one stack walk per sample. While sampling, the interpreter switch interval is cut
+    to a tenth of interval_s, otherwise the sampler only gets the GIL once the sampled thread
+    blocks and CPU bursts shorter than the default 5ms never show up.
+    Output is the collapsed stack format read by flamegraph.pl, speedscope and inferno.
+    """
+
+    def __init__(self, thread_id: Optional[int] = None, interval_s: float = 0.005) -> None:
+        self._thread_id = thread_id or threading.get_ident()
+        self._interval_s = interval_s
+        self._stacks: Counter = Counter()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self.samples = 0
+
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    # Sample for duration_s then call on_done with this profiler. Return False if already sampling.
+    def start(self, duration_s: float, on_done: Callable[['SamplingProfiler'], None] = None) -> bool:
+        if self.running():
+            return False
+        self._stacks.clear()
+        self.samples = 0
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, args=(duration_s, on_done), daemon=True)
+        self._thread.start()
+        return True
+
+    def stop(self) -> None:
+        self._stop.set()
+
+    def _run(self, duration_s: float, on_done: Optional[Callable[['SamplingProfiler'], None]]) -> None:
+        deadline = time.perf_counter() + duration_s
+        switch_interval = sys.getswitchinterval()
+        sys.setswitchinterval(min(switch_interval, self._interval_s / 10))
+        try:
+            while time.perf_counter() < deadline and not self._stop.wait(self._interval_s):
+                frame = sys._current_frames().get(self._thread_id)
+                if frame is None:
+                    break
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f'{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})')
+                    frame = frame.f_back
+                self._stacks[';'.join(reversed(stack))] += 1
+                self.samples += 1
+        finally:
+            sys.setswitchinterval(switch_interval)
+        if on_done:
+            on_done(self)
+
+    def collapsed(self) -> List[str]:
+        return [f'{stack} {count}' for stack, count in self._stacks.most_common()]
+
+
+class Profiler:
+    """
+    Profiling mode for run(). trigger() switches on section timing and samples the strategy thread
+    for a number of seconds, then writes <time>.folded (flame graph stacks) and <time>.sections.txt
+    to directory and turns section timing back off. A live process is triggered by SIGUSR1 where
+    the platform has it, or by creating a file named 'trigger' in directory, which is picked up
+within TRIGGER_CHECK_INTERVAL_S.
+    """
+
+    def __init__(self, directory: str, interval_s: float, default_duration_s: float) -> None:
+        self._directory = Path(directory)
+        self._default_duration_s = default_duration_s
+        self._trigger_path = self._directory / 'trigger'
+        self._trigger_checked_at = 0.0
+        self.sections = SectionTimer()
+        self._sampler = SamplingProfiler(threading.get_ident(), interval_s)
+
+    # Signal handlers can only be installed from the main thread, strategies on other threads use the trigger file
+    def install_signal_handler(self) -> None:
+        if hasattr(signal, 'SIGUSR1') and threading.current_thread() is threading.main_thread():
+            signal.signal(signal.SIGUSR1, lambda signum, frame: self.trigger())
+
+    def trigger(self, duration_s: Optional[float] = None) -> bool:
+        duration_s = duration_s or self._default_duration_s
+        if self._sampler.running():
+            return False
+        self.sections.reset()
+        self.sections.enabled = True
+        logging.getLogger().info(f"Profiling for {duration_s}s")
+        return self._sampler.start(duration_s, self._write)
+
+    # Call once per loop iteration in place of sections.start_iteration(), also picks up a trigger file
+    def start_iteration(self) -> None:
+        now = time.monotonic()
+        if now - self._trigger_checked_at >= TRIGGER_CHECK_INTERVAL_S:
+            self._trigger_checked_at = now
+            if self._trigger_path.exists():
+                try:
+                    self._trigger_path.unlink()
+                except OSError:
+                    pass
+                self.trigger()
+        self.sections.start_iteration()
+
+    def _write(self, sampler: SamplingProfiler) -> None:
+        self.sections.enabled = False
+        self._directory.mkdir(parents=True, exist_ok=True)
+        stem = self._directory / str(int(time.time()))
+        with open(f'{stem}.folded', 'w') as f:
+            f.write('\n'.join(sampler.collapsed()) + '\n')
+        summary = self.sections.summary()
+        with open(f'{stem}.sections.txt', 'w') as f:
+            f.write('\n'.join(summary) + '\n')
+        logger = logging.getLogger()
+        logger.info(f"Profile written to {stem}.folded from {sampler.samples} samples")
+        for line in summary:
+            logger.info("Profile " + line)
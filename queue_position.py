@@ -0,0 +1,172 @@
+import time
+from collections import defaultdict
+from concurrent.futures import Future
+from typing import DefaultDict, Dict, List, Optional, Tuple
+
+from models import Order
+from venue import BookEvent, TradeEvent
+
+
+TRADE_RATE_HALFLIFE_S = 60.0                # Half life of the traded volume rate estimate per market side
+REPRICE_COOLDOWN_S = 5.0                    # Seconds between reprices of one order while nothing trades on its side
+
+
+class _QueueEntry:
+    __slots__ = ('order_id', 'market', 'side', 'price', 'remaining', 'ahead', 'level_size', 'traded_at_level',
+                 'modify', 'repriced_at')
+
+    def __init__(self, order_id, market: str, side: str, price: int, remaining: int, ahead: float,
+                 level_size: int) -> None:
+        self.order_id = order_id
+        self.market = market
+        self.side = side
+        self.price = price
+        self.remaining = remaining
+        self.ahead = ahead
+        self.level_size = level_size
+        self.traded_at_level = 0.0
+        self.modify: Optional[Future] = None
+        self.repriced_at = float('-inf')
+
+
+# Return visible lots resting at price ticks on the side of the book an order of the given side joins
+def level_size(book: BookEvent, side: str, price: int) -> int:
+    for level_price, size in (book.bids if side == 'buy' else book.asks):
+        if level_price == price:
+            return size
+    return 0
+
+
+class QueuePositionEstimator:
+    """
+    Tracks the estimated volume queued ahead of each of our resting limit orders, in the ticks
+    and lots of book and trade events.
+    Queue ahead shrinks by trades printed at our price and by a proportional share of
+    any other size reduction at our level (cancels are assumed to be spread evenly
+    through the queue). Expected time to fill is queue ahead plus our remaining size
+    divided by the recent rate of volume traded against our side of the book.
+
+    An order is not repriced while a modify request for it is in flight, nor after one succeeded,
+    as that replaced it with a new order. Without a trade rate to estimate from, the threshold in
+    ticks alone decides, at most once per cooldown_s per order.
+    """
+
+    def __init__(self, halflife_s: float = TRADE_RATE_HALFLIFE_S, cooldown_s: float = REPRICE_COOLDOWN_S) -> None:
+        self._halflife_s = halflife_s
+        self._cooldown_s = cooldown_s
+        self._entries: Dict[int, _QueueEntry] = {}
+        self._last_trade_id: DefaultDict[str, int] = defaultdict(int)
+        self._trade_rates: DefaultDict[Tuple[str, str], float] = defaultdict(float)    # (market, maker side) -> volume/s
+        self._trade_rate_times: Dict[Tuple[str, str], float] = {}
+
+    def track(self, order: Order, book: BookEvent) -> None:
+        if order.id in self._entries:
+            return
+        price, remaining = book.instrument.ticks(order.price), book.instrument.lots(order.remaining_size)
+        visible = level_size(book, order.side, price)
+
+        # Our own order is normally already visible in the book by the time the placement update arrives
+        ahead = max(visible - remaining, 0.0)
+        self._entries[order.id] = _QueueEntry(
+            order.id, order.market, order.side, price, remaining, ahead, visible)
+
+    def untrack(self, order_id) -> None:
+        self._entries.pop(order_id, None)
+
+    def on_book(self, book: BookEvent) -> None:
+        for entry in self._entries.values():
+            if entry.market != book.market:
+                continue
+            side_levels = book.bids if entry.side == 'buy' else book.asks
+            best = side_levels[0][0] if side_levels else None
+            visible = level_size(book, entry.side, entry.price)
+
+            # Price traded through our level, nothing can be left ahead of us
+            if best is not None and ((entry.side == 'buy' and best < entry.price) or (entry.side == 'sell' and best > entry.price)):
+                entry.ahead = 0.0
+
+            elif visible < entry.level_size:
+                reduction = entry.level_size - visible - entry.traded_at_level
+                others = entry.level_size - entry.remaining
+                if reduction > 0 and others > 0:
+                    entry.ahead -= reduction * min(entry.ahead / others, 1.0)
+                entry.ahead = max(entry.ahead, 0.0)
+
+            entry.level_size = visible
+            entry.traded_at_level = 0.0
+
+    def on_trades(self, market: str, trades: List[TradeEvent]) -> None:
+        last_id = self._last_trade_id[market]
+        now = time.time()
+        volume = defaultdict(float)
+        for t in trades:
+            if t.id <= last_id:
+                continue
+            self._last_trade_id[market] = max(self._last_trade_id[market], t.id)
+
+            # A taker buy lifts resting sells and vice versa
+            maker_side = 'sell' if t.side == 'buy' else 'buy'
+            volume[maker_side] += t.size
+            for entry in self._entries.values():
+                if entry.market != market or entry.side != maker_side:
+                    continue
+                if t.price == entry.price:
+                    entry.ahead = max(entry.ahead - t.size, 0.0)
+                    entry.traded_at_level += t.size
+                elif (maker_side == 'buy' and t.price < entry.price) or (maker_side == 'sell' and t.price > entry.price):
+                    entry.ahead = 0.0
+
+        for maker_side in ('buy', 'sell'):
+            self._decay_rate(market, maker_side, volume[maker_side], now)
+
+    def _decay_rate(self, market: str, maker_side: str, volume: float, now: float) -> None:
+        key = (market, maker_side)
+        last = self._trade_rate_times.get(key)
+        self._trade_rate_times[key] = now
+        if last is None:
+            return
+        elapsed = max(now - last, 1e-3)
+        decay = 0.5 ** (elapsed / self._halflife_s)
+        self._trade_rates[key] = self._trade_rates[key] * decay + (volume / elapsed) * (1 - decay)
+
+    def queue_ahead(self, order_id) -> Optional[float]:
+        entry = self._entries.get(order_id)
+        return entry.ahead if entry else None
+
+    # Return expected seconds until the order fully fills at its current price, inf if nothing trades on its side
+    def expected_time_to_fill(self, order_id) -> float:
+        entry = self._entries.get(order_id)
+        if entry is None:
+            return float('inf')
+        rate = self._trade_rates[(entry.market, entry.side)]
+        if rate <= 0:
+            return float('inf')
+        return (entry.ahead + entry.remaining) / rate
+
+    # Return expected seconds to fill a fresh order of size lots joining the back of the queue at price ticks
+    def expected_time_to_fill_at(self, market: str, side: str, price: int, size: int,
+                                 book: BookEvent) -> float:
+        rate = self._trade_rates[(market, side)]
+        if rate <= 0:
+            return float('inf')
+        return (level_size(book, side, price) + size) / rate
+
+    # Return True if moving the order to new_price ticks is expected to fill it sooner by more than min_gain_s
+    def should_reprice(self, order_id, new_price: int, min_ticks: int, book: BookEvent, min_gain_s: float) -> bool:
+        entry = self._entries.get(order_id)
+        if entry is None or abs(new_price - entry.price) < min_ticks:
+            return False
+        if entry.modify is not None and (not entry.modify.done() or entry.modify.exception() is None):
+            return False
+        current = self.expected_time_to_fill(order_id)
+        if current == float('inf'):
+            return time.monotonic() - entry.repriced_at >= self._cooldown_s
+        moved = self.expected_time_to_fill_at(entry.market, entry.side, new_price, entry.remaining, book)
+        return current - moved > min_gain_s
+
+    # Record the modify request sent to reprice an order
+    def on_reprice(self, order_id, request: Future) -> None:
+        entry = self._entries.get(order_id)
+        if entry is not None:
+            entry.modify = request
+            entry.repriced_at = time.monotonic()
@@ -0,0 +1,216 @@
+import time
+import logging
+from threading import Event, Lock, Thread
+from typing import Dict, List, NamedTuple, Optional, Tuple, Union
+
+from models import Order, Position
+
+
+CONFIRMATIONS = 2                           # Consecutive passes a difference must be seen in before it is corrected
+FILL_OVERLAP_S = 10                         # Each fills query reaches this far behind the previous one, for fills published late
+FILL_LOOKBACK_S = 300                       # Fills before the first pass that are fetched at startup
+FILL_RETENTION_S = 3600                     # Fill totals of orders no longer tracked locally are dropped after this
+
+
+class OrderClosed(NamedTuple):
+    order_id: int
+    market: str
+    side: str
+    size: float
+    filled_size: float                      # 0 for an order cancelled without fills
+    avg_fill_price: Optional[float]
+
+
+class OrderAdopted(NamedTuple):
+    order: Order                            # Open on the exchange but never seen locally
+
+
+class PositionCorrected(NamedTuple):
+    market: str
+    local_size: float                       # Net size, negative for short
+    exchange_size: float
+    entry_price: Optional[float]            # Exchange average entry where one is reported
+
+
+Correction = Union[OrderClosed, OrderAdopted, PositionCorrected]
+
+
+class _OrderFills:
+    __slots__ = ('size', 'notional', 'updated_at')
+
+    def __init__(self) -> None:
+        self.size = 0.0
+        self.notional = 0.0
+        self.updated_at = 0.0
+
+
+class Reconciler:
+    """
+    Background check of local positions and orders against the exchange. Every interval_s one
+    pass queries open orders, positions, balances and only the fills since the previous pass,
+    all at once on the scheduler's info lane, so a pass costs four requests however long the
+    strategy has run and never delays order placement or cancels.
+
+    Each pass diffs the exchange against the local state last handed over with update_local().
+    A difference has to persist for CONFIRMATIONS passes before it becomes a correction, which
+    leaves websocket updates in flight time to arrive. Local orders that are no longer open are
+    closed with their filled size from the accumulated fills, open orders never seen locally
+    are adopted, and position sizes are corrected once no order difference is outstanding. Fills
+    of orders that are still open are excluded from the comparison, the strategy applies them
+    when the order closes. The spot size is the coin balance less a baseline taken on the first
+    pass without order differences, so dust and coin held before the start are not corrected.
+    The strategy applies corrections from pop_corrections() on its own thread.
+    """
+
+    def __init__(self, rest, markets: Tuple[str, str], size_tolerance: float, interval_s: float) -> None:
+        self._rest = rest
+        self._markets = markets
+        self._size_tolerance = size_tolerance
+        self._interval_s = interval_s
+        self._lock = Lock()
+        self._local_positions: Dict[str, float] = {}
+        self._local_orders: Dict[int, Tuple[str, str, float, int]] = {}
+        self._corrections: List[Correction] = []
+        self._suspects: Dict[Tuple, int] = {}
+        self._fills: Dict[int, _OrderFills] = {}
+        self._seen_fills: Dict[int, float] = {}
+        self._fills_until = time.time() - FILL_LOOKBACK_S
+        self._covered_since_ns = int(self._fills_until * 1e9)
+        self._spot_baseline: Optional[float] = None
+        self.stats = {'passes': 0, 'failures': 0, 'corrections': 0, 'last_s': 0.0}
+        self._stop = Event()
+        self._thread = Thread(target=self._run, daemon=True)
+
+    def start(self) -> None:
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread.is_alive():
+            self._thread.join()
+
+    # Hand over the strategy's current state. Only net sizes and order identity are kept.
+    def update_local(self, positions: Dict[str, Position], orders: Dict[int, Order]) -> None:
+        local_positions = {t: p.size * p.direction for t, p in positions.items()}
+        local_orders = {i: (o.market, o.side, o.size, o.msg_time) for i, o in orders.items()}
+        with self._lock:
+            self._local_positions, self._local_orders = local_positions, local_orders
+
+    def pop_corrections(self) -> List[Correction]:
+        with self._lock:
+            corrections, self._corrections = self._corrections, []
+        return corrections
+
+    def _run(self) -> None:
+        while not self._stop.wait(self._interval_s):
+            started = time.perf_counter()
+            try:
+                self.reconcile()
+                self.stats['passes'] += 1
+            except Exception as e:
+                self.stats['failures'] += 1
+                logging.getLogger().info(f"Reconcile pass failed: {e}")
+            self.stats['last_s'] = time.perf_counter() - started
+
+    # Run one pass and return the corrections it confirmed, which are also queued for pop_corrections()
+    def reconcile(self) -> List[Correction]:
+        now = time.time()
+        start = self._fills_until - FILL_OVERLAP_S
+        open_orders = self._rest.submit('info', 'get_open_orders')
+        positions = self._rest.submit('info', 'get_positions')
+        balances = self._rest.submit('info', 'get_balances')
+        fills = self._rest.submit('info', 'get_fills', None, start, now)
+        open_orders, positions, balances, fills = open_orders.result(), positions.result(), balances.result(), fills.result()
+        self._fills_until = now
+        self._add_fills(fills, now)
+
+        with self._lock:
+            local_positions, local_orders = self._local_positions, self._local_orders
+        seen = set()
+
+        for order_id, (market, side, size, msg_time) in local_orders.items():
+            if order_id not in open_orders:
+                seen.add(('closed', order_id))
+        for order_id, o in open_orders.items():
+            if o['market'] in self._markets and order_id not in local_orders:
+                seen.add(('adopted', order_id))
+
+        # Sizes only settle once every order difference is resolved. Local positions only hold fills of
+        # closed orders, so fills of orders still open are taken out of the exchange sizes before comparing.
+        if not seen:
+            open_fills = {market: 0.0 for market in self._markets}
+            for o in open_orders.values():
+                if o['market'] in open_fills and o['filledSize']:
+                    open_fills[o['market']] += o['filledSize'] if o['side'] == 'buy' else -o['filledSize']
+            underlying = self._markets[0].split('/')[0]
+            perp = positions.get(self._markets[1])
+            spot_balance = sum(b['total'] for b in balances if b['coin'] == underlying)
+
+            # Coin the local spot position does not account for at the first settled pass stays out of every comparison
+            if self._spot_baseline is None:
+                self._spot_baseline = spot_balance - open_fills[self._markets[0]] - local_positions.get(self._markets[0], 0.0)
+            exchange_sizes = {
+                self._markets[0]: (spot_balance - self._spot_baseline, None),
+                self._markets[1]: (perp['netSize'], perp.get('recentAverageOpenPrice') or perp.get('entryPrice')) if perp else (0.0, None),
+            }
+            for market, (net_size, entry) in exchange_sizes.items():
+                net_size -= open_fills[market]
+                if abs(net_size - local_positions.get(market, 0.0)) >= self._size_tolerance / 2:
+                    seen.add(('position', market, round(net_size / self._size_tolerance), entry))
+
+        self._suspects = {key: self._suspects.get(key, 0) + 1 for key in seen}
+        corrections = []
+        for key, count in self._suspects.items():
+            if count != CONFIRMATIONS:
+                continue
+            if key[0] == 'closed':
+                corrections.append(self._closed(key[1], *local_orders[key[1]]))
+            elif key[0] == 'adopted':
+                update = dict(open_orders[key[1]], msg_time=time.time_ns())
+                corrections.append(OrderAdopted(Order.from_update(update)))
+            else:
+                _, market, size_ticks, entry = key
+                corrections.append(PositionCorrected(market, local_positions.get(market, 0.0), round(size_ticks * self._size_tolerance, 8), entry))
+
+        if corrections:
+            with self._lock:
+
+                # Orders closed locally while the pass ran no longer need closing
+                corrections = [c for c in corrections if not isinstance(c, OrderClosed) or c.order_id in self._local_orders]
+                self._corrections.extend(corrections)
+            self.stats['corrections'] += len(corrections)
+        return corrections
+
+    def _add_fills(self, fills: List[Dict], now: float) -> None:
+        for f in fills:
+            if f['id'] in self._seen_fills or f['orderId'] is None:
+                continue
+            self._seen_fills[f['id']] = now
+            totals = self._fills.get(f['orderId'])
+            if totals is None:
+                totals = self._fills[f['orderId']] = _OrderFills()
+            totals.size += f['size']
+            totals.notional += f['size'] * f['price']
+            totals.updated_at = now
+
+        # Ids only need remembering while they can come back in an overlapping query
+        for fill_id in [i for i, t in self._seen_fills.items() if now - t > FILL_OVERLAP_S * 2 + self._interval_s]:
+            del self._seen_fills[fill_id]
+        with self._lock:
+            tracked = set(self._local_orders)
+        for order_id in [i for i, f in self._fills.items() if i not in tracked and now - f.updated_at > FILL_RETENTION_S]:
+            del self._fills[order_id]
+
+    def _closed(self, order_id: int, market: str, side: str, size: float, msg_time: int) -> OrderClosed:
+        totals = self._fills.get(order_id)
+
+        # Orders placed before fills were first fetched may have filled earlier, their fills are queried directly
+        if msg_time < self._covered_since_ns:
+            fills = self._rest.submit('info', 'get_fills', market, None, None, None, order_id).result()
+            totals = _OrderFills()
+            for f in fills:
+                totals.size += f['size']
+                totals.notional += f['size'] * f['price']
+        if totals is None or not totals.size:
+            return OrderClosed(order_id, market, side, size, 0.0, None)
+        return OrderClosed(order_id, market, side, size, round(totals.size, 8), totals.notional / totals.size)
@@ -0,0 +1,167 @@
+import logging
+from threading import Lock
+from typing import Callable, Dict, List, NamedTuple, Optional, Tuple
+
+import numpy as np
+
+from models import Order, Position
+from venue import BookEvent
+
+
+class RiskAction(NamedTuple):
+    kind: str                       # 'cancel' or 'flatten'
+    underlying: str
+    market: str
+    order_id: Optional[int] = None
+    side: Optional[str] = None
+    size: Optional[float] = None
+    reason: str = ''
+
+
+class RiskEngine:
+    """
+    Keeps net delta per underlying from actual position sizes and evaluates stop and exposure
+    limits for every position and open order at once as array operations. Runs on every
+    book update through Venue.add_book_listener().
+
+    An underlying with unhedged delta is stopped out when its overweight leg marks
+    stop_pct % past its average entry, or when a working order's price crosses that stop.
+    Every open order on the underlying is cancelled and the unhedged delta is flattened at market.
+    Orders that would add to unhedged delta are cancelled while net notional exceeds max_net_notional.
+    """
+
+    def __init__(self, underlyings: Dict[str, str], stop_pct: float, max_net_notional: float,
+                 size_tolerance: float, on_action: Callable[[RiskAction], None]) -> None:
+        self._markets = list(underlyings.keys())
+        self._market_index = {m: i for i, m in enumerate(self._markets)}
+        self._underlyings = sorted(set(underlyings.values()))
+        self._stop_pct = stop_pct
+        self._max_net_notional = max_net_notional
+        self._size_tolerance = size_tolerance
+        self._on_action = on_action
+        self._lock = Lock()
+
+        # Leg arrays, one entry per market
+        underlying_index = {u: i for i, u in enumerate(self._underlyings)}
+        self._leg_underlying = np.array([underlying_index[underlyings[m]] for m in self._markets], dtype=np.int64)
+        self._leg_size = np.zeros(len(self._markets))
+        self._leg_entry = np.zeros(len(self._markets))
+        self._leg_mark = np.zeros(len(self._markets))
+
+        # Order arrays, one entry per open limit order
+        self._order_ids: List[int] = []
+        self._order_leg = np.zeros(0, dtype=np.int64)
+        self._order_sign = np.zeros(0)
+        self._order_price = np.zeros(0)
+
+        self._cancels_sent = set()
+        self._flattening = set()
+        self._stop_events: List[str] = []
+
+    def update_positions(self, positions: Dict[str, Position]) -> None:
+        with self._lock:
+            size = np.zeros(len(self._markets))
+            entry = np.zeros(len(self._markets))
+            for p in positions.values():
+                i = self._market_index.get(p.ticker)
+                if i is not None:
+                    size[i] = p.size * p.direction
+                    entry[i] = p.avg_entry_price
+            if not np.array_equal(size, self._leg_size):
+                self._flattening.clear()
+            self._leg_size, self._leg_entry = size, entry
+
+    def update_orders(self, orders: Dict[int, Order]) -> None:
+        with self._lock:
+            working = [o for o in orders.values() if o.market in self._market_index and o.price is not None]
+            self._order_ids = [o.id for o in working]
+            self._order_leg = np.array([self._market_index[o.market] for o in working], dtype=np.int64)
+            self._order_sign = np.array([1.0 if o.side == 'buy' else -1.0 for o in working])
+            self._order_price = np.array([o.price for o in working], dtype=np.float64)
+            self._cancels_sent.intersection_update(self._order_ids)
+
+    def on_orderbook(self, book: BookEvent) -> None:
+        i = self._market_index.get(book.market)
+        mid = book.mid_price()
+        if i is None or mid is None:
+            return
+        with self._lock:
+            self._leg_mark[i] = mid
+        self.evaluate()
+
+    # Return {underlying: (net delta in units, net delta notional)}
+    def net_delta(self) -> Dict[str, Tuple[float, float]]:
+        with self._lock:
+            units, notional = self._net(len(self._underlyings))
+        return {u: (float(units[i]), float(notional[i])) for i, u in enumerate(self._underlyings)}
+
+    # Return ids of open orders a cancel has already been sent for
+    def cancelled_order_ids(self) -> set:
+        with self._lock:
+            return set(self._cancels_sent)
+
+    # Return underlyings stopped out since the last call
+    def pop_stop_events(self) -> List[str]:
+        with self._lock:
+            events, self._stop_events = self._stop_events, []
+        return events
+
+    def _net(self, count: int) -> Tuple[np.ndarray, np.ndarray]:
+        units = np.bincount(self._leg_underlying, weights=self._leg_size, minlength=count)
+        notional = np.bincount(self._leg_underlying, weights=self._leg_size * self._leg_mark, minlength=count)
+        return units, notional
+
+    def evaluate(self) -> List[RiskAction]:
+        with self._lock:
+            actions = self._evaluate()
+        for action in actions:
+            logging.getLogger().info(f"Risk action: {action}")
+            self._on_action(action)
+        return actions
+
+    def _evaluate(self) -> List[RiskAction]:
+        count = len(self._underlyings)
+        net_units, net_notional = self._net(count)
+        net_sign = np.sign(net_units)
+        exposed = np.abs(net_units) >= self._size_tolerance
+
+        # Overweight legs and their stop prices
+        leg_sign = np.sign(self._leg_size)
+        overweight = exposed[self._leg_underlying] & (leg_sign == net_sign[self._leg_underlying]) & (leg_sign != 0)
+        stop = self._leg_entry * (1 - leg_sign * self._stop_pct / 100)
+        leg_breached = overweight & (self._leg_mark > 0) & (leg_sign * (self._leg_mark - stop) <= 0)
+
+        underlying_stop = np.zeros(count)
+        underlying_stop[self._leg_underlying[overweight]] = stop[overweight]
+        breached = np.zeros(count, dtype=bool)
+        breached[self._leg_underlying[leg_breached]] = True
+
+        order_underlying = self._leg_underlying[self._order_leg]
+        order_exposed = exposed[order_underlying]
+        crossed = order_exposed & (net_sign[order_underlying] * (self._order_price - underlying_stop[order_underlying]) <= 0)
+        breached[order_underlying[crossed]] = True
+
+        over_limit = exposed & (np.abs(net_notional) > self._max_net_notional)
+        cancel = breached[order_underlying] | (over_limit[order_underlying] & (self._order_sign == net_sign[order_underlying]))
+
+        actions = []
+        for k in np.flatnonzero(cancel):
+            order_id = self._order_ids[k]
+            if order_id not in self._cancels_sent:
+                self._cancels_sent.add(order_id)
+                u = order_underlying[k]
+                reason = 'stop' if breached[u] else 'exposure limit'
+                actions.append(RiskAction('cancel', self._underlyings[u], self._markets[self._order_leg[k]], order_id=order_id, reason=reason))
+
+        for leg in np.flatnonzero(overweight & breached[self._leg_underlying]):
+            u = self._leg_underlying[leg]
+            underlying = self._underlyings[u]
+            if underlying in self._flattening:
+                continue
+            self._flattening.add(underlying)
+            self._stop_events.append(underlying)
+            side = 'sell' if net_sign[u] > 0 else 'buy'
+            size = min(abs(net_units[u]), abs(self._leg_size[leg]))
+            size = round(round(size / self._size_tolerance) * self._size_tolerance, 8)
+            actions.append(RiskAction('flatten', underlying, self._markets[leg], side=side, size=float(size), reason='stop'))
+        return actions
@@ -0,0 +1,98 @@
+from threading import Lock
+from typing import Dict, NamedTuple, Optional, Tuple
+
+from ftx_rest import FtxRestClient
+from ftx_ws import FtxWebsocketClient
+from ftx_ws_redundant import RedundantFtxWebsocketClient
+from ftx_scheduler import FtxRequestScheduler
+
+
+class SessionWebsocket:
+    """
+    Websocket client interface for one subaccount. Books, tickers and trades come from the shared
+    public market data client, orders and fills from the subaccount's own private client, so the
+    strategy uses it exactly like an FtxWebsocketClient.
+    """
+
+    _PRIVATE = frozenset(('get_orders', 'get_fills', 'add_order_listener'))
+
+    def __init__(self, market_data: FtxWebsocketClient, private: FtxWebsocketClient) -> None:
+        self._market_data = market_data
+        self._private = private
+
+    def __getattr__(self, name: str):
+        if name.startswith('_'):
+            raise AttributeError(name)
+        return getattr(self._private if name in self._PRIVATE else self._market_data, name)
+
+    def get_feed_stats(self) -> Dict[str, Dict]:
+        stats = self._market_data.get_feed_stats()
+        stats['messages'].update(self._private.get_feed_stats()['messages'])
+        return stats
+
+
+class SubaccountSession(NamedTuple):
+    subaccount: str
+    ws: SessionWebsocket
+    rest: FtxRequestScheduler
+
+
+class SessionManager:
+    """
+    Runs strategies for several subaccounts over one public market data connection. Every book,
+    ticker and trade message is received and decoded once, however many subaccounts read it.
+    Each subaccount adds only an authenticated connection that carries its orders and fills, and
+    its own REST client and request scheduler with a keep-alive connection per scheduler worker.
+    Connections grow with markets plus subaccounts instead of markets times subaccounts.
+
+    api_key and api_secret act for every subaccount, as main account keys do. Keys restricted to
+    one subaccount are passed per session instead.
+    """
+
+    def __init__(self, api_key: str = None, api_secret: str = None, book_depth: Optional[int] = None,
+                 market_data_connections: int = 1, rest_workers: int = 4) -> None:
+        self._api_key = api_key
+        self._api_secret = api_secret
+        self._rest_workers = rest_workers
+        if market_data_connections > 1:
+            self.market_data = RedundantFtxWebsocketClient(connections=market_data_connections, book_depth=book_depth)
+        else:
+            self.market_data = FtxWebsocketClient(book_depth=book_depth)
+        self._market_data_connections = market_data_connections
+        self._sessions: Dict[str, SubaccountSession] = {}
+        self._lock = Lock()
+
+    # Return the session for subaccount, created on first use
+    def session(self, subaccount: str, credentials: Optional[Tuple[str, str]] = None) -> SubaccountSession:
+        with self._lock:
+            session = self._sessions.get(subaccount)
+            if session is None:
+                api_key, api_secret = credentials or (self._api_key, self._api_secret)
+                private = FtxWebsocketClient(api_key, api_secret, subaccount)
+
+                # One keep-alive connection per scheduler worker, plus one for its reserved kill lane worker
+                rest = FtxRequestScheduler(FtxRestClient(api_key, api_secret, subaccount, self._rest_workers + 1), self._rest_workers)
+                session = SubaccountSession(subaccount, SessionWebsocket(self.market_data, private), rest)
+                self._sessions[subaccount] = session
+            return session
+
+    def close(self, subaccount: str = None) -> None:
+        with self._lock:
+            names = [subaccount] if subaccount else list(self._sessions)
+            for name in names:
+                session = self._sessions.pop(name, None)
+                if session:
+                    session.rest.close()
+
+    # Return websocket connections held and messages decoded by the shared and private clients
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            sessions = list(self._sessions.values())
+        market_messages = sum(self.market_data.get_feed_stats()['messages'].values())
+        private_messages = sum(sum(s.ws._private.get_feed_stats()['messages'].values()) for s in sessions)
+        return {
+            'subaccounts': len(sessions),
+            'connections': self._market_data_connections + len(sessions),
+            'market_data_messages': market_messages,
+            'private_messages': private_messages,
+        }
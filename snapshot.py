@@ -0,0 +1,179 @@
+import os
+import json
+import time
+import logging
+import tempfile
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+from models import Order, Position
+
+
+class StateStore:
+    """
+    Crash-safe strategy state. A small snapshot is written atomically (temp file, fsync, rename)
+    and every order event in between is appended to a journal, each stamped with a sequence
+    number. Loading replays journal events newer than the snapshot on top of it, so state is
+    never older than the last journaled event.
+    """
+
+    def __init__(self, directory: str, name: str) -> None:
+        self._directory = Path(directory)
+        self._directory.mkdir(parents=True, exist_ok=True)
+        self._snapshot_path = self._directory / f'{name}.snapshot.json'
+        self._journal_path = self._directory / f'{name}.journal.jsonl'
+        self._seq = 0
+        self._journal = None
+
+    def load(self) -> Optional[Dict[str, Any]]:
+        if not self._snapshot_path.exists() and not self._journal_path.exists():
+            return None
+        state = {'seq': 0, 'positions': {}, 'orders': {}, 'start_basis': None, 'fill_count': 0,
+                 'last_update_time': {}, 'saved_at': 0.0}
+        if self._snapshot_path.exists():
+            with open(self._snapshot_path) as f:
+                state.update(json.load(f))
+        positions = {t: Position.from_dict(p) for t, p in state['positions'].items()}
+        orders = {int(i): Order.from_dict(o) for i, o in state['orders'].items()}
+        last_update_time = {int(i): t for i, t in state['last_update_time'].items()}
+        self._seq = state['seq']
+
+        for event in self._read_journal():
+            if event['seq'] <= state['seq']:
+                continue
+            self._seq = event['seq']
+            state['saved_at'] = event['time']
+            kind = event['type']
+            if kind == 'placed':
+                orders[event['order']['id']] = Order.from_dict(event['order'])
+            elif kind == 'cancelled':
+                orders.pop(event['id'], None)
+            elif kind == 'filled':
+                order = Order.from_dict(event['order'])
+                orders.pop(order.id, None)
+                if order.market not in positions:
+                    positions[order.market] = Position(order.market, event['instrument_type'], order.side)
+                positions[order.market].apply_fill(order.side, order.filled_size, order.avg_fill_price)
+                if positions[order.market].size == 0:
+                    del positions[order.market]
+                state['fill_count'] = event['fill_count']
+                state['start_basis'] = event['start_basis']
+            last_update_time[event['id']] = event['msg_time']
+
+        state.update(positions=positions, orders=orders, last_update_time=last_update_time)
+        return state
+
+    def _read_journal(self) -> List[Dict]:
+        events = []
+        if self._journal_path.exists():
+            with open(self._journal_path) as f:
+                for line in f:
+                    try:
+                        events.append(json.loads(line))
+                    except ValueError:
+                        # A torn final line from a crash mid-write
+                        logging.getLogger().info(f"Ignoring incomplete journal entry: {line!r}")
+        return events
+
+    def journal(self, kind: str, order_id: int, msg_time: int, **fields) -> None:
+        self._seq += 1
+        event = {'seq': self._seq, 'time': time.time(), 'type': kind, 'id': order_id, 'msg_time': msg_time}
+        for k, v in fields.items():
+            event[k] = v.to_dict() if isinstance(v, (Order, Position)) else v
+        if self._journal is None:
+            self._journal = open(self._journal_path, 'a')
+        self._journal.write(json.dumps(event) + '\n')
+        self._journal.flush()
+        os.fsync(self._journal.fileno())
+
+    # Atomically replace the snapshot, then start a fresh journal
+    def save(self, positions: Dict[str, Position], orders: Dict[int, Order], start_basis: Optional[float],
+             fill_count: int, last_update_time: Dict[int, int]) -> None:
+        state = {
+            'seq': self._seq,
+            'saved_at': time.time(),
+            'positions': {t: p.to_dict() for t, p in positions.items()},
+            'orders': {str(i): o.to_dict() for i, o in orders.items()},
+            'start_basis': start_basis,
+            'fill_count': fill_count,
+            'last_update_time': {str(i): t for i, t in last_update_time.items()},
+        }
+        fd, tmp_path = tempfile.mkstemp(dir=self._directory, suffix='.tmp')
+        with os.fdopen(fd, 'w') as f:
+            json.dump(state, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self._snapshot_path)
+        if os.name != 'nt':
+            dir_fd = os.open(self._directory, os.O_RDONLY)
+            try:
+                os.fsync(dir_fd)
+            finally:
+                os.close(dir_fd)
+
+        # Events up to seq are in the snapshot, a crash before truncation is handled by seq filtering on load
+        if self._journal is not None:
+            self._journal.close()
+        self._journal = open(self._journal_path, 'w')
+
+    def clear(self) -> None:
+        if self._journal is not None:
+            self._journal.close()
+            self._journal = None
+        for path in (self._snapshot_path, self._journal_path):
+            if path.exists():
+                path.unlink()
+        self._seq = 0
+
+
+# Return positions and orders adjusted to match exchange state, and a list of the differences found.
+# Open orders on the exchange are taken as they are. Position sizes are taken from the exchange,
+# keeping the locally tracked entry and PnL wherever the side still matches. Positions with no
+# usable local entry take the exchange entry for the perp and the current price for spot.
+def reconcile(state: Dict[str, Any], markets: Tuple[str, str], size_tolerance: float,
+              rest_positions: Dict[str, Dict], rest_orders: Dict[int, Dict], spot_balance: float,
+              prices: Dict[str, float]) -> Tuple[Dict[str, Position], Dict[int, Order], List[str]]:
+    positions: Dict[str, Position] = state['positions']
+    local_orders: Dict[int, Order] = state['orders']
+    differences = []
+
+    orders = {}
+    for order_id, o in rest_orders.items():
+        if o['market'] not in markets:
+            continue
+        orders[order_id] = Order.from_update(o)
+        if order_id not in local_orders:
+            differences.append(f"Adopted untracked open order {order_id} on {o['market']}")
+    for order_id in local_orders:
+        if order_id not in orders:
+            differences.append(f"Order {order_id} is no longer open")
+
+    exchange_sizes = {markets[0]: (spot_balance, 'spot')}
+    perp = rest_positions.get(markets[1])
+    exchange_sizes[markets[1]] = (perp['netSize'] if perp else 0.0, 'perp')
+    for ticker, (net_size, instrument_type) in exchange_sizes.items():
+        local = positions.get(ticker)
+        local_net = local.size * local.direction if local else 0.0
+        if abs(net_size - local_net) < size_tolerance / 2:
+            continue
+        differences.append(f"{ticker} size {local_net} locally, {net_size} on exchange")
+        entry = (perp.get('recentAverageOpenPrice') or perp.get('entryPrice')) if perp and ticker == markets[1] else None
+        correct_position(positions, ticker, instrument_type, net_size, size_tolerance, entry or prices[ticker])
+    return positions, orders, differences
+
+
+# Set the size of the position in ticker to the exchange net size. The local entry and PnL are kept while the
+# side still matches, a position that changed side or was not tracked starts over at entry_price.
+def correct_position(positions: Dict[str, Position], ticker: str, instrument_type: str, net_size: float,
+                     size_tolerance: float, entry_price: float) -> None:
+    if abs(net_size) < size_tolerance / 2:
+        positions.pop(ticker, None)
+        return
+    side = 'buy' if net_size > 0 else 'sell'
+    local = positions.get(ticker)
+    if local is None or local.side != side:
+        local = Position(ticker, instrument_type, side)
+        local.avg_entry_price = entry_price
+        local.fill_count = 1
+        positions[ticker] = local
+    local.size = abs(net_size)
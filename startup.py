@@ -0,0 +1,56 @@
+import os
+import json
+import time
+import tempfile
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Callable, Dict, List, Tuple
+
+
+class PhaseTimer:
+    """
+    Records start and end offsets of named startup phases. Phases may run concurrently on
+    different threads, so each is reported against the common start as well as by duration.
+    """
+
+    def __init__(self) -> None:
+        self._start = time.perf_counter()
+        self._phases: Dict[str, Tuple[float, float]] = {}
+
+    @contextmanager
+    def phase(self, name: str):
+        started = time.perf_counter() - self._start
+        try:
+            yield
+        finally:
+            self._phases[name] = (started, time.perf_counter() - self._start)
+
+    def elapsed(self) -> float:
+        return time.perf_counter() - self._start
+
+    # Return one line per phase ordered by start time, followed by the total
+    def summary(self) -> List[str]:
+        lines = []
+        for name, (started, ended) in sorted(self._phases.items(), key=lambda p: p[1][0]):
+            lines.append(f"{name:<12} {started * 1000:8.1f} -> {ended * 1000:8.1f} ms   ({(ended - started) * 1000:.1f} ms)")
+        lines.append(f"{'total':<12} {self.elapsed() * 1000:8.1f} ms")
+        return lines
+
+
+# Return market metadata keyed by name, from the disk cache if it is younger than max_age_s, otherwise
+# fetched and written back to the cache atomically.
+def load_market_info(fetch: Callable[[], List[Dict]], cache_path: str, max_age_s: float) -> Dict[str, Dict]:
+    path = Path(cache_path)
+    if path.exists() and time.time() - path.stat().st_mtime < max_age_s:
+        try:
+            with open(path) as f:
+                return json.load(f)
+        except ValueError:
+            pass
+    market_info = {m['name']: m for m in fetch()}
+    path.parent.mkdir(parents=True, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=path.parent, suffix='.tmp')
+    with os.fdopen(fd, 'w') as f:
+        json.dump(market_info, f)
+    os.replace(tmp_path, path)
+    return market_info
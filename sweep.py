@@ -0,0 +1,176 @@
+"""
+Parameter sweep of the strategy tuning constants over recorded or historical market data.
+
+    python sweep.py --data feed.txt --funding-rate 0.00002 --cache feed.npz --param quote_index=0,1,2
+    python sweep.py --data month.npz --param basis_threshold=0.0005,0.001,0.002 --param orders_per_side=2,3,4
+    python sweep.py --data month.npz --random 2000 --param basis_threshold=0.0001:0.01 --param quote_index=0:3
+
+--data is either frames recorded by feedgen.py, decoded into 1s snapshots, or a dataset saved with --cache
+(see backtest.save_dataset for converting other historical data). Grid mode evaluates every combination of
+the listed values, --random N draws N configurations uniformly from lo:hi ranges. Parameters not listed
+keep their arb.py values, or those of the arb.py config file given with --config. Snapshots are placed in
+shared memory once and attached read-only by every worker, so each configuration only costs its simulation.
+"""
+import csv
+import json
+import time
+import random
+import argparse
+import itertools
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+from typing import Dict, List, Tuple
+
+import numpy as np
+
+import backtest
+from feedgen import read_frames
+from models import StrategyParams
+from arb import SETTINGS, STRATEGY_PARAMS, apply_config
+
+
+# Worker state, set once per process by _attach()
+_memory = None
+_dataset = None
+_hours = None
+_settings = None
+
+
+def _attach(name: str, shape: Tuple[int, int], meta: Tuple, settings: Dict) -> None:
+    global _memory, _dataset, _hours, _settings
+    _memory = shared_memory.SharedMemory(name=name)
+    data = np.ndarray(shape, dtype=np.float64, buffer=_memory.buf)
+    data.flags.writeable = False
+    _dataset = backtest.Dataset(data, *meta)
+    _hours = backtest.hour_rows(data)
+    _settings = settings
+
+
+def _evaluate(params: StrategyParams) -> Dict:
+    return backtest.simulate(_dataset, params, hours=_hours, **_settings)
+
+
+# Return the parameter name and its values from NAME=V1,V2,... or, with ranged set, NAME=LO:HI
+def parse_param(value: str, ranged: bool) -> Tuple[str, List]:
+    name, _, values = value.partition('=')
+    if name not in StrategyParams._fields:
+        raise Exception(f"Unknown parameter {name}, expected one of {', '.join(StrategyParams._fields)}")
+    cast = StrategyParams.__annotations__[name]
+    if ranged:
+        lo, hi = values.split(':')
+        return name, [cast(lo), cast(hi)]
+    return name, [cast(v) for v in values.split(',')]
+
+
+# Return every combination of the listed values
+def grid(base: StrategyParams, params: List[Tuple[str, List]]) -> List[StrategyParams]:
+    names = [name for name, _ in params]
+    return [base._replace(**dict(zip(names, values))) for values in itertools.product(*[v for _, v in params])]
+
+
+# Return count configurations drawn uniformly from the (lo, hi) range of each listed parameter, integers inclusive
+def sample(base: StrategyParams, params: List[Tuple[str, List]], count: int, seed: int) -> List[StrategyParams]:
+    rng = random.Random(seed)
+    configs = []
+    for _ in range(count):
+        values = {}
+        for name, (lo, hi) in params:
+            values[name] = rng.randint(lo, hi) if isinstance(lo, int) else rng.uniform(lo, hi)
+        configs.append(base._replace(**values))
+    return configs
+
+
+def load(args) -> backtest.Dataset:
+    if args.data.endswith('.npz'):
+        return backtest.load_dataset(args.data)
+    spot, perp = args.markets
+    rows = backtest.decode_frames(read_frames(args.data), spot, perp, args.interval)
+    if args.funding:
+        rows = backtest.apply_funding(rows, *backtest.load_funding(args.funding))
+    elif args.funding_rate is not None:
+        rows = backtest.apply_funding(rows, np.zeros(1), np.array([args.funding_rate]))
+    else:
+        raise Exception("Recorded frames carry no funding, pass --funding or --funding-rate")
+    dataset = backtest.build_dataset(rows, spot, perp)
+    if args.cache:
+        backtest.save_dataset(dataset, args.cache)
+    return dataset
+
+
+# Return configurations and their results, best PnL first
+def run_sweep(dataset: backtest.Dataset, configs: List[StrategyParams], settings: Dict, workers: int = None) -> List[Tuple[StrategyParams, Dict]]:
+    memory = shared_memory.SharedMemory(create=True, size=dataset.data.nbytes)
+    try:
+        np.ndarray(dataset.data.shape, dtype=np.float64, buffer=memory.buf)[:] = dataset.data
+        meta = (dataset.spot, dataset.perp, dataset.spot_tick, dataset.perp_tick)
+        with ProcessPoolExecutor(workers, initializer=_attach, initargs=(memory.name, dataset.data.shape, meta, settings)) as pool:
+            chunksize = max(1, len(configs) // ((workers or pool._max_workers) * 8))
+            results = list(pool.map(_evaluate, configs, chunksize=chunksize))
+    finally:
+        memory.close()
+        memory.unlink()
+    return sorted(zip(configs, results), key=lambda r: -r[1]['pnl'])
+
+
+def table(ranked: List[Tuple[StrategyParams, Dict]], top: int) -> List[str]:
+    names = list(StrategyParams._fields)
+    lines = [f"{'rank':>4} {'pnl':>10} {'funding':>9} {'fees':>8} {'max dd':>8} {'trades':>6} {'fills':>6} {'stops':>5} {'exposed':>7}  "
+             + '  '.join(names)]
+    for rank, (params, r) in enumerate(ranked[:top], 1):
+        lines.append(f"{rank:>4} {r['pnl']:>10.4f} {r['funding']:>9.4f} {r['fees']:>8.4f} {r['max_drawdown']:>8.4f} {r['trades']:>6} "
+                     f"{r['fills']:>6} {r['stops']:>5} {r['exposure']:>7.1%}  "
+                     + '  '.join(f"{getattr(params, n):>{len(n)}.6g}" for n in names))
+    return lines
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='Sweep strategy parameters over recorded market data.')
+    parser.add_argument('--data', required=True, help='Recorded frames from feedgen.py, or a .npz dataset')
+    parser.add_argument('--config', metavar='FILE', help='arb.py config file, its markets, account size and params are the base of the sweep')
+    parser.add_argument('--markets', nargs=2, metavar=('SPOT', 'PERP'), help='Default from the config')
+    parser.add_argument('--interval', type=float, default=1.0, help='Snapshot interval in seconds when decoding frames')
+    parser.add_argument('--funding', help='FTX funding rates JSON for the perp, as returned by get_funding_rates')
+    parser.add_argument('--funding-rate', type=float, help='Constant hourly funding rate when no --funding history')
+    parser.add_argument('--cache', help='Save the decoded dataset to this .npz for later sweeps')
+    parser.add_argument('--param', action='append', default=[], metavar='NAME=V1,V2|NAME=LO:HI')
+    parser.add_argument('--random', type=int, metavar='N', help='Draw N random configurations instead of a grid')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--maker-fee', type=float, default=backtest.MAKER_FEE)
+    parser.add_argument('--taker-fee', type=float, default=backtest.TAKER_FEE)
+    parser.add_argument('--workers', type=int, help='Worker processes (default one per CPU)')
+    parser.add_argument('--top', type=int, default=20, help='Rows of the ranked table to print')
+    parser.add_argument('--output', help='Write every configuration and its results to this CSV')
+    args = parser.parse_args()
+    base_settings, base_params = SETTINGS, STRATEGY_PARAMS
+    if args.config:
+        with open(args.config) as f:
+            base_settings, base_params = apply_config(SETTINGS, STRATEGY_PARAMS, json.load(f))
+    args.markets = args.markets or base_settings.market[:2]
+
+    started = time.perf_counter()
+    dataset = load(args)
+    loaded = time.perf_counter()
+    params = [parse_param(p, args.random is not None) for p in args.param]
+    configs = sample(base_params, params, args.random, args.seed) if args.random is not None else grid(base_params, params)
+    settings = {'account_size': base_settings.account_size, 'size_increment': base_settings.market[2],
+                'maker_fee': args.maker_fee, 'taker_fee': args.taker_fee}
+    ranked = run_sweep(dataset, configs, settings, args.workers)
+    elapsed = time.perf_counter() - loaded
+
+    data = dataset.data
+    print(f"{len(data)} snapshots covering {(data[-1, backtest.TIME] - data[0, backtest.TIME]) / 86400:.2f} days, "
+          f"loaded in {loaded - started:.1f}s")
+    print(f"{len(configs)} configurations in {elapsed:.1f}s, {len(configs) / elapsed:.1f}/s")
+    print('\n'.join(table(ranked, args.top)))
+
+    if args.output:
+        with open(args.output, 'w', newline='') as f:
+            writer = csv.writer(f)
+            result_names = list(ranked[0][1]) if ranked else []
+            writer.writerow(['rank'] + list(StrategyParams._fields) + result_names)
+            for rank, (params, r) in enumerate(ranked, 1):
+                writer.writerow([rank] + list(params) + [r[k] for k in result_names])
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,71 @@
+import json
+
+from feedgen import FeedGenerator, MarketSpec, prepare_client
+from ftx_ws_redundant import RedundantFtxWebsocketClient
+
+MARKET = 'GST-PERP'
+
+
+def client_and_feed():
+    client = RedundantFtxWebsocketClient(connections=2)
+    prepare_client(client, [MARKET])
+    books, orders = [], []
+    client.add_orderbook_listener(lambda market, book: books.append(book))
+    client.add_order_listener(orders.append)
+    return client, FeedGenerator([MarketSpec(MARKET, 1.5, depth=20)], seed=3), books, orders
+
+
+def order_frame(status, filled_size=0.0):
+    return json.dumps({'type': 'update', 'channel': 'orders', 'data': {
+        'id': 11, 'market': MARKET, 'side': 'buy', 'type': 'limit', 'price': 1.5, 'size': 10.0, 'status': status,
+        'filledSize': filled_size, 'avgFillPrice': None, 'remainingSize': 10.0 - filled_size}})
+
+
+def test_each_update_is_applied_once_from_the_first_connection():
+    client, feed, books, _ = client_and_feed()
+    frames = [feed.orderbook_partial(MARKET)] + [feed.orderbook_update(MARKET) for _ in range(5)]
+    for frame in frames:
+        client._on_connection_message(1, frame)
+        client._on_connection_message(0, frame)
+    assert len(books) == len(frames)
+    assert client.get_feed_stats()['checksum_failures'] == {}
+    leading, lagging = [(s['leading'], s['lagging']) for s in client._stats]
+    assert leading == (0, len(frames)) and lagging == (len(frames), 0)
+
+
+def test_late_copy_after_newer_updates_is_dropped():
+    client, feed, books, _ = client_and_feed()
+    partial, first, second = feed.orderbook_partial(MARKET), feed.orderbook_update(MARKET), feed.orderbook_update(MARKET)
+    for frame in (partial, first, second):
+        client._on_connection_message(0, frame)
+    client._on_connection_message(1, first)
+    assert len(books) == 3
+    assert books[-1] == client._sorted_orderbook(MARKET)
+
+
+def test_partial_from_resubscribed_connection_does_not_rewind_live_book():
+    client, feed, books, _ = client_and_feed()
+    client._on_connection_message(0, feed.orderbook_partial(MARKET))
+    client._on_connection_message(0, feed.orderbook_update(MARKET))
+    live = client._sorted_orderbook(MARKET)
+    client._on_connection_message(1, feed.orderbook_partial(MARKET))
+    assert len(books) == 2
+    assert client._sorted_orderbook(MARKET) == live
+
+
+def test_partial_resyncs_a_stale_book():
+    client, feed, books, _ = client_and_feed()
+    client._on_connection_message(0, feed.orderbook_partial(MARKET))
+    client._stale_orderbooks = {MARKET}
+    feed.orderbook_update(MARKET)
+    client._on_connection_message(1, feed.orderbook_partial(MARKET))
+    assert len(books) == 2
+    assert not client.is_orderbook_stale(MARKET)
+
+
+def test_order_updates_are_deduplicated_by_state():
+    client, _, _, orders = client_and_feed()
+    for frame in (order_frame('new'), order_frame('new'), order_frame('open', 4.0), order_frame('open', 4.0)):
+        client._on_connection_message(0, frame)
+        client._on_connection_message(1, frame)
+    assert [(o['status'], o['filledSize']) for o in orders] == [('new', 0.0), ('open', 4.0)]
@@ -0,0 +1,67 @@
+import pytest
+
+from models import Position
+
+
+def test_increase_weights_entry_by_size():
+    p = Position('GST-PERP', 'perp', 'buy')
+    p.apply_fill('buy', 10, 1.0)
+    p.apply_fill('buy', 30, 2.0)
+    assert p.side == 'buy'
+    assert p.size == 40
+    assert p.avg_entry_price == pytest.approx(1.75)
+    assert p.fill_count == 2
+
+
+def test_reduce_books_realized_pnl_and_keeps_entry():
+    p = Position('GST-PERP', 'perp', 'buy')
+    p.apply_fill('buy', 10, 1.0)
+    p.apply_fill('sell', 4, 1.5)
+    assert p.size == 6
+    assert p.avg_entry_price == 1.0
+    assert p.realized_pnl == pytest.approx(2.0)
+    assert p.fill_count == 0
+
+
+def test_short_realized_pnl_is_signed():
+    p = Position('GST-PERP', 'perp', 'sell')
+    p.apply_fill('sell', 10, 2.0)
+    p.apply_fill('buy', 10, 1.5)
+    assert p.size == 0
+    assert p.realized_pnl == pytest.approx(5.0)
+    assert p.avg_entry_price == 0.0
+
+
+def test_fill_larger_than_position_flips_side_at_fill_price():
+    p = Position('GST-PERP', 'perp', 'buy')
+    p.apply_fill('buy', 10, 1.0)
+    p.apply_fill('sell', 15, 1.2)
+    assert p.side == 'sell'
+    assert p.size == 5
+    assert p.avg_entry_price == 1.2
+    assert p.fill_count == 1
+    assert p.realized_pnl == pytest.approx(2.0)
+
+
+def test_first_fill_sets_side_of_empty_position():
+    p = Position('GST/USD', 'spot', 'buy')
+    p.apply_fill('sell', 3, 2.0)
+    assert (p.side, p.size, p.avg_entry_price) == ('sell', 3, 2.0)
+
+
+def test_unrealized_pnl_follows_marks_and_fills():
+    p = Position('GST-PERP', 'perp', 'buy')
+    p.apply_fill('buy', 10, 1.0)
+    assert p.unrealized_pnl == 0.0
+    p.mark(1.1)
+    assert p.unrealized_pnl == pytest.approx(1.0)
+    p.apply_fill('sell', 5, 1.1)
+    assert p.unrealized_pnl == pytest.approx(0.5)
+    assert p.total_pnl == pytest.approx(1.0)
+
+
+def test_round_trips_through_dict():
+    p = Position('GST-PERP', 'perp', 'sell')
+    p.apply_fill('sell', 2, 3.0)
+    p.accrue_funding(0.001)
+    assert Position.from_dict(p.to_dict()).to_dict() == p.to_dict()
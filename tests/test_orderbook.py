@@ -0,0 +1,55 @@
+import random
+
+import pytest
+
+from orderbook import ASKS, BIDS, CHECKSUM_DEPTH, SLACK_LEVELS, BoundedOrderbook, SortedOrderbook, orderbook_checksum
+
+
+def random_updates(seed, count, tick=0.0001, mid=10000):
+    rng = random.Random(seed)
+    for _ in range(count):
+        side = rng.choice((BIDS, ASKS))
+        offset = int(rng.expovariate(1 / 30)) + 1
+        price = round((mid - offset if side == BIDS else mid + offset) * tick, 4)
+        size = 0.0 if rng.random() < 0.3 else rng.choice((round(rng.uniform(0.1, 500), 1), round(rng.uniform(0, 1e-4), 9)))
+        yield side, price, size
+
+
+@pytest.mark.parametrize('seed', range(3))
+def test_bounded_book_matches_sorted_book(seed):
+    sorted_book, bounded_book = SortedOrderbook(), BoundedOrderbook(CHECKSUM_DEPTH + SLACK_LEVELS)
+    for i, (side, price, size) in enumerate(random_updates(seed, 5000)):
+        sorted_book.update(side, price, size)
+        bounded_book.update(side, price, size)
+        if i % 50 == 0:
+            for s in (BIDS, ASKS):
+                assert bounded_book.levels(s, CHECKSUM_DEPTH) == sorted_book.levels(s, CHECKSUM_DEPTH)
+                assert bounded_book.best(s) == sorted_book.best(s)
+            assert bounded_book.checksum() == sorted_book.checksum()
+
+
+def test_checksum_matches_exchange_format():
+    book = BoundedOrderbook(8)
+    bids, asks = [(1.4999, 10.0), (1.4998, 2.5)], [(1.5, 3.0)]
+    for side, levels in ((BIDS, bids), (ASKS, asks)):
+        for price, size in levels:
+            book.update(side, price, size)
+    assert book.checksum() == orderbook_checksum(bids, asks)
+
+
+def test_full_side_drops_its_worst_level():
+    book = BoundedOrderbook(3)
+    for price in (1.0, 1.1, 1.2, 1.3):
+        book.update(BIDS, price, 1.0)
+    assert book.levels(BIDS, 10) == [(1.3, 1.0), (1.2, 1.0), (1.1, 1.0)]
+    book.update(BIDS, 1.2, 0.0)
+    assert book.levels(BIDS, 10) == [(1.3, 1.0), (1.1, 1.0)]
+
+
+def test_long_level_texts_widen_rows():
+    book = BoundedOrderbook(4)
+    book.update(ASKS, 1.5, 2.0)
+    book.update(ASKS, 1.6, 1.2345678901234e-05)
+    book.update(BIDS, 1.23456789012345, 123456.789012345)
+    assert book.levels(ASKS, 4) == [(1.5, 2.0), (1.6, 1.2345678901234e-05)]
+    assert book.checksum() == orderbook_checksum(book.levels(BIDS, 4), book.levels(ASKS, 4))
@@ -0,0 +1,119 @@
+import time
+from concurrent.futures import Future
+
+from models import Order, Position
+from reconciler import CONFIRMATIONS, OrderAdopted, OrderClosed, PositionCorrected, Reconciler
+
+SPOT, PERP = 'GST/USD', 'GST-PERP'
+
+
+class FakeRest:
+    """Scheduler stand-in answering the reconciler's info requests from plain attributes."""
+
+    def __init__(self) -> None:
+        self.open_orders = {}
+        self.perp_size = 0.0
+        self.coin_balance = 0.0
+        self.fills = []
+
+    def submit(self, lane, method, *args):
+        results = {
+            'get_open_orders': self.open_orders,
+            'get_positions': {PERP: {'netSize': self.perp_size, 'entryPrice': 2.0}},
+            'get_balances': [{'coin': 'GST', 'total': self.coin_balance}, {'coin': 'USD', 'total': 100.0}],
+            'get_fills': self.fills,
+        }
+        future = Future()
+        future.set_result(results[method])
+        return future
+
+
+def exchange_order(order_id, market=PERP, filled_size=0.0):
+    return {'id': order_id, 'market': market, 'side': 'buy', 'type': 'limit', 'price': 2.0, 'size': 10.0,
+            'filledSize': filled_size, 'avgFillPrice': 2.0 if filled_size else None, 'status': 'open'}
+
+
+def local_order(order_id, market=PERP):
+    return Order(order_id, market, 'buy', 'limit', 2.0, 10.0, msg_time=time.time_ns())
+
+
+def long_position(market, size):
+    position = Position(market, 'perp' if market == PERP else 'spot', 'buy')
+    position.apply_fill('buy', size, 2.0)
+    return position
+
+
+def passes(reconciler, count):
+    return [reconciler.reconcile() for _ in range(count)]
+
+
+def test_position_difference_is_corrected_once_confirmed():
+    rest = FakeRest()
+    reconciler = Reconciler(rest, (SPOT, PERP), 0.1, 1)
+    rest.perp_size = -3.0
+    results = passes(reconciler, CONFIRMATIONS + 1)
+    assert results[:CONFIRMATIONS - 1] == [[]] * (CONFIRMATIONS - 1)
+    assert results[CONFIRMATIONS - 1] == [PositionCorrected(PERP, 0.0, -3.0, 2.0)]
+    assert results[CONFIRMATIONS] == []
+    assert reconciler.pop_corrections() == [PositionCorrected(PERP, 0.0, -3.0, 2.0)]
+
+
+def test_difference_resolved_before_confirmation_is_not_corrected():
+    rest = FakeRest()
+    reconciler = Reconciler(rest, (SPOT, PERP), 0.1, 1)
+    rest.perp_size = 5.0
+    reconciler.reconcile()
+    reconciler.update_local({PERP: long_position(PERP, 5.0)}, {})
+    assert passes(reconciler, CONFIRMATIONS) == [[]] * CONFIRMATIONS
+
+
+def test_fills_of_open_orders_are_excluded():
+    rest = FakeRest()
+    rest.open_orders = {7: exchange_order(7, filled_size=4.0)}
+    rest.perp_size = 4.0
+    reconciler = Reconciler(rest, (SPOT, PERP), 0.1, 1)
+    reconciler.update_local({}, {7: local_order(7)})
+    assert passes(reconciler, CONFIRMATIONS + 1) == [[]] * (CONFIRMATIONS + 1)
+
+
+def test_sizes_wait_for_order_differences():
+    rest = FakeRest()
+    rest.open_orders = {8: exchange_order(8)}
+    rest.perp_size = 3.0
+    reconciler = Reconciler(rest, (SPOT, PERP), 0.1, 1)
+    corrections = passes(reconciler, CONFIRMATIONS)[-1]
+    assert [type(c) for c in corrections] == [OrderAdopted]
+    assert corrections[0].order.id == 8
+
+
+def test_order_closed_on_exchange_carries_its_fills():
+    rest = FakeRest()
+    reconciler = Reconciler(rest, (SPOT, PERP), 0.1, 1)
+    reconciler.update_local({}, {9: local_order(9)})
+    rest.fills = [{'id': 1, 'orderId': 9, 'size': 6.0, 'price': 2.0}, {'id': 2, 'orderId': 9, 'size': 4.0, 'price': 2.5}]
+    rest.perp_size = 10.0
+    corrections = passes(reconciler, CONFIRMATIONS)[-1]
+    assert corrections == [OrderClosed(9, PERP, 'buy', 10.0, 10.0, 2.2)]
+
+
+def test_closed_order_is_dropped_once_closed_locally():
+    rest = FakeRest()
+    reconciler = Reconciler(rest, (SPOT, PERP), 0.1, 1)
+    reconciler.update_local({}, {9: local_order(9)})
+    reconciler.reconcile()
+
+    # The websocket closes the order locally while the confirming pass is querying
+    submit = rest.submit
+    rest.submit = lambda *args: (reconciler.update_local({}, {}), submit(*args))[1]
+    assert reconciler.reconcile() == []
+    assert reconciler.pop_corrections() == []
+
+
+def test_coin_held_before_start_is_not_a_spot_position():
+    rest = FakeRest()
+    rest.coin_balance = 7.03
+    reconciler = Reconciler(rest, (SPOT, PERP), 0.1, 1)
+    reconciler.update_local({SPOT: long_position(SPOT, 2.0)}, {})
+    assert passes(reconciler, CONFIRMATIONS) == [[]] * CONFIRMATIONS
+    rest.coin_balance += 1.0
+    assert passes(reconciler, CONFIRMATIONS)[-1] == [PositionCorrected(SPOT, 2.0, 3.0, None)]
@@ -0,0 +1,80 @@
+import pytest
+
+from models import Order, Position
+from snapshot import StateStore, reconcile
+
+SPOT, PERP = 'GST/USD', 'GST-PERP'
+
+
+def order(order_id, market=PERP, side='buy', status='new', filled_size=0.0, avg_fill_price=None, msg_time=1):
+    return Order(order_id, market, side, 'limit', 1.0, 10.0, filled_size, avg_fill_price, status, msg_time)
+
+
+def test_load_without_state_returns_none(tmp_path):
+    assert StateStore(str(tmp_path), 'arb').load() is None
+
+
+def test_journal_replays_on_top_of_snapshot(tmp_path):
+    store = StateStore(str(tmp_path), 'arb')
+    position = Position(PERP, 'perp', 'buy')
+    position.apply_fill('buy', 10, 1.0)
+    store.save({PERP: position}, {1: order(1)}, 0.2, 1, {1: 1})
+
+    store.journal('placed', 2, 5, order=order(2, msg_time=5))
+    store.journal('cancelled', 1, 6)
+    store.journal('filled', 3, 7, order=order(3, status='closed', filled_size=10.0, avg_fill_price=2.0, msg_time=7),
+                  instrument_type='perp', fill_count=2, start_basis=0.3)
+
+    state = StateStore(str(tmp_path), 'arb').load()
+    assert set(state['orders']) == {2}
+    assert state['positions'][PERP].size == 20
+    assert state['positions'][PERP].avg_entry_price == pytest.approx(1.5)
+    assert state['fill_count'] == 2
+    assert state['start_basis'] == 0.3
+    assert state['last_update_time'] == {1: 6, 2: 5, 3: 7}
+
+
+def test_fill_closing_a_position_removes_it(tmp_path):
+    store = StateStore(str(tmp_path), 'arb')
+    position = Position(SPOT, 'spot', 'buy')
+    position.apply_fill('buy', 10, 1.0)
+    store.save({SPOT: position}, {}, None, 1, {})
+    store.journal('filled', 4, 9, order=order(4, SPOT, 'sell', 'closed', 10.0, 1.1, 9),
+                  instrument_type='spot', fill_count=2, start_basis=None)
+    assert StateStore(str(tmp_path), 'arb').load()['positions'] == {}
+
+
+def test_events_already_in_snapshot_are_not_replayed(tmp_path):
+    store = StateStore(str(tmp_path), 'arb')
+    store.save({}, {}, None, 0, {})
+    store.journal('filled', 1, 2, order=order(1, status='closed', filled_size=10.0, avg_fill_price=1.0, msg_time=2),
+                  instrument_type='perp', fill_count=1, start_basis=None)
+    journal = (tmp_path / 'arb.journal.jsonl').read_text()
+    state = store.load()
+    store.save(state['positions'], state['orders'], None, 1, state['last_update_time'])
+
+    # A crash between writing the snapshot and truncating the journal leaves the old events behind
+    (tmp_path / 'arb.journal.jsonl').write_text(journal)
+    assert StateStore(str(tmp_path), 'arb').load()['positions'][PERP].size == 10
+
+
+def test_torn_final_journal_line_is_ignored(tmp_path):
+    store = StateStore(str(tmp_path), 'arb')
+    store.journal('placed', 1, 1, order=order(1))
+    with open(tmp_path / 'arb.journal.jsonl', 'a') as f:
+        f.write('{"seq": 2, "type": "can')
+    state = StateStore(str(tmp_path), 'arb').load()
+    assert set(state['orders']) == {1}
+
+
+def test_reconcile_adopts_orders_and_takes_exchange_sizes():
+    position = Position(PERP, 'perp', 'sell')
+    position.apply_fill('sell', 10, 2.0)
+    state = {'positions': {PERP: position}, 'orders': {1: order(1)}}
+    rest_orders = {2: dict(order(2).to_dict(), filledSize=0.0, avgFillPrice=None)}
+    positions, orders, differences = reconcile(state, (SPOT, PERP), 0.1, {PERP: {'netSize': -12.0, 'entryPrice': 2.1}},
+                                               rest_orders, 0.0, {SPOT: 2.0, PERP: 2.0})
+    assert set(orders) == {2}
+    assert positions[PERP].size == 12.0
+    assert positions[PERP].avg_entry_price == 2.0
+    assert len(differences) == 3
@@ -0,0 +1,53 @@
+from feedgen import prepare_client
+from ftx_ws import FtxWebsocketClient
+from models import Instrument
+from venue import FtxVenue, SimVenue
+
+MARKET = 'GST-PERP'
+
+
+def order_update(order_id, status, msg_time):
+    return {'id': order_id, 'market': MARKET, 'type': 'limit', 'side': 'buy', 'price': 1.5, 'size': 10.0,
+            'status': status, 'filledSize': 0.0, 'avgFillPrice': None, 'msg_time': msg_time}
+
+
+def sim_venue():
+    venue = SimVenue({MARKET: Instrument(MARKET, 0.0001, 0.1)})
+    venue.apply_book(MARKET, [(1.4999, 10.0)], [(1.5001, 10.0)], 0.0, partial=True)
+    return venue
+
+
+def test_ftx_orders_returns_updates_since_last_call():
+    ws = FtxWebsocketClient()
+    prepare_client(ws, [MARKET])
+    venue = FtxVenue(ws, None)
+    venue._on_order(order_update(1, 'new', 1))
+    venue._on_order(order_update(2, 'new', 2))
+    venue._on_order(order_update(1, 'closed', 3))
+    assert {i: o.status for i, o in venue.orders().items()} == {1: 'closed', 2: 'new'}
+    assert venue.orders() == {}
+    venue._on_order(order_update(2, 'closed', 4))
+    assert {i: o.msg_time for i, o in venue.orders().items()} == {2: 4}
+    assert venue._orders == {}
+
+
+def test_sim_orders_returns_updates_since_last_call():
+    venue = sim_venue()
+    order = venue.place_order(MARKET, 'buy', 14000, 10).result()
+    assert venue.orders()[order['id']].status == 'new'
+    assert venue.orders() == {}
+    venue.cancel_order(order['id'])
+    assert venue.orders()[order['id']].status == 'closed'
+
+
+def test_sim_order_listeners_may_call_back_into_the_venue():
+    venue = sim_venue()
+    seen = []
+
+    def cancel_new_orders(order):
+        seen.append(order.status)
+        if order.status == 'new':
+            venue.cancel_order(order.id)
+    venue.add_order_listener(cancel_new_orders)
+    venue.place_order(MARKET, 'buy', 14000, 10)
+    assert seen == ['new', 'closed']
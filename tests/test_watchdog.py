@@ -0,0 +1,112 @@
+import time
+from concurrent.futures import Future
+
+import pytest
+
+from models import Instrument
+from venue import SimVenue
+from watchdog import FeedWatchdog
+
+SPOT, PERP = 'GST/USD', 'GST-PERP'
+STALE_S, RESUME_AFTER_S = 1.0, 2.0
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(time, 'monotonic', lambda: now[0])
+    return now
+
+
+@pytest.fixture
+def venue(clock):
+    venue = SimVenue({SPOT: Instrument(SPOT, 0.0001, 0.1), PERP: Instrument(PERP, 0.0001, 0.1)})
+    for market in (SPOT, PERP):
+        book(venue, market)
+        venue.apply_ticker(market, 1.4999, 1.5001, 1.5, 0.0)
+    return venue
+
+
+@pytest.fixture
+def watchdog(venue):
+    watchdog = FeedWatchdog(venue, {SPOT: STALE_S, PERP: STALE_S}, RESUME_AFTER_S, 0.1)
+    venue.add_book_listener(watchdog.on_orderbook)
+    for market in (SPOT, PERP):
+        book(venue, market)
+    return watchdog
+
+
+def book(venue, market):
+    venue.apply_book(market, [(1.4999, 10.0)], [(1.5001, 10.0)], 0.0, partial=True)
+
+
+def test_stalled_feed_freezes_and_cancels_orders(clock, venue, watchdog):
+    resting = venue.place_order(PERP, 'buy', 14000, 10).result()
+    clock[0] += STALE_S + 0.5
+    alerts = watchdog.check()
+    assert sorted((a.market, a.stale, a.cancelled) for a in alerts) == [(PERP, True, True), (SPOT, True, True)]
+    assert sorted(watchdog.frozen()) == [PERP, SPOT]
+    assert venue.orders()[resting['id']].status == 'closed'
+    assert watchdog.stats['stalls'] == 2
+
+
+def test_quiet_book_on_live_connection_is_not_frozen(clock, venue, watchdog):
+    clock[0] += STALE_S + 0.5
+    venue.apply_ticker(SPOT, 1.4999, 1.5001, 1.5, 0.0)
+    assert watchdog.check() == []
+    assert watchdog.frozen() == []
+
+
+def test_resumes_after_updates_flow_for_resume_after_s(clock, venue, watchdog):
+    clock[0] += STALE_S + 0.5
+    watchdog.check()
+    for _ in range(int(RESUME_AFTER_S * 2)):
+        clock[0] += 0.5
+        book(venue, PERP)
+        assert PERP in watchdog.frozen()
+        watchdog.check()
+    clock[0] += 0.5
+    book(venue, PERP)
+    alerts = watchdog.check()
+    assert [(a.market, a.stale) for a in alerts] == [(PERP, False)]
+    assert watchdog.frozen() == [SPOT]
+    assert [a.stale for a in watchdog.pop_alerts()] == [True, True, False]
+
+
+def test_stall_during_resume_wait_starts_it_over(clock, venue, watchdog):
+    clock[0] += STALE_S + 0.5
+    watchdog.check()
+    clock[0] += 0.5
+    book(venue, PERP)
+    clock[0] += STALE_S + 0.5
+    watchdog.check()
+    clock[0] += 0.5
+    book(venue, PERP)
+    clock[0] += RESUME_AFTER_S - 0.5
+    book(venue, PERP)
+    watchdog.check()
+    assert PERP in watchdog.frozen()
+    clock[0] += 0.5
+    book(venue, PERP)
+    watchdog.check()
+    assert PERP not in watchdog.frozen()
+
+
+def test_failed_bulk_cancel_is_retried(clock, venue, watchdog, monkeypatch):
+    cancel_all_orders, calls = venue.cancel_all_orders, []
+
+    def flaky_cancel(market, lane='cancel'):
+        calls.append(market)
+        if len(calls) == 1:
+            future = Future()
+            future.set_exception(Exception('timeout'))
+            return future
+        return cancel_all_orders(market, lane)
+    monkeypatch.setattr(venue, 'cancel_all_orders', flaky_cancel)
+
+    clock[0] += STALE_S + 0.5
+    alerts = watchdog.check()
+    assert [a.cancelled for a in alerts] == [False, True]
+    assert watchdog.stats['cancel_failures'] == 1
+    watchdog.check()
+    assert calls == [SPOT, PERP, SPOT]
@@ -0,0 +1,537 @@
+import json
+import heapq
+import time
+from abc import ABC, abstractmethod
+from collections import defaultdict, deque
+from concurrent.futures import Future
+from threading import Event, Lock
+from typing import Callable, DefaultDict, Deque, Dict, Iterator, List, Optional, Tuple
+
+from ciso8601 import parse_datetime
+
+from models import Instrument, Order
+
+
+class BookEvent:
+    """
+    Sorted book of one market after an update as (price ticks, size lots) levels of its instrument,
+    best level first on both sides. Events are never mutated once delivered, listeners may keep them.
+    """
+    __slots__ = ('market', 'instrument', 'time', 'bids', 'asks')
+
+    def __init__(self, market: str, instrument: Instrument, time: float, bids: List[Tuple[int, int]], asks: List[Tuple[int, int]]) -> None:
+        self.market = market
+        self.instrument = instrument
+        self.time = time
+        self.bids = bids
+        self.asks = asks
+
+    # Return the mid price, None while either side is empty
+    def mid_price(self) -> Optional[float]:
+        if not self.bids or not self.asks:
+            return None
+        return (self.bids[0][0] + self.asks[0][0]) * self.instrument.price_increment / 2
+
+    def __repr__(self) -> str:
+        return f"BookEvent({self.market}, {self.bids[:1]}, {self.asks[:1]})"
+
+
+class TickerEvent:
+    __slots__ = ('market', 'time', 'bid', 'ask', 'last')
+
+    def __init__(self, market: str, time: float, bid: Optional[float], ask: Optional[float], last: Optional[float]) -> None:
+        self.market = market
+        self.time = time
+        self.bid = bid
+        self.ask = ask
+        self.last = last
+
+
+class TradeEvent:
+    __slots__ = ('id', 'market', 'price', 'size', 'side', 'time')
+
+    def __init__(self, id: int, market: str, price: int, size: int, side: str, time: float) -> None:
+        self.id = id
+        self.market = market
+        self.price = price                  # Ticks
+        self.size = size                    # Lots
+        self.side = side                    # Taker side
+        self.time = time
+
+
+class FillEvent:
+    __slots__ = ('id', 'order_id', 'market', 'side', 'price', 'size', 'fee', 'liquidity', 'time')
+
+    def __init__(self, id: int, order_id: int, market: str, side: str, price: float, size: float, fee: float,
+                 liquidity: str, time: float) -> None:
+        self.id = id
+        self.order_id = order_id
+        self.market = market
+        self.side = side
+        self.price = price
+        self.size = size
+        self.fee = fee
+        self.liquidity = liquidity
+        self.time = time
+
+
+class Venue(ABC):
+    """
+    Market data and order entry for the strategy in normalized events: BookEvent, TickerEvent,
+    TradeEvent, FillEvent, and models.Order for order updates, with msg_time the local receive
+    time in ns. Book and trade prices and sizes, and the prices and sizes of order calls, are
+    integer ticks and lots of the market's Instrument. Tickers, fills and order updates are in
+    exchange units. Order calls return Futures, lane is a hint for venues that prioritise requests.
+    Listeners run on the venue's feed thread.
+    """
+
+    @abstractmethod
+    def instrument(self, market: str) -> Instrument:
+        ...
+
+    @abstractmethod
+    def wait_until_ready(self, markets: List[str], timeout: float) -> bool:
+        ...
+
+    # Return seconds since the market data connection last received anything, None if it never has.
+    # A live connection keeps receiving while books are quiet, telling a quiet market from a stalled feed.
+    @abstractmethod
+    def last_received_age(self) -> Optional[float]:
+        ...
+
+    @abstractmethod
+    def book(self, market: str) -> BookEvent:
+        ...
+
+    # Return True while the book is being resynced, book() then returns the last book received
+    @abstractmethod
+    def is_book_stale(self, market: str) -> bool:
+        ...
+
+    @abstractmethod
+    def ticker(self, market: str) -> TickerEvent:
+        ...
+
+    # Return recent trades, oldest first
+    @abstractmethod
+    def trades(self, market: str) -> List[TradeEvent]:
+        ...
+
+    # Return the latest update of each order that changed since the previous call, by id. Every update is
+    # returned once, so orders() has a single consumer.
+    @abstractmethod
+    def orders(self) -> Dict[int, Order]:
+        ...
+
+    @abstractmethod
+    def fills(self) -> List[FillEvent]:
+        ...
+
+    @abstractmethod
+    def add_book_listener(self, listener: Callable[[BookEvent], None]) -> None:
+        ...
+
+    @abstractmethod
+    def add_ticker_listener(self, listener: Callable[[TickerEvent], None]) -> None:
+        ...
+
+    @abstractmethod
+    def add_order_listener(self, listener: Callable[[Order], None]) -> None:
+        ...
+
+    @abstractmethod
+    def place_order(self, market: str, side: str, price: Optional[int], size: int, type: str = 'limit',
+                    reduce_only: bool = False, lane: str = 'place') -> Future:
+        ...
+
+    @abstractmethod
+    def cancel_order(self, order_id: int) -> Future:
+        ...
+
+    # Cancel every open order in market with one request
+    @abstractmethod
+    def cancel_all_orders(self, market: str, lane: str = 'cancel') -> Future:
+        ...
+
+    @abstractmethod
+    def modify_order(self, order_id: int, price: int) -> Future:
+        ...
+
+
+class FtxVenue(Venue):
+    """
+    Venue over FtxWebsocketClient and FtxRequestScheduler. Every feed message is turned into an
+    event once, on the websocket thread, and the latest book, ticker and order events are kept,
+    so reading them is a dict lookup instead of re-sorting or copying the client's state.
+    Book and trade events are only produced for markets with an instrument set. Only open orders
+    are kept, closed ones are dropped once their final update is queued for orders().
+    """
+
+    def __init__(self, ws, rest, trade_history: int = 1000) -> None:
+        self.ws = ws
+        self.rest = rest
+        self._instruments: Dict[str, Instrument] = {}
+        self._books: Dict[str, BookEvent] = {}
+        self._tickers: Dict[str, TickerEvent] = {}
+        self._orders: Dict[int, Order] = {}                 # Open orders, for modify_order()
+        self._order_updates: Dict[int, Order] = {}          # Latest update per order since the last orders() call
+        self._orders_lock = Lock()
+        self._trades: DefaultDict[str, Deque[TradeEvent]] = defaultdict(lambda: deque([], maxlen=trade_history))
+        self._trade_subscriptions = set()
+        self._orders_subscribed = False
+        self._book_listeners: List[Callable[[BookEvent], None]] = []
+        self._ticker_listeners: List[Callable[[TickerEvent], None]] = []
+        self._order_listeners: List[Callable[[Order], None]] = []
+        ws.add_orderbook_listener(self._on_orderbook)
+        ws.add_ticker_listener(self._on_ticker)
+        ws.add_order_listener(self._on_order)
+        ws.add_trade_listener(self._on_trades)
+
+    def set_instruments(self, instruments: Dict[str, Instrument]) -> None:
+        self._instruments.update(instruments)
+
+    def instrument(self, market: str) -> Instrument:
+        return self._instruments[market]
+
+    def _book_event(self, market: str, instrument: Instrument, orderbook: Dict[str, List[Tuple[float, float]]]) -> BookEvent:
+        price_increment, size_increment = instrument.price_increment, instrument.size_increment
+        return BookEvent(market, instrument, self.ws.get_orderbook_timestamp(market),
+                         [(round(p / price_increment), round(s / size_increment)) for p, s in orderbook['bids']],
+                         [(round(p / price_increment), round(s / size_increment)) for p, s in orderbook['asks']])
+
+    def _on_orderbook(self, market: str, orderbook: Dict[str, List[Tuple[float, float]]]) -> None:
+        instrument = self._instruments.get(market)
+        if instrument is None:
+            return
+        event = self._books[market] = self._book_event(market, instrument, orderbook)
+        for listener in self._book_listeners:
+            listener(event)
+
+    @staticmethod
+    def _ticker_event(market: str, ticker: Dict) -> TickerEvent:
+        return TickerEvent(market, ticker.get('time', 0.0), ticker.get('bid'), ticker.get('ask'), ticker.get('last'))
+
+    def _on_ticker(self, market: str, ticker: Dict) -> None:
+        event = self._tickers[market] = self._ticker_event(market, ticker)
+        for listener in self._ticker_listeners:
+            listener(event)
+
+    def _on_order(self, update: Dict) -> None:
+        order = Order.from_update(update)
+        with self._orders_lock:
+            self._order_updates[order.id] = order
+        if order.status == 'closed':
+            self._orders.pop(order.id, None)
+        else:
+            self._orders[order.id] = order
+        for listener in self._order_listeners:
+            listener(order)
+
+    def _on_trades(self, market: str, trades: List[Dict]) -> None:
+        instrument = self._instruments.get(market)
+        if instrument is None:
+            return
+        self._trades[market].extend(TradeEvent(t['id'], market, instrument.ticks(t['price']), instrument.lots(t['size']), t['side'],
+                                               parse_datetime(t['time']).timestamp()) for t in trades)
+
+    def wait_until_ready(self, markets: List[str], timeout: float) -> bool:
+        self._subscribe_orders()
+        return self.ws.wait_until_ready(markets, timeout)
+
+    def last_received_age(self) -> Optional[float]:
+        return self.ws.last_received_age()
+
+    # Only the first call for a market waits for the book, later ones never block the strategy
+    def book(self, market: str) -> BookEvent:
+        event = self._books.get(market)
+        if event is None:
+            event = self._book_event(market, self._instruments[market], self.ws.get_orderbook(market))
+        return event
+
+    def is_book_stale(self, market: str) -> bool:
+        return self.ws.is_orderbook_stale(market)
+
+    def ticker(self, market: str) -> TickerEvent:
+        event = self._tickers.get(market)
+        if event is None:
+            event = self._ticker_event(market, self.ws.get_ticker(market))
+        return event
+
+    def trades(self, market: str) -> List[TradeEvent]:
+        if market not in self._trade_subscriptions:
+            self.ws.get_trades(market)
+            self._trade_subscriptions.add(market)
+        return list(self._trades[market])
+
+    def _subscribe_orders(self) -> None:
+        if not self._orders_subscribed:
+            self.ws.get_orders()
+            self._orders_subscribed = True
+
+    def orders(self) -> Dict[int, Order]:
+        self._subscribe_orders()
+        with self._orders_lock:
+            updates, self._order_updates = self._order_updates, {}
+        return updates
+
+    def fills(self) -> List[FillEvent]:
+        return [FillEvent(f['id'], f['orderId'], f['market'], f['side'], f['price'], f['size'], f['fee'], f['liquidity'], f['msg_time'])
+                for f in self.ws.get_fills()]
+
+    def add_book_listener(self, listener: Callable[[BookEvent], None]) -> None:
+        self._book_listeners.append(listener)
+
+    def add_ticker_listener(self, listener: Callable[[TickerEvent], None]) -> None:
+        self._ticker_listeners.append(listener)
+
+    def add_order_listener(self, listener: Callable[[Order], None]) -> None:
+        self._order_listeners.append(listener)
+
+    def place_order(self, market: str, side: str, price: Optional[int], size: int, type: str = 'limit',
+                    reduce_only: bool = False, lane: str = 'place') -> Future:
+        instrument = self._instruments[market]
+        return self.rest.submit(lane, 'place_order', market, side, None if price is None else instrument.price(price),
+                                instrument.size(size), type, reduce_only, False, False, None, None)
+
+    def cancel_order(self, order_id: int) -> Future:
+        return self.rest.submit('cancel', 'cancel_order', order_id)
+
+    def cancel_all_orders(self, market: str, lane: str = 'cancel') -> Future:
+        return self.rest.submit(lane, 'cancel_orders', market)
+
+    def modify_order(self, order_id: int, price: int) -> Future:
+        order = self._orders.get(order_id)
+        if order is None:
+            raise Exception(f"Order {order_id} has not been seen on this venue")
+        return self.rest.submit('modify', 'modify_order', order_id, None, self._instruments[order.market].price(price), None, None)
+
+
+def _done(result) -> Future:
+    future = Future()
+    future.set_result(result)
+    return future
+
+
+class SimVenue(Venue):
+    """
+    Local stand-in exchange for the given instruments. Market data is applied directly or fed as
+    FTX websocket frames, such as those recorded or generated by feedgen.py, and orders are matched
+    locally: a resting limit order fills completely at its price once the opposite side of the book
+    reaches it or its own side trades through it, marketable and market orders fill at the touch.
+    Modifying an order replaces it with a new id, as FTX does. Every call completes synchronously.
+    Order updates made under the lock are sent to listeners once it is released, so listeners may
+    call back into the venue.
+    """
+
+    def __init__(self, instruments: Dict[str, Instrument], depth: int = 20, maker_fee: float = 0.0002,
+                 taker_fee: float = 0.0007) -> None:
+        self._instruments = instruments
+        self._depth = depth
+        self._maker_fee = maker_fee
+        self._taker_fee = taker_fee
+        self._lock = Lock()
+        self._levels: DefaultDict[str, Tuple[Dict[int, int], Dict[int, int]]] = defaultdict(lambda: ({}, {}))
+        self._books: Dict[str, BookEvent] = {}
+        self._tickers: Dict[str, TickerEvent] = {}
+        self._trades: DefaultDict[str, Deque[TradeEvent]] = defaultdict(lambda: deque([], maxlen=1000))
+        self._ready: DefaultDict[str, Event] = defaultdict(Event)
+        self._order_updates: Dict[int, Order] = {}          # Latest update per order since the last orders() call
+        self._unsent: List[Order] = []                      # Order updates not yet sent to listeners
+        self._open: Dict[int, Tuple[Order, int]] = {}       # Resting order and its price in ticks
+        self._fills: Deque[FillEvent] = deque([], maxlen=10000)
+        self._next_id = 1
+        self._received_at: Optional[float] = None
+        self._book_listeners: List[Callable[[BookEvent], None]] = []
+        self._ticker_listeners: List[Callable[[TickerEvent], None]] = []
+        self._order_listeners: List[Callable[[Order], None]] = []
+
+    def instrument(self, market: str) -> Instrument:
+        return self._instruments[market]
+
+    # -----------------------------------------------------------------
+    # Market data
+    # -----------------------------------------------------------------
+
+    # Apply a book partial or update given as exchange (price, size) levels, size 0 removing a level
+    def apply_book(self, market: str, bids: List[Tuple[float, float]], asks: List[Tuple[float, float]],
+                   timestamp: float, partial: bool = False) -> None:
+        self._received_at = time.monotonic()
+        instrument = self._instruments[market]
+        bid_levels, ask_levels = self._levels[market]
+        if partial:
+            bid_levels.clear()
+            ask_levels.clear()
+        for levels, changes in ((bid_levels, bids), (ask_levels, asks)):
+            for price, size in changes:
+                if size:
+                    levels[instrument.ticks(price)] = instrument.lots(size)
+                else:
+                    levels.pop(instrument.ticks(price), None)
+        event = BookEvent(market, instrument, timestamp,
+                          [(p, bid_levels[p]) for p in heapq.nlargest(self._depth, bid_levels)],
+                          [(p, ask_levels[p]) for p in heapq.nsmallest(self._depth, ask_levels)])
+        self._books[market] = event
+        if market in self._tickers:
+            self._ready[market].set()
+        self._match(event)
+        self._send_order_updates()
+        for listener in self._book_listeners:
+            listener(event)
+
+    def apply_ticker(self, market: str, bid: float, ask: float, last: float, timestamp: float) -> None:
+        self._received_at = time.monotonic()
+        event = self._tickers[market] = TickerEvent(market, timestamp, bid, ask, last)
+        if market in self._books:
+            self._ready[market].set()
+        for listener in self._ticker_listeners:
+            listener(event)
+
+    def apply_trades(self, trades: List[TradeEvent]) -> None:
+        self._received_at = time.monotonic()
+        for t in trades:
+            self._trades[t.market].append(t)
+
+    # Apply orderbook, ticker and trades frames in FTX websocket format. Return the number applied.
+    def feed(self, frames: Iterator[Tuple[float, str]]) -> int:
+        applied = 0
+        for _, frame in frames:
+            message = json.loads(frame)
+            channel, data = message.get('channel'), message.get('data')
+            if channel == 'orderbook':
+                self.apply_book(message['market'], data['bids'], data['asks'], data['time'], data['action'] == 'partial')
+            elif channel == 'ticker':
+                self.apply_ticker(message['market'], data['bid'], data['ask'], data['last'], data['time'])
+            elif channel == 'trades':
+                instrument = self._instruments[message['market']]
+                self.apply_trades([TradeEvent(d['id'], message['market'], instrument.ticks(d['price']), instrument.lots(d['size']),
+                                              d['side'], parse_datetime(d['time']).timestamp()) for d in data])
+            else:
+                continue
+            applied += 1
+        return applied
+
+    def wait_until_ready(self, markets: List[str], timeout: float) -> bool:
+        deadline = time.time() + timeout
+        return all(self._ready[market].wait(max(deadline - time.time(), 0)) for market in markets)
+
+    def last_received_age(self) -> Optional[float]:
+        received_at = self._received_at
+        return None if received_at is None else time.monotonic() - received_at
+
+    def book(self, market: str) -> BookEvent:
+        return self._books.get(market) or BookEvent(market, self._instruments[market], 0.0, [], [])
+
+    def is_book_stale(self, market: str) -> bool:
+        return False
+
+    def ticker(self, market: str) -> TickerEvent:
+        return self._tickers.get(market) or TickerEvent(market, 0.0, None, None, None)
+
+    def trades(self, market: str) -> List[TradeEvent]:
+        return list(self._trades[market])
+
+    def orders(self) -> Dict[int, Order]:
+        with self._lock:
+            updates, self._order_updates = self._order_updates, {}
+        return updates
+
+    def fills(self) -> List[FillEvent]:
+        return list(self._fills)
+
+    def add_book_listener(self, listener: Callable[[BookEvent], None]) -> None:
+        self._book_listeners.append(listener)
+
+    def add_ticker_listener(self, listener: Callable[[TickerEvent], None]) -> None:
+        self._ticker_listeners.append(listener)
+
+    def add_order_listener(self, listener: Callable[[Order], None]) -> None:
+        self._order_listeners.append(listener)
+
+    # -----------------------------------------------------------------
+    # Orders
+    # -----------------------------------------------------------------
+
+    def _publish(self, order: Order, status: str, price_ticks: Optional[int] = None, filled_size: float = 0.0,
+                 avg_fill_price: Optional[float] = None) -> Order:
+        update = Order(order.id, order.market, order.side, order.type, order.price, order.size, filled_size,
+                       avg_fill_price, status, time.time_ns())
+        self._order_updates[order.id] = update
+        self._unsent.append(update)
+        if status == 'closed':
+            self._open.pop(order.id, None)
+        else:
+            self._open[order.id] = (update, price_ticks)
+        return update
+
+    def _send_order_updates(self) -> None:
+        with self._lock:
+            updates, self._unsent = self._unsent, []
+        for update in updates:
+            for listener in self._order_listeners:
+                listener(update)
+
+    def _fill(self, order: Order, price_ticks: int, liquidity: str) -> None:
+        price = self._instruments[order.market].price(price_ticks)
+        fee = (self._maker_fee if liquidity == 'maker' else self._taker_fee) * price * order.size
+        self._fills.append(FillEvent(self._next_id, order.id, order.market, order.side, price, order.size, fee, liquidity, time.time()))
+        self._next_id += 1
+        self._publish(order, 'closed', None, order.size, price)
+
+    # Return the touch price in ticks a taker order of side would fill at, None if that side of the book is empty
+    def _touch(self, market: str, side: str) -> Optional[int]:
+        book = self._books.get(market)
+        levels = (book.asks if side == 'buy' else book.bids) if book else None
+        return levels[0][0] if levels else None
+
+    def _match(self, book: BookEvent) -> None:
+        with self._lock:
+            resting = [(o, p) for o, p in self._open.values() if o.market == book.market]
+            for order, price in resting:
+                if order.side == 'buy':
+                    filled = (book.asks and book.asks[0][0] <= price) or (book.bids and book.bids[0][0] < price)
+                else:
+                    filled = (book.bids and book.bids[0][0] >= price) or (book.asks and book.asks[0][0] > price)
+                if filled:
+                    self._fill(order, price, 'maker')
+
+    def place_order(self, market: str, side: str, price: Optional[int], size: int, type: str = 'limit',
+                    reduce_only: bool = False, lane: str = 'place') -> Future:
+        instrument = self._instruments[market]
+        with self._lock:
+            order = Order(self._next_id, market, side, type, None if price is None else instrument.price(price), instrument.size(size))
+            self._next_id += 1
+            order = self._publish(order, 'new', price)
+            touch = self._touch(market, side)
+            if touch is not None and (type == 'market' or (side == 'buy' and touch <= price) or (side == 'sell' and touch >= price)):
+                self._fill(order, touch, 'taker')
+        self._send_order_updates()
+        return _done(order.to_dict())
+
+    def cancel_order(self, order_id: int) -> Future:
+        with self._lock:
+            resting = self._open.get(order_id)
+            if resting is None:
+                future = Future()
+                future.set_exception(Exception('Order already closed'))
+                return future
+            self._publish(resting[0], 'closed')
+        self._send_order_updates()
+        return _done('Order queued for cancellation')
+
+    def cancel_all_orders(self, market: str, lane: str = 'cancel') -> Future:
+        with self._lock:
+            for order, _ in [r for r in self._open.values() if r[0].market == market]:
+                self._publish(order, 'closed')
+        self._send_order_updates()
+        return _done('Orders queued for cancellation')
+
+    def modify_order(self, order_id: int, price: int) -> Future:
+        with self._lock:
+            resting = self._open.get(order_id)
+        if resting is None:
+            future = Future()
+            future.set_exception(Exception('Order already closed'))
+            return future
+        order = resting[0]
+        self.cancel_order(order_id)
+        return self.place_order(order.market, order.side, price, self._instruments[order.market].lots(order.size), order.type)
@@ -0,0 +1,143 @@
+import time
+import logging
+from threading import Event, Lock, Thread
+from typing import Dict, List, NamedTuple, Optional
+
+from venue import BookEvent
+
+
+class FeedAlert(NamedTuple):
+    market: str
+    stale: bool                             # True when the feed stalled, False when it resumed
+    age_s: float                            # Seconds since the last book update when the alert was raised
+    cancelled: bool                         # True if the bulk cancel request was accepted, only for stalls
+
+
+class FeedWatchdog:
+    """
+    Guards against trading on a feed that has silently stopped. Book update times are recorded
+    on the feed thread as they arrive, and a thread of its own checks them every check_interval_s
+    against a staleness threshold per market. Books are only sent when they change, so a book
+    past its threshold is only stale if the connection has received nothing, pongs included, for
+    as long: a quiet market on a live connection keeps its orders. When a market is stale its open
+    orders are cancelled at once with a single bulk request on the scheduler's reserved kill lane,
+    and it stays frozen until book updates have resumed for resume_after_s with the connection
+    live throughout. Markets that have never delivered a book are not watched until they do.
+
+    Detection takes at most the threshold plus check_interval_s and the cancel does not wait for
+    the strategy loop. The strategy reads frozen() to stop adding orders and pop_alerts() for display.
+    """
+
+    def __init__(self, venue, thresholds: Dict[str, float], resume_after_s: float, check_interval_s: float) -> None:
+        self._venue = venue
+        self._thresholds = thresholds
+        self._resume_after_s = resume_after_s
+        self._check_interval_s = check_interval_s
+        self._lock = Lock()
+        self._received_at: Dict[str, float] = {}
+        self._frozen: Dict[str, float] = {}             # Market: when it was frozen
+        self._fresh_since: Dict[str, float] = {}        # Frozen market: first update received after freezing
+        self._alerts: List[FeedAlert] = []
+        self._uncancelled = set()                       # Frozen markets whose bulk cancel failed
+        self.stats = {'stalls': 0, 'cancel_failures': 0, 'last_reaction_s': 0.0}
+        self._stop = Event()
+        self._thread = Thread(target=self._run, daemon=True)
+
+    def start(self) -> None:
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread.is_alive():
+            self._thread.join()
+
+    def on_orderbook(self, book: BookEvent) -> None:
+        now = time.monotonic()
+        self._received_at[book.market] = now
+        if book.market in self._frozen and book.market not in self._fresh_since:
+            self._fresh_since[book.market] = now
+
+    # Return the markets currently frozen
+    def frozen(self) -> List[str]:
+        with self._lock:
+            return list(self._frozen)
+
+    def pop_alerts(self) -> List[FeedAlert]:
+        with self._lock:
+            alerts, self._alerts = self._alerts, []
+        return alerts
+
+    # Return seconds since the last book update of market, None if none has arrived
+    def age(self, market: str) -> Optional[float]:
+        received_at = self._received_at.get(market)
+        return None if received_at is None else time.monotonic() - received_at
+
+    def _run(self) -> None:
+        while not self._stop.wait(self._check_interval_s):
+            self.check()
+
+    # Freeze markets whose feed has stalled and resume those that have resynced. Return the alerts raised.
+    def check(self) -> List[FeedAlert]:
+        now = time.monotonic()
+        silent_s = self._venue.last_received_age()
+        alerts, stalled = [], {}
+        for market, threshold in self._thresholds.items():
+            received_at = self._received_at.get(market)
+            if received_at is None:
+                continue
+            age = now - received_at
+            stale = age > threshold and (silent_s is None or silent_s > threshold)
+
+            if market not in self._frozen:
+                if stale:
+                    stalled[market] = age
+
+            # An update after the stall restarts the clock, the connection going silent since then starts the wait over
+            elif market in self._fresh_since:
+                if stale:
+                    self._fresh_since.pop(market, None)
+                elif now - self._fresh_since[market] >= self._resume_after_s:
+                    with self._lock:
+                        del self._frozen[market]
+                    del self._fresh_since[market]
+                    logging.getLogger().info(f"Feed watchdog: {market} book resynced, resuming")
+                    alerts.append(FeedAlert(market, False, age, False))
+
+        if stalled or self._uncancelled:
+            alerts += self._freeze(stalled)
+        if alerts:
+            with self._lock:
+                self._alerts.extend(alerts)
+        return alerts
+
+    # Freeze markets and cancel their orders, every bulk cancel is sent before any response is awaited.
+    # Cancels that fail are retried on the next check while the market stays frozen.
+    def _freeze(self, stalled: Dict[str, float]) -> List[FeedAlert]:
+        started = time.perf_counter()
+        with self._lock:
+            for market in stalled:
+                self._frozen[market] = time.monotonic()
+        for market in stalled:
+            self._fresh_since.pop(market, None)
+        self.stats['stalls'] += len(stalled)
+
+        markets = list(stalled) + [m for m in self._uncancelled if m not in stalled and m in self._frozen]
+        requests = [(m, self._venue.cancel_all_orders(m, lane='kill')) for m in markets]
+        self._uncancelled = set()
+        alerts = []
+        for market, request in requests:
+            try:
+                request.result()
+                cancelled = True
+            except Exception as e:
+                self.stats['cancel_failures'] += 1
+                self._uncancelled.add(market)
+                logging.getLogger().info(f"Feed watchdog: bulk cancel for {market} failed: {e}")
+                cancelled = False
+            if market in stalled:
+                alerts.append(FeedAlert(market, True, stalled[market], cancelled))
+        self.stats['last_reaction_s'] = time.perf_counter() - started
+        for alert in alerts:
+            logging.getLogger().info(f"Feed watchdog: {alert.market} book stale for {round(alert.age_s, 3)}s, orders "
+                                     f"{'cancelled' if alert.cancelled else 'not cancelled'} in {round(self.stats['last_reaction_s'] * 1000, 1)}ms")
+        return alerts